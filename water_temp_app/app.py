@@ -41,4 +41,9 @@ if use_onedrive:
 
 selection = st.sidebar.radio("Go to", list(pages.keys()))
 
+# Smaller in-memory frames (float32 temperatures, categorical metadata)
+st.sidebar.checkbox("Memory-lean mode", value=True, key="lean_mode",
+                    help="Keep formatted and flagged data in memory with compact types. "
+                         "Saved files are the same either way.")
+
 pages[selection]()
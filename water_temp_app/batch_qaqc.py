@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+batch_qaqc.py
+-------------
+Run the Format -> Flag QAQC steps on many raw logger files without the
+Streamlit UI, writing one tidy CSV per input file.
+
+Usage:
+    python batch_qaqc.py RAW_FILES... --out-dir 01_Data/02_Tidy
+    python batch_qaqc.py "01_Data/01_Raw/*.csv" --out-dir 01_Data/02_Tidy --mode "First Data Set"
+    python batch_qaqc.py "01_Data/01_Raw/*.csv" --out-dir 01_Data/02_Tidy --visits Visits.xlsx
+
+Station code, logger serial and file date are taken from the raw filename
+(Station_raw_Serial_Date.csv) unless given on the command line. Field visit
+times default to the last hour of the record, like the Flag page does.
+With --visits every field visit of the station in a CSV/Excel visits table
+(utils/visits.py) is flagged V as well.
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import pandas as pd
+
+from utils import flag_codes, format_engine, qaqc_engine, tidy_store, timestamps
+from utils.visits import load_visits, for_station
+
+
+def qaqc_raw_file(path, out_dir, skip_rows=1, timestamp_col=None, wtmp_col=None,
+                  station=None, serial=None, data_id=0, utc_offset=0.0, tz_offset=None,
+                  mode="Sequential", tidy_dir=None, visit_in=None, visit_out=None,
+                  prev_visit_in=None, prev_visit_out=None, enable_padding=True,
+                  pad_interval="15min", params=None, overwrite=False, visits=None):
+    """
+    Format and QAQC a single raw logger file and save it as a tidy CSV.
+    `visits` is a visits table (utils/visits.load_visits); the rows of this
+    file's station are flagged V.
+
+    Returns a summary dict (file, saved path, row count, flag counts, notes)
+    plus the flagged frame ('data') and report metadata ('metadata').
+    """
+    file_name = os.path.basename(path)
+    df = format_engine.read_raw_file(path, skip_rows=skip_rows)
+    df = format_engine.filter_logged_rows(df)
+
+    guessed_ts, guessed_wtmp = format_engine.guess_columns(df)
+    timestamp_col = timestamp_col or guessed_ts
+    wtmp_col = wtmp_col or guessed_wtmp
+    if timestamp_col not in df.columns or wtmp_col not in df.columns:
+        raise ValueError(f"Could not find timestamp/temperature columns in {file_name}: {list(df.columns)}")
+
+    default_station, default_serial = format_engine.parse_raw_filename(file_name)
+    station = station or default_station
+    serial = serial or default_serial
+    if not station or not serial:
+        raise ValueError(f"Station Code / Logger Serial missing for {file_name} (use --station/--serial)")
+
+    # Every file of the same logger pattern reuses the sniffed timestamp format
+    format_key = timestamps.pattern_key(file_name, timestamp_col)
+    df = format_engine.format_raw(df, timestamp_col, wtmp_col, station, serial,
+                                  utc_offset=utc_offset, data_id=data_id, tz_offset=tz_offset,
+                                  format_key=format_key)
+    df = qaqc_engine.prepare_timestamps(df, key=format_key)
+
+    default_in, default_out = qaqc_engine.default_visit_window(df)
+    visit_in = visit_in or default_in
+    visit_out = visit_out or default_out
+
+    # Historical start date (Sequential / Logger Swap), same as the Flag page
+    pad_start = None
+    tidy_dir = tidy_dir or out_dir
+    if os.path.isdir(tidy_dir):
+        tidy_files = [f for f in os.listdir(tidy_dir) if ".csv" in f]
+        latest_file = qaqc_engine.find_latest_tidy_file(tidy_files, df['station_code'].iloc[0], df['logger_serial'].iloc[0], mode)
+        if latest_file:
+            # Last rows of the CSV (or the Parquet footer) only, not the whole file
+            _, hist_end = tidy_store.time_range(os.path.join(tidy_dir, latest_file))
+            if hist_end is not None:
+                pad_start = (hist_end + pd.Timedelta(minutes=15)).strftime("%Y-%m-%d %H:%M:%S")
+                if hist_end >= df['timestamp'].max():
+                    raise ValueError(f"Already covered by historical file {latest_file} (ends {hist_end})")
+
+    flagged, notes = qaqc_engine.run_qaqc(
+        df, visit_in, visit_out,
+        prev_visit_in=prev_visit_in, prev_visit_out=prev_visit_out,
+        enable_padding=enable_padding, pad_start=pad_start,
+        pad_interval=pad_interval, params=params,
+        visits=for_station(visits, station) if visits is not None else None,
+    )
+
+    os.makedirs(out_dir, exist_ok=True)
+    save_name = qaqc_engine.tidy_filename(flagged, format_engine.raw_file_date(file_name))
+    save_path = os.path.join(out_dir, save_name)
+    if not overwrite:
+        save_path = qaqc_engine.unique_path(save_path)
+    df_to_save = qaqc_engine.to_tidy(flagged)
+    df_to_save.to_csv(save_path, index=False)
+    if tidy_store.HAS_PARQUET:
+        tidy_store.write_parquet(df_to_save, save_path)
+
+    return {
+        'file': file_name,
+        'saved': save_path,
+        'rows': len(flagged),
+        'flags': flag_codes.flag_series(flagged).value_counts().to_dict(),
+        'notes': notes,
+        'data': flagged,
+        'metadata': qaqc_engine.qaqc_metadata(flagged, visit_in, visit_out, prev_visit_in, prev_visit_out),
+    }
+
+
+def expand_inputs(patterns):
+    """Expand glob patterns / directories into a sorted list of raw files."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(os.path.join(pattern, f) for f in format_engine.list_raw_files(pattern))
+        else:
+            files.extend(glob.glob(pattern) or [pattern])
+    return sorted(dict.fromkeys(files))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch QAQC of raw water temperature logger files.")
+    parser.add_argument("inputs", nargs="+", help="Raw files, folders or glob patterns")
+    parser.add_argument("--out-dir", required=True, help="Folder to write tidy CSVs to (e.g. 01_Data/02_Tidy)")
+    parser.add_argument("--tidy-dir", default=None, help="Folder with historical tidy files (default: --out-dir)")
+    parser.add_argument("--skip-rows", type=int, default=1, help="Header rows to skip in raw files")
+    parser.add_argument("--timestamp-col", default=None, help="Raw timestamp column (default: guessed)")
+    parser.add_argument("--wtmp-col", default=None, help="Raw temperature column (default: guessed)")
+    parser.add_argument("--station", default=None, help="Station Code (default: from filename)")
+    parser.add_argument("--serial", default=None, help="Logger Serial (default: from filename)")
+    parser.add_argument("--data-id", type=int, default=0)
+    parser.add_argument("--utc-offset", type=float, default=0.0)
+    parser.add_argument("--tz-offset", type=float, default=None,
+                        help="Convert timestamps to UTC from this offset (ONLY for weather stations, e.g. -7)")
+    parser.add_argument("--mode", choices=qaqc_engine.PROCESSING_MODES, default="Sequential",
+                        help="How to handle historical data overlap")
+    parser.add_argument("--no-padding", action="store_true", help="Don't fill missing timestamps")
+    parser.add_argument("--pad-interval", default="15min")
+    parser.add_argument("--visit-in", default=None, help="Datetime In (YYYY-MM-DD HH:MM)")
+    parser.add_argument("--visit-out", default=None, help="Datetime Out (YYYY-MM-DD HH:MM)")
+    parser.add_argument("--prev-visit-in", default=None)
+    parser.add_argument("--prev-visit-out", default=None)
+    parser.add_argument("--overwrite", action="store_true", help="Overwrite existing tidy files")
+    parser.add_argument("--visits", default=None, help="CSV/Excel visits table: flag every listed field visit V")
+    parser.add_argument("--visits-utc-hours", type=float, default=0.0,
+                        help="Hours to add to the visits table times to get UTC (e.g. 7)")
+    for name, value in qaqc_engine.DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    params = {name: getattr(args, name) for name in qaqc_engine.DEFAULT_PARAMS}
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("No raw files found.")
+        return 1
+    visits = load_visits(args.visits, utc_hours=args.visits_utc_hours) if args.visits else None
+
+    failures = 0
+    for path in files:
+        try:
+            result = qaqc_raw_file(
+                path, args.out_dir, skip_rows=args.skip_rows,
+                timestamp_col=args.timestamp_col, wtmp_col=args.wtmp_col,
+                station=args.station, serial=args.serial, data_id=args.data_id,
+                utc_offset=args.utc_offset, tz_offset=args.tz_offset,
+                mode=args.mode, tidy_dir=args.tidy_dir,
+                visit_in=args.visit_in, visit_out=args.visit_out,
+                prev_visit_in=args.prev_visit_in, prev_visit_out=args.prev_visit_out,
+                enable_padding=not args.no_padding, pad_interval=args.pad_interval,
+                params=params, overwrite=args.overwrite, visits=visits,
+            )
+        except Exception as e:
+            failures += 1
+            print(f"FAILED {os.path.basename(path)}: {e}")
+            continue
+
+        flags = "; ".join(f"{k}={v}" for k, v in sorted(result['flags'].items()))
+        print(f"{result['file']}: {result['rows']} rows -> {result['saved']} ({flags})")
+        for level, message in result['notes']:
+            print(f"  [{level}] {message}")
+
+    print(f"\nProcessed {len(files) - failures}/{len(files)} files.")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+batch_stations.py
+-----------------
+Multi-station batch pipeline: Format -> Flag -> Tidy -> Report for every new
+raw file in each station's 01_Data/01_Raw, with one worker process per
+station so a download season runs on all CPU cores.
+
+Usage:
+    python batch_stations.py 02FW006 04MF001 --stations-root ".../02_Stations"
+    python batch_stations.py --all --stations-root ".../02_Stations" --workers 8
+    python batch_stations.py /path/to/02_Stations/02FW006_Some_Creek
+
+A raw file is "new" when the tidy file it would produce
+(Station_tidy_Serial_Date.csv) is not in the station's 01_Data/02_Tidy yet.
+Files within one station are processed oldest first and in sequence, so
+Sequential mode picks up the tidy file written by the previous download.
+"""
+
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import format_engine, qaqc_engine, report_engine
+from utils.visits import load_visits
+from batch_qaqc import qaqc_raw_file
+
+RAW_SUBFOLDER = os.path.join("01_Data", "01_Raw")
+TIDY_SUBFOLDER = os.path.join("01_Data", "02_Tidy")
+
+
+def resolve_station_dirs(stations, stations_root=None, all_stations=False):
+    """
+    Station folders from codes (matched as `{code}*` under stations_root, like
+    the sidebar does) or explicit paths. With all_stations, every folder in
+    stations_root.
+    """
+    dirs = []
+    if all_stations and stations_root:
+        dirs.extend(sorted(
+            os.path.join(stations_root, d) for d in os.listdir(stations_root)
+            if os.path.isdir(os.path.join(stations_root, d))
+        ))
+    for station in stations:
+        if os.path.isdir(station):
+            dirs.append(station)
+        elif stations_root:
+            matching_folders = sorted(glob.glob(os.path.join(stations_root, f"{station}*")))
+            if matching_folders:
+                dirs.append(matching_folders[0])
+            else:
+                print(f"No folder found for {station} in {stations_root}")
+        else:
+            print(f"Not a folder: {station} (use --stations-root to look up station codes)")
+    return list(dict.fromkeys(dirs))
+
+
+def _raw_sort_key(f):
+    # Oldest download first: date at the end of the filename, then name
+    return (format_engine.raw_file_date(f) or "00000000", f)
+
+
+def pending_raw_files(station_dir):
+    """Raw files in 01_Data/01_Raw that don't have a tidy file yet."""
+    raw_files = format_engine.list_raw_files(os.path.join(station_dir, RAW_SUBFOLDER))
+    tidy_dir = os.path.join(station_dir, TIDY_SUBFOLDER)
+    tidy_files = os.listdir(tidy_dir) if os.path.isdir(tidy_dir) else []
+
+    pending = []
+    for f in raw_files:
+        station, serial = format_engine.parse_raw_filename(f)
+        date_str = format_engine.raw_file_date(f)
+        if station and serial and date_str:
+            expected = f"{station}_tidy_{serial}_{date_str}"
+            if any(t.startswith(expected) and t.endswith(".csv") for t in tidy_files):
+                continue
+        pending.append(f)
+    return sorted(pending, key=_raw_sort_key)
+
+
+def process_station(station_dir, options):
+    """
+    Worker: run Format -> Flag -> Tidy -> Report on every new raw file of one
+    station. Returns (station_dir, results); each result is the qaqc summary
+    dict with the report path added, or {'file', 'error'} on failure.
+    """
+    raw_dir = os.path.join(station_dir, RAW_SUBFOLDER)
+    tidy_dir = os.path.join(station_dir, TIDY_SUBFOLDER)
+    results = []
+
+    for f in pending_raw_files(station_dir):
+        try:
+            result = qaqc_raw_file(os.path.join(raw_dir, f), tidy_dir, tidy_dir=tidy_dir, **options)
+            flagged = result.pop('data')
+            metadata = result.pop('metadata')
+
+            if 'timestamp' in flagged.columns and not flagged.empty:
+                fig = report_engine.build_timeseries_figure(
+                    flagged, f"Water Temperature Time Series - {os.path.basename(result['saved'])}")
+                html = report_engine.build_report_html(flagged, fig, metadata, notes="Generated by batch pipeline.")
+                report_name = report_engine.report_filename(flagged, format_engine.raw_file_date(f))
+                result['report'] = report_engine.write_report(html, station_dir, report_name)
+            results.append(result)
+        except Exception as e:
+            results.append({'file': f, 'error': str(e)})
+    return station_dir, results
+
+
+def run_stations(station_dirs, options, workers=None):
+    """Process stations in parallel (one worker per station). Yields (station_dir, results)."""
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(station_dirs)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_station, d, options): d for d in station_dirs}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield futures[future], [{'file': '*', 'error': str(e)}]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run Format -> Flag -> Tidy -> Report for many stations in parallel.")
+    parser.add_argument("stations", nargs="*", help="Station codes (with --stations-root) or station folders")
+    parser.add_argument("--stations-root", default=None, help="The 02_Stations folder")
+    parser.add_argument("--all", action="store_true", help="Process every station folder in --stations-root")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--skip-rows", type=int, default=1, help="Header rows to skip in raw files")
+    parser.add_argument("--mode", choices=qaqc_engine.PROCESSING_MODES, default="Sequential",
+                        help="How to handle historical data overlap")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the new raw files per station")
+    parser.add_argument("--visits", default=None, help="CSV/Excel visits table: flag every listed field visit V")
+    parser.add_argument("--visits-utc-hours", type=float, default=0.0,
+                        help="Hours to add to the visits table times to get UTC (e.g. 7)")
+    for name, value in qaqc_engine.DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    station_dirs = resolve_station_dirs(args.stations, args.stations_root, args.all)
+    if not station_dirs:
+        print("No station folders to process.")
+        return 1
+
+    if args.dry_run:
+        for d in station_dirs:
+            pending = pending_raw_files(d)
+            print(f"{os.path.basename(d)}: {len(pending)} new raw file(s)")
+            for f in pending:
+                print(f"  {f}")
+        return 0
+
+    options = {
+        'skip_rows': args.skip_rows,
+        'mode': args.mode,
+        'params': {name: getattr(args, name) for name in qaqc_engine.DEFAULT_PARAMS},
+        'visits': load_visits(args.visits, utc_hours=args.visits_utc_hours) if args.visits else None,
+    }
+
+    failures = 0
+    processed = 0
+    for station_dir, results in run_stations(station_dirs, options, args.workers):
+        print(f"\n== {os.path.basename(station_dir)}: {len(results)} new raw file(s)")
+        for result in results:
+            if 'error' in result:
+                failures += 1
+                print(f"  FAILED {result['file']}: {result['error']}")
+            else:
+                processed += 1
+                print(f"  {result['file']}: {result['rows']} rows -> {os.path.basename(result['saved'])}")
+                if result.get('report'):
+                    print(f"    report: {os.path.basename(result['report'])}")
+
+    print(f"\nProcessed {processed} file(s) across {len(station_dirs)} station(s), {failures} failed.")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -31,13 +31,159 @@ and the day is between 1-12, swap the day and month to correct it.
 Author: Auto-generated for BiocBot data pipeline
 """
 
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from pandas.tseries.api import guess_datetime_format
 import os
+import shutil
 import sys
 
 
-def fix_manta_dates(input_path, output_path=None, backup=True):
+# First date written in the DD/MM/YY format
+JULY_2024 = np.datetime64('2024-07-01', 'ns')
+
+# A corrected date has to be within one day of the last good date (30-min data)
+MAX_SWAP_DISTANCE = np.timedelta64(1, 'D')
+
+# Rows per chunk in streaming mode (fix_manta_dates(..., chunk_rows=...))
+STREAM_CHUNK_ROWS = 100_000
+
+
+def find_last_june_30(datetimes):
+    """
+    Position of the last 2024-06-30 entry (the last correctly formatted date)
+    in a datetime64 array, or None if there is none.
+    """
+    days = datetimes.astype('datetime64[D]')
+    positions = np.flatnonzero(days == np.datetime64('2024-06-30'))
+    return int(positions[-1]) if len(positions) else None
+
+
+def swap_day_month(datetimes):
+    """
+    Day/month swapped datetimes (same year and time of day) and a mask of the
+    entries where a swap is possible (day and month both 1-12).
+    """
+    months = datetimes.astype('datetime64[M]')
+    days = datetimes.astype('datetime64[D]')
+    month_index = months.astype(np.int64)  # months since 1970-01
+    year_offset = month_index // 12
+    month = month_index % 12 + 1
+    day = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    candidates = (day <= 12) & (month <= 12)
+    # Day 1-12 swapped into the month and month 1-12 into the day is always a valid date
+    new_day = np.where(candidates, month, day)
+    new_month = np.where(candidates, day, month)
+    swapped_months = (year_offset * 12 + new_month - 1).astype('datetime64[M]')
+    swapped = (swapped_months.astype('datetime64[D]') + (new_day - 1).astype('timedelta64[D]')).astype('datetime64[ns]')
+    swapped = swapped + (datetimes - days.astype('datetime64[ns]'))
+    return swapped, candidates
+
+
+def scan_swaps(datetimes, last_good):
+    """
+    Decide which entries need their day and month swapped.
+
+    Each entry is compared with the last good date before it (the previous
+    entry, as corrected). A candidate is swapped if it lies before July 2024
+    while its swap doesn't (heuristic 1), or if its swap is closer to the last
+    good date and within one day of it (heuristic 2).
+
+    The dependency on the previous *corrected* date is resolved without a
+    Python loop: per entry, the decision is computed both for an unswapped
+    and a swapped predecessor, which makes each entry one of four state
+    transitions (keep, swap, same as predecessor, opposite of predecessor).
+    Entries whose decision doesn't depend on the predecessor start a new
+    segment; inside a segment the state only flips on "opposite" entries,
+    so a cumulative count gives every entry's state.
+
+    Parameters:
+    -----------
+    datetimes : np.ndarray
+        datetime64[ns] values after the last 2024-06-30 entry (NaT allowed,
+        NaT entries are skipped)
+    last_good : np.datetime64
+        Last good date before the first entry
+
+    Returns:
+    --------
+    tuple
+        (swap mask, swapped datetimes, last good date after the last entry)
+    """
+    datetimes = np.asarray(datetimes, dtype='datetime64[ns]')
+    swap = np.zeros(len(datetimes), dtype=bool)
+    swapped, candidates = swap_day_month(datetimes)
+    valid = ~np.isnat(datetimes)
+    if not valid.any():
+        return swap, swapped, last_good
+
+    dt = datetimes[valid]
+    sw = swapped[valid]
+    cand = candidates[valid]
+    last_good = np.datetime64(last_good, 'ns')
+
+    # The predecessor's final date if it was kept (prev0) or swapped (prev1)
+    prev0 = np.concatenate([[last_good], dt[:-1]])
+    prev1 = np.concatenate([[last_good], np.where(cand, sw, dt)[:-1]])
+
+    before_july = (dt < JULY_2024) & (sw >= JULY_2024)
+
+    def needs_swap(prev):
+        diff_to_current = np.abs(dt - prev)
+        diff_to_swapped = np.abs(sw - prev)
+        return before_july | ((diff_to_swapped < diff_to_current) & (diff_to_swapped <= MAX_SWAP_DISTANCE))
+
+    d0 = cand & needs_swap(prev0)
+    d1 = cand & needs_swap(prev1)
+    # The first entry follows the known good date, i.e. an unswapped predecessor
+    d1[0] = d0[0]
+
+    fixed = ~cand | (d0 == d1)
+    flips = cand & d0 & ~d1
+
+    # Position of the fixed entry that starts each entry's segment
+    start = np.maximum.accumulate(np.where(fixed, np.arange(len(dt)), 0))
+    flip_count = np.cumsum(flips)
+    state = d0[start] ^ ((flip_count - flip_count[start]) % 2 == 1)
+
+    swap[np.flatnonzero(valid)] = state
+    final = np.where(state, sw, dt)
+    return swap, swapped, final[-1]
+
+
+def find_corrections(datetimes):
+    """
+    One pass over a whole Datetime column (datetime64 array): the position of
+    the last 2024-06-30 entry, the swap mask and the swapped values.
+    Returns None if there is no 2024-06-30 entry.
+    """
+    datetimes = np.asarray(datetimes, dtype='datetime64[ns]')
+    last_june_idx = find_last_june_30(datetimes)
+    if last_june_idx is None:
+        return None
+    swap = np.zeros(len(datetimes), dtype=bool)
+    swapped = datetimes.copy()
+    tail_swap, tail_swapped, _ = scan_swaps(datetimes[last_june_idx + 1:], datetimes[last_june_idx])
+    swap[last_june_idx + 1:] = tail_swap
+    swapped[last_june_idx + 1:] = tail_swapped
+    return {'last_june_idx': last_june_idx, 'swap': swap, 'swapped': swapped}
+
+
+def _corrections_by_month(swapped_values):
+    months = pd.Series(pd.to_datetime(swapped_values).strftime('%Y-%m'))
+    return {k: int(v) for k, v in months.value_counts().sort_index().items()}
+
+
+def _sample_corrections(datetimes, corrections, num_samples):
+    positions = np.flatnonzero(corrections['swap'])[:num_samples]
+    return pd.DataFrame({
+        'Row Index': positions,
+        'Original Date': pd.to_datetime(datetimes[positions]).strftime('%Y-%m-%d %H:%M:%S'),
+        'Corrected Date': pd.to_datetime(corrections['swapped'][positions]).strftime('%Y-%m-%d %H:%M:%S'),
+    })
+
+
+def fix_manta_dates(input_path, output_path=None, backup=True, chunk_rows=None):
     """
     Fix incorrectly parsed dates in the Manta Masterfile.
     
@@ -52,6 +198,9 @@ def fix_manta_dates(input_path, output_path=None, backup=True):
         Path for the corrected output file. If None, overwrites input file.
     backup : bool, default True
         If True, creates a backup of the original file before modifying.
+    chunk_rows : int, optional
+        Stream the file in chunks of this many rows instead of loading it
+        (see fix_manta_dates_streaming), for masterfiles larger than memory.
         
     Returns:
     --------
@@ -69,6 +218,9 @@ def fix_manta_dates(input_path, output_path=None, backup=True):
     if output_path is None:
         output_path = input_path
     
+    if chunk_rows:
+        return fix_manta_dates_streaming(input_path, output_path, backup=backup, chunk_rows=chunk_rows)
+    
     print(f"Reading CSV from: {input_path}")
     
     # Read the CSV file
@@ -84,109 +236,26 @@ def fix_manta_dates(input_path, output_path=None, backup=True):
     
     # Parse Datetime column
     df['Datetime'] = pd.to_datetime(df['Datetime'], errors='coerce')
+    datetimes = df['Datetime'].to_numpy(dtype='datetime64[ns]')
     
-    # Find the index of the last 2024-06-30 entry (last correctly formatted date)
-    last_june_mask = (df['Datetime'].dt.year == 2024) & \
-                     (df['Datetime'].dt.month == 6) & \
-                     (df['Datetime'].dt.day == 30)
-    
-    last_june_indices = df[last_june_mask].index.tolist()
-    
-    if not last_june_indices:
+    # Swap decisions for all rows after the last 2024-06-30 entry, in one pass
+    corrections = find_corrections(datetimes)
+    if corrections is None:
         print("Warning: Could not find 2024-06-30 entries. The data may already be corrected.")
         return {'rows_corrected': 0, 'corrections_by_month': {}}
+    print(f"Last 2024-06-30 entry at index: {corrections['last_june_idx']}")
     
-    # Get the last index of June 30, 2024
-    last_june_idx = max(last_june_indices)
-    print(f"Last 2024-06-30 entry at index: {last_june_idx}")
-    
-    # Track corrections
-    corrections_made = 0
-    corrections_by_month = {}  # Track corrected month counts
-    samples_before_after = []  # Store samples for debugging
-    
-    # Process all rows after June 30, 2024
-    print(f"Processing rows from index {last_june_idx + 1} to end of file...")
-    print("Looking for dates where day ≤ 12 that need swapping...")
-    
-    # Track the last CORRECTED date to maintain proper chronological order
-    # Start with the last known good date
-    last_good_dt = df.loc[last_june_idx, 'Datetime']
-    
-    for idx in range(last_june_idx + 1, len(df)):
-        dt = df.loc[idx, 'Datetime']
-        
-        if pd.isna(dt):
-            continue
-        
-        current_day = dt.day
-        current_month = dt.month
-        
-        # Only dates with day 1-12 AND month 1-12 could have the swap issue
-        if current_day <= 12 and current_month <= 12:
-            # Create the hypothetically corrected date (swap day and month)
-            try:
-                swapped_dt = dt.replace(month=current_day, day=current_month)
-            except ValueError:
-                # Invalid date after swap (e.g., trying to create Feb 30th) - skip
-                # Update last_good_dt and continue
-                last_good_dt = dt
-                continue
-            
-            # Check if swapping is needed using multiple heuristics:
-            # 1. If the current date is BEFORE July 2024 (impossible after June 30, 2024)
-            # 2. If swapping produces a date closer to last_good_dt
-            
-            july_2024 = datetime(2024, 7, 1)
-            
-            # Heuristic 1: Date goes backwards to before July 2024
-            if dt < july_2024 and swapped_dt >= july_2024:
-                # This date is clearly wrong (went back in time before the problem started)
-                needs_swap = True
-            else:
-                # Heuristic 2: Compare distances to last good date
-                # The correct date should be close to last_good_dt (within ~1 day for 30-min data)
-                diff_to_current = abs((dt - last_good_dt).total_seconds())
-                diff_to_swapped = abs((swapped_dt - last_good_dt).total_seconds())
-                
-                # Swap if: swapped is closer AND swapped is within 1 day of last good date
-                needs_swap = (diff_to_swapped < diff_to_current and 
-                              diff_to_swapped <= 86400)  # 1 day in seconds
-            
-            if needs_swap:
-                # Perform the swap
-                if len(samples_before_after) < 20:
-                    samples_before_after.append({
-                        'idx': idx,
-                        'before': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                        'after': swapped_dt.strftime('%Y-%m-%d %H:%M:%S')
-                    })
-                
-                # Track by corrected month
-                month_key = f"{swapped_dt.year}-{swapped_dt.month:02d}"
-                corrections_by_month[month_key] = corrections_by_month.get(month_key, 0) + 1
-                
-                # Update the DataFrame
-                df.loc[idx, 'Datetime'] = swapped_dt
-                corrections_made += 1
-                
-                # Update last_good_dt with the CORRECTED date
-                last_good_dt = swapped_dt
-            else:
-                # No swap needed, update last_good_dt with current date
-                last_good_dt = dt
-        else:
-            # Day > 12, no swap possible, update last_good_dt
-            last_good_dt = dt
-    
+    swap = corrections['swap']
+    corrections_made = int(swap.sum())
     print(f"\nCorrections made: {corrections_made}")
     
-    if samples_before_after:
-        print("\nSample corrections:")
-        for sample in samples_before_after[:10]:
-            print(f"  Row {sample['idx']}: {sample['before']} → {sample['after']}")
-    
     if corrections_made > 0:
+        samples = _sample_corrections(datetimes, corrections, 10)
+        print("\nSample corrections:")
+        for sample in samples.itertuples(index=False):
+            print(f"  Row {sample[0]}: {sample[1]} → {sample[2]}")
+        
+        corrections_by_month = _corrections_by_month(corrections['swapped'][swap])
         print(f"\nCorrections by month:")
         for month, count in sorted(corrections_by_month.items()):
             print(f"  {month}: {count} rows")
@@ -195,11 +264,11 @@ def fix_manta_dates(input_path, output_path=None, backup=True):
         if backup and output_path == input_path:
             backup_path = input_path.replace('.csv', '_backup.csv')
             print(f"\nCreating backup at: {backup_path}")
-            # Read original and save backup
-            df_backup = pd.read_csv(input_path, low_memory=False)
-            df_backup.to_csv(backup_path, index=False)
+            # Plain file copy, no need to parse and re-write the original
+            shutil.copyfile(input_path, backup_path)
         
         # Format the Datetime column back to string format for CSV
+        df['Datetime'] = pd.Series(np.where(swap, corrections['swapped'], datetimes), index=df.index)
         df['Datetime'] = df['Datetime'].dt.strftime('%Y-%m-%d %H:%M:%S')
         
         # Save the corrected data
@@ -218,9 +287,116 @@ def fix_manta_dates(input_path, output_path=None, backup=True):
         }
 
 
+def _parse_chunk(values, datetime_format):
+    # Same parsing as the in-memory fix: the format guessed from the first date
+    # of the whole file, anything that doesn't parse becomes NaT
+    parsed = pd.to_datetime(pd.Series(values).replace('', np.nan), format=datetime_format, errors='coerce')
+    return parsed.to_numpy(dtype='datetime64[ns]')
+
+
+def fix_manta_dates_streaming(input_path, output_path, backup=True, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    fix_manta_dates for masterfiles larger than memory: the file is read in
+    chunks of `chunk_rows` rows and the corrected rows are written as they
+    go, so memory use doesn't depend on the file size.
+    
+    Two passes over the file:
+      1. only the Datetime column, to find the last 2024-06-30 entry
+      2. all columns; scan_swaps carries the last good date from one chunk
+         into the next, and each chunk is appended to a temporary output
+         that replaces `output_path` at the end (only if anything changed)
+    
+    Other columns are copied as text, unchanged. The backup is a file copy.
+    Returns the same summary dict as fix_manta_dates.
+    """
+    
+    print(f"Streaming CSV from: {input_path} ({chunk_rows} rows per chunk)")
+    
+    # Pass 1: the Datetime column only
+    header = pd.read_csv(input_path, nrows=0).columns
+    if 'Datetime' not in header:
+        raise ValueError("CSV file must have a 'Datetime' column")
+    datetime_format = None
+    last_june_idx = None
+    last_good = None
+    total_rows = 0
+    for chunk in pd.read_csv(input_path, usecols=['Datetime'], chunksize=chunk_rows):
+        values = chunk['Datetime']
+        if datetime_format is None and values.notna().any():
+            datetime_format = guess_datetime_format(str(values.dropna().iloc[0]))
+        datetimes = _parse_chunk(values.to_numpy(dtype=object), datetime_format)
+        position = find_last_june_30(datetimes)
+        if position is not None:
+            last_june_idx = total_rows + position
+            last_good = datetimes[position]
+        total_rows += len(chunk)
+    print(f"Total rows: {total_rows}")
+    
+    if last_june_idx is None:
+        print("Warning: Could not find 2024-06-30 entries. The data may already be corrected.")
+        return {'rows_corrected': 0, 'corrections_by_month': {}}
+    print(f"Last 2024-06-30 entry at index: {last_june_idx}")
+    
+    # Pass 2: correct and write chunk by chunk
+    tmp_path = output_path + ".tmp"
+    corrections_made = 0
+    corrections_by_month = {}
+    samples = []
+    offset = 0
+    try:
+        with open(tmp_path, 'w', newline='') as out:
+            for chunk in pd.read_csv(input_path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+                datetimes = _parse_chunk(chunk['Datetime'].to_numpy(dtype=object), datetime_format)
+                first = max(last_june_idx + 1 - offset, 0)
+                if first < len(chunk):
+                    swap, swapped, last_good = scan_swaps(datetimes[first:], last_good)
+                    positions = first + np.flatnonzero(swap)
+                    if len(positions):
+                        corrected = swapped[swap]
+                        if len(samples) < 10:
+                            samples.extend(zip(offset + positions[:10 - len(samples)], datetimes[positions], corrected))
+                        for month, count in _corrections_by_month(corrected).items():
+                            corrections_by_month[month] = corrections_by_month.get(month, 0) + count
+                        corrections_made += len(positions)
+                        datetimes[positions] = corrected
+                chunk['Datetime'] = pd.Series(datetimes, index=chunk.index).dt.strftime('%Y-%m-%d %H:%M:%S').fillna('')
+                chunk.to_csv(out, index=False, header=offset == 0)
+                offset += len(chunk)
+        
+        print(f"\nCorrections made: {corrections_made}")
+        if corrections_made == 0:
+            print("No corrections needed. Data may already be fixed.")
+            return {'rows_corrected': 0, 'corrections_by_month': {}}
+        
+        print("\nSample corrections:")
+        for idx, before, after in samples:
+            print(f"  Row {idx}: {pd.Timestamp(before).strftime('%Y-%m-%d %H:%M:%S')} → {pd.Timestamp(after).strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"\nCorrections by month:")
+        for month, count in sorted(corrections_by_month.items()):
+            print(f"  {month}: {count} rows")
+        
+        if backup and output_path == input_path:
+            backup_path = input_path.replace('.csv', '_backup.csv')
+            print(f"\nCreating backup at: {backup_path}")
+            shutil.copyfile(input_path, backup_path)
+        
+        print(f"Saving corrected data to: {output_path}")
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return {
+        'rows_corrected': corrections_made,
+        'corrections_by_month': corrections_by_month
+    }
+
+
 def preview_corrections(input_path, num_samples=20):
     """
     Preview the corrections that would be made without modifying the file.
+    Uses the same pass as fix_manta_dates, so the preview lists exactly
+    the corrections the fix makes.
     
     Parameters:
     -----------
@@ -237,82 +413,19 @@ def preview_corrections(input_path, num_samples=20):
     
     print(f"Previewing corrections for: {input_path}")
     
-    df = pd.read_csv(input_path)
-    df['Datetime'] = pd.to_datetime(df['Datetime'], errors='coerce')
-    
-    # Find last June 30, 2024 entry
-    last_june_mask = (df['Datetime'].dt.year == 2024) & \
-                     (df['Datetime'].dt.month == 6) & \
-                     (df['Datetime'].dt.day == 30)
-    last_june_indices = df[last_june_mask].index.tolist()
+    df = pd.read_csv(input_path, usecols=['Datetime'])
+    datetimes = pd.to_datetime(df['Datetime'], errors='coerce').to_numpy(dtype='datetime64[ns]')
     
-    if not last_june_indices:
+    corrections = find_corrections(datetimes)
+    if corrections is None:
         print("No correction needed - could not find 2024-06-30 entries")
         return None
     
-    last_june_idx = max(last_june_indices)
-    
-    # Collect samples using the same logic as fix_manta_dates
-    samples = []
-    
-    for idx in range(last_june_idx + 1, len(df)):
-        if len(samples) >= num_samples:
-            break
-            
-        dt = df.loc[idx, 'Datetime']
-        
-        if pd.isna(dt):
-            continue
-        
-        current_day = dt.day
-        current_month = dt.month
-        
-        if current_day <= 12 and current_month <= 12:
-            try:
-                swapped_dt = dt.replace(month=current_day, day=current_month)
-            except ValueError:
-                continue
-            
-            if swapped_dt >= datetime(2024, 7, 1):
-                if idx > last_june_idx + 1:
-                    prev_dt = df.loc[idx - 1, 'Datetime']
-                    if pd.notna(prev_dt):
-                        diff_to_current = abs((dt - prev_dt).total_seconds())
-                        diff_to_swapped = abs((swapped_dt - prev_dt).total_seconds())
-                        
-                        if diff_to_swapped < diff_to_current and diff_to_swapped <= 86400:
-                            samples.append({
-                                'Row Index': idx,
-                                'Original Date': dt.strftime('%Y-%m-%d %H:%M:%S'),
-                                'Corrected Date': swapped_dt.strftime('%Y-%m-%d %H:%M:%S'),
-                            })
-    
-    if samples:
-        preview_df = pd.DataFrame(samples)
+    total_corrections = int(corrections['swap'].sum())
+    if total_corrections:
+        preview_df = _sample_corrections(datetimes, corrections, num_samples)
         print("\n=== Preview of Sample Corrections ===")
         print(preview_df.to_string(index=False))
-        
-        # Count total corrections
-        total_corrections = 0
-        for idx in range(last_june_idx + 1, len(df)):
-            dt = df.loc[idx, 'Datetime']
-            if pd.isna(dt):
-                continue
-            current_day = dt.day
-            current_month = dt.month
-            if current_day <= 12 and current_month <= 12:
-                try:
-                    swapped_dt = dt.replace(month=current_day, day=current_month)
-                except ValueError:
-                    continue
-                if swapped_dt >= datetime(2024, 7, 1) and idx > last_june_idx + 1:
-                    prev_dt = df.loc[idx - 1, 'Datetime']
-                    if pd.notna(prev_dt):
-                        diff_to_current = abs((dt - prev_dt).total_seconds())
-                        diff_to_swapped = abs((swapped_dt - prev_dt).total_seconds())
-                        if diff_to_swapped < diff_to_current and diff_to_swapped <= 86400:
-                            total_corrections += 1
-        
         print(f"\nTotal rows that would be corrected: {total_corrections}")
         return preview_df
     else:
@@ -335,57 +448,37 @@ def analyze_date_jumps(input_path, num_jumps=30):
     
     print(f"Analyzing date jumps in: {input_path}")
     
-    df = pd.read_csv(input_path)
-    df['Datetime'] = pd.to_datetime(df['Datetime'], errors='coerce')
-    
-    # Find last June 30, 2024 entry
-    last_june_mask = (df['Datetime'].dt.year == 2024) & \
-                     (df['Datetime'].dt.month == 6) & \
-                     (df['Datetime'].dt.day == 30)
-    last_june_indices = df[last_june_mask].index.tolist()
+    df = pd.read_csv(input_path, usecols=['Datetime'])
+    datetimes = pd.to_datetime(df['Datetime'], errors='coerce').to_numpy(dtype='datetime64[ns]')
     
-    if not last_june_indices:
+    last_june_idx = find_last_june_30(datetimes)
+    if last_june_idx is None:
         print("Could not find 2024-06-30 entries")
         return
     
-    last_june_idx = max(last_june_indices)
-    
     print(f"\nAnalyzing rows after index {last_june_idx}...")
     print("\nSuspicious date jumps (where time difference > 1 day):\n")
     
-    jumps_found = 0
-    prev_dt = df.loc[last_june_idx, 'Datetime']
-    
-    for idx in range(last_june_idx + 1, len(df)):
-        if jumps_found >= num_jumps:
-            break
-            
-        dt = df.loc[idx, 'Datetime']
-        
-        if pd.isna(dt) or pd.isna(prev_dt):
-            prev_dt = dt
-            continue
-        
-        diff_seconds = (dt - prev_dt).total_seconds()
-        diff_days = abs(diff_seconds) / 86400
-        
-        # Flag any jump greater than 1 day (suspicious)
-        if diff_days > 1:
-            print(f"Row {idx}: {prev_dt.strftime('%Y-%m-%d %H:%M')} → {dt.strftime('%Y-%m-%d %H:%M')} (jump: {diff_days:.1f} days)")
-            
-            # Show what swapping would produce
-            if dt.day <= 12 and dt.month <= 12:
-                try:
-                    swapped = dt.replace(month=dt.day, day=dt.month)
-                    print(f"         If swapped: {swapped.strftime('%Y-%m-%d %H:%M')}")
-                except ValueError:
-                    pass
-            
-            jumps_found += 1
+    # Jumps between consecutive rows that both have a date
+    prev_dt = datetimes[last_june_idx:-1]
+    dt = datetimes[last_june_idx + 1:]
+    both = ~np.isnat(prev_dt) & ~np.isnat(dt)
+    jump = np.zeros(len(dt), dtype=bool)
+    jump[both] = np.abs(dt[both] - prev_dt[both]) > MAX_SWAP_DISTANCE
+    positions = np.flatnonzero(jump)[:num_jumps]
+    swapped, candidates = swap_day_month(dt[positions])
+    
+    for k, pos in enumerate(positions):
+        before = pd.Timestamp(prev_dt[pos])
+        after = pd.Timestamp(dt[pos])
+        diff_days = abs((after - before).total_seconds()) / 86400
+        print(f"Row {last_june_idx + 1 + pos}: {before.strftime('%Y-%m-%d %H:%M')} → {after.strftime('%Y-%m-%d %H:%M')} (jump: {diff_days:.1f} days)")
         
-        prev_dt = dt
+        # Show what swapping would produce
+        if candidates[k]:
+            print(f"         If swapped: {pd.Timestamp(swapped[k]).strftime('%Y-%m-%d %H:%M')}")
     
-    print(f"\nFound {jumps_found} suspicious jumps (showing first {num_jumps})")
+    print(f"\nFound {len(positions)} suspicious jumps (showing first {num_jumps})")
 
 
 if __name__ == '__main__':
@@ -397,6 +490,7 @@ if __name__ == '__main__':
         python fix_manta_dates.py --analyze          # Analyze date jumps
         python fix_manta_dates.py --fix              # Apply corrections with backup
         python fix_manta_dates.py --fix --no-backup  # Apply corrections without backup
+        python fix_manta_dates.py --fix --stream     # Apply corrections chunk by chunk (huge files)
     """
     
     # Default path to the Manta Masterfile
@@ -413,7 +507,8 @@ if __name__ == '__main__':
         elif '--fix' in sys.argv:
             # Apply the fix
             backup = '--no-backup' not in sys.argv
-            result = fix_manta_dates(default_path, backup=backup)
+            chunk_rows = STREAM_CHUNK_ROWS if '--stream' in sys.argv else None
+            result = fix_manta_dates(default_path, backup=backup, chunk_rows=chunk_rows)
             print("\n=== Correction Summary ===")
             print(f"Total rows corrected: {result['rows_corrected']}")
             if result['corrections_by_month']:
@@ -421,11 +516,12 @@ if __name__ == '__main__':
                 for month, count in sorted(result['corrections_by_month'].items()):
                     print(f"  {month}: {count} rows")
         else:
-            print(f"Usage: python {sys.argv[0]} [--preview] [--analyze] [--fix] [--no-backup]")
+            print(f"Usage: python {sys.argv[0]} [--preview] [--analyze] [--fix] [--no-backup] [--stream]")
             print("  (no args)   : Preview corrections without modifying the file")
             print("  --analyze   : Analyze date jumps to diagnose the issue")
             print("  --fix       : Apply corrections to the file")
             print("  --no-backup : Don't create a backup (use with --fix)")
+            print("  --stream    : Process the file in chunks, for files larger than memory (use with --fix)")
     else:
         # Preview mode (default)
         preview_corrections(default_path)
@@ -2,8 +2,9 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-import plotly.graph_objects as go
-from utils import file_manager
+from utils import file_manager, qaqc_engine, report_engine, downsample, frame_cache, jobs, catalog, timestamps
+from utils.visits import load_visits
+from utils.ui import show_notes, time_window, render_mode, show_job, poll_job, pick_job
 import os
 import pdfplumber
 import re
@@ -45,8 +46,33 @@ def extract_times_from_pdf(pdf_file):
         
     return times
 
+def qaqc_job(df, visit_in, visit_out, run_options, cache_key):
+    """Background job (utils/jobs.py) running QAQC on the formatted frame df."""
+    def job(progress):
+        progress(f"flagging {len(df)} rows")
+        flagged, notes = qaqc_engine.run_qaqc(df, visit_in, visit_out, **run_options)
+        frame_cache.put_shared(cache_key, flagged, notes)
+        metadata = qaqc_engine.qaqc_metadata(
+            flagged, visit_in, visit_out, run_options['prev_visit_in'], run_options['prev_visit_out']
+        )
+        return {'frames': {'qaqc': flagged, 'formatted': df}, 'notes': notes, 'info': {'metadata': metadata}}
+    return job
+
+
+def load_qaqc_job(status, frames):
+    """Put a finished QAQC job's result (and its input) into the session."""
+    st.session_state['formatted_df'] = frames['formatted']
+    st.session_state['formatted_filename'] = status['label']
+    st.session_state['qaqc_df'] = frames['qaqc']
+    st.session_state['qaqc_file'] = status['label']
+    st.session_state['qaqc_metadata'] = status['info'].get('metadata', {})
+    if status['info'].get('raw_file_date'):
+        st.session_state['raw_file_date'] = status['info']['raw_file_date']
+
+
 def app():
     st.header("Flag & Compile Data")
+    project_dir = file_manager.get_project_dir()
 
     # 1. Select Formatted Data (From Session State)
     st.subheader("1. Select Formatted Data")
@@ -59,6 +85,15 @@ def app():
         selected_file = st.session_state.get('formatted_filename', "Session Data")
         st.success(f"Loaded data from previous step: {selected_file}")
     else:
+        # Results of background runs survive a browser refresh
+        picked = pick_job(project_dir, "qaqc", key="qaqc_jobs")
+        if picked is not None:
+            frames = jobs.load_frames(project_dir, picked['id'])
+            if 'qaqc' in frames and 'formatted' in frames:
+                load_qaqc_job(picked, frames)
+                st.rerun()
+            st.error("The result files of this job are missing.")
+
         # Legacy fallback
         formatted_files = file_manager.list_files(subfolder="01_Data/01_Raw_Formatted", pattern=".csv")
         if formatted_files:
@@ -71,44 +106,39 @@ def app():
             return
 
     if df is not None:
-            # Ensure timestamp is datetime
+            # Ensure timestamp is datetime (sniffed explicit format, remembered
+            # per file pattern), rounded to nearest 15 minutes to align with grid
             if 'timestamp' in df.columns:
-                # If already datetime, skip parsing
-                if pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-                    pass
-                else:
-                    # String timestamps — try explicit formats then fallback
-                    try:
-                        # Try 2-digit year first (common in raw logger files: 23-07-26)
-                        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%y-%m-%d %H:%M:%S', errors='raise')
-                    except (ValueError, TypeError):
-                        try:
-                            # Try 4-digit year (ISO: 2023-07-26)
-                            df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%d %H:%M:%S', errors='raise')
-                        except (ValueError, TypeError):
-                            # Fallback: yearfirst=True to avoid DD-MM-YY misparse
-                            df['timestamp'] = pd.to_datetime(df['timestamp'], yearfirst=True, dayfirst=False, errors='coerce')
+                format_key = timestamps.pattern_key(selected_file, 'timestamp') if selected_file != "Session Data" else None
+                df = qaqc_engine.prepare_timestamps(df, key=format_key)
             else:
                 st.error("Column 'timestamp' not found in file.")
                 return
 
-            # Round to nearest 15 minutes to align with grid
-            df['timestamp'] = df['timestamp'].dt.round('15min')
-
             st.write(f"Loaded {len(df)} rows.")
             
             # 2. User Inputs for QAQC
             st.subheader("2. QAQC Parameters")
             col1, col2 = st.columns(2)
+            defaults = qaqc_engine.DEFAULT_PARAMS
             with col1:
-                spike_threshold = st.number_input("Spike Threshold (deg C)", value=0.8, disabled=True)
-                roll_diff_threshold = st.number_input("Rolling Diff Threshold (deg C)", value=1.5, disabled=True)
-                stdev_threshold = st.number_input("Standard Deviation Threshold", value=2.0, disabled=True)
+                spike_threshold = st.number_input("Spike Threshold (deg C)", value=defaults['spike_threshold'], disabled=True)
+                roll_diff_threshold = st.number_input("Rolling Diff Threshold (deg C)", value=defaults['roll_diff_threshold'], disabled=True)
+                stdev_threshold = st.number_input("Standard Deviation Threshold", value=defaults['stdev_threshold'], disabled=True)
             with col2:
-                min_temp = st.number_input("Min Temperature", value=-20.0, disabled=True)
-                max_temp = st.number_input("Max Temperature", value=50.0, disabled=True)
-                high_temp_threshold = st.number_input("High Temp Warning", value=35.0, disabled=True)
-                diurnal_threshold = st.number_input("Diurnal Range Threshold", value=10.0, disabled=True)
+                min_temp = st.number_input("Min Temperature", value=defaults['min_temp'], disabled=True)
+                max_temp = st.number_input("Max Temperature", value=defaults['max_temp'], disabled=True)
+                high_temp_threshold = st.number_input("High Temp Warning", value=defaults['high_temp_threshold'], disabled=True)
+                diurnal_threshold = st.number_input("Diurnal Range Threshold", value=defaults['diurnal_threshold'], disabled=True)
+            qaqc_params = {
+                'spike_threshold': spike_threshold,
+                'roll_diff_threshold': roll_diff_threshold,
+                'stdev_threshold': stdev_threshold,
+                'min_temp': min_temp,
+                'max_temp': max_temp,
+                'high_temp_threshold': high_temp_threshold,
+                'diurnal_threshold': diurnal_threshold,
+            }
 
             # Calculate default Visit Times from data
             default_in_val = "2025-09-18 17:27"
@@ -116,14 +146,9 @@ def app():
             
             if not df.empty and 'timestamp' in df.columns:
                 try:
-                    last_ts = df['timestamp'].max()
                     # User requested: "take the last time recorded, then subtract an hour"
                     # "field time out would be the last data point recorded"
-                    default_out_dt = last_ts
-                    default_in_dt = last_ts - pd.Timedelta(hours=1)
-                    
-                    default_out_val = default_out_dt.strftime("%Y-%m-%d %H:%M")
-                    default_in_val = default_in_dt.strftime("%Y-%m-%d %H:%M")
+                    default_in_val, default_out_val = qaqc_engine.default_visit_window(df)
                 except Exception as e:
                     pass
 
@@ -135,7 +160,7 @@ def app():
             st.markdown("#### Processing Mode")
             processing_mode = st.radio(
                 "Select how to handle historical data overlap:", 
-                options=["First Data Set", "Sequential", "Logger Swap"],
+                options=qaqc_engine.PROCESSING_MODES,
                 index=1, # Default to Sequential
                 help="First Data Set: No historical padding. Sequential: Matches Station & Serial. Logger Swap: Matches Station only."
             )
@@ -154,33 +179,16 @@ def app():
                     current_serial = df['logger_serial'].iloc[0] if 'logger_serial' in df.columns else ""
                     
                     if current_station:
-                        # List all tidy files
-                        tidy_files = file_manager.list_files(subfolder="01_Data/02_Tidy", pattern=".csv")
+                        # Latest matching file (Logger Swap: station only, Sequential: station + serial),
+                        # an indexed lookup in the file catalog, which also holds its last timestamp
+                        # (new files only get their first/last lines read here)
+                        catalog.refresh(project_dir, folders=['tidy'], contents=False)
+                        latest = catalog.latest_tidy(project_dir, current_station, current_serial, processing_mode)
                         
-                        # Filter logic based on mode
-                        if processing_mode == "Logger Swap":
-                            # Relaxed: Match Station Code only
-                            matching_files = [f for f in tidy_files if f.startswith(f"{current_station}_tidy_")]
-                        else: # Sequential
-                            # Strict: Match Station Code AND Serial Number
-                            matching_files = [f for f in tidy_files if f.startswith(f"{current_station}_tidy_") and str(current_serial) in f]
-                        
-                        if matching_files:
-                            # Sort by date extracted from filename, then by filename
-                            def extract_date_key(f):
-                                # Extract date from end of filename (YYYYMMDD)
-                                match = re.search(r"_(\d{8})\.csv$", f)
-                                date_val = match.group(1) if match else "00000000"
-                                return (date_val, f)
-
-                            matching_files.sort(key=extract_date_key)
-                            latest_file = matching_files[-1]
-                            
-                            # Load the last few rows of the latest file to get the end date
-                            hist_df = file_manager.load_data(latest_file, subfolder="01_Data/02_Tidy")
-                            if hist_df is not None and 'timestamp' in hist_df.columns:
-                                hist_df['timestamp'] = pd.to_datetime(hist_df['timestamp'])
-                                hist_end = hist_df['timestamp'].max()
+                        if latest:
+                            latest_file = latest['name']
+                            if latest['last_ts'] is not None:
+                                hist_end = latest['last_ts']
                                 
                                 # Always set start date based on historical end + 15 mins
                                 # This handles both gaps (padding) and overlaps (trimming)
@@ -350,209 +358,84 @@ def app():
             with prev_col2:
                 prev_datetime_out = st.text_input("Prev Datetime Out (YYYY-MM-DD HH:MM)", value=prev_out_val)
 
+            # Every visit of the station from a visits table (metabase Visits export)
+            st.subheader("Field Visits Table (Optional)")
+            visits_file = st.file_uploader("open a visits table (CSV/Excel) to flag every listed visit", type=["csv", "xlsx"], key="visits_table")
+            visits_convert_utc = st.checkbox("convert it to UTC", value=True, key="convert_utc_visits_table")
+            visits_df = None
+            if visits_file:
+                try:
+                    table_station = df['station_code'].iloc[0] if 'station_code' in df.columns else None
+                    visits_df = load_visits(visits_file, station=table_station, utc_hours=7 if visits_convert_utc else 0)
+                    st.info(f"{len(visits_df)} visits for {table_station} in {visits_file.name} will be flagged 'V'.")
+                except Exception as e:
+                    st.error(f"Failed to read visits table: {e}")
+
             # 4. Run QAQC
             if st.button("Run QAQC"):
                 try:
-                    # Convert visit times
-                    dt_in = pd.to_datetime(datetime_in)
-                    dt_out = pd.to_datetime(datetime_out)
-                    
-                    # Sort by timestamp
-                    df = df.sort_values('timestamp')
-                    # Apply Padding / Trimming
-                    if enable_padding:
-                        # Determine start/end
-                        current_start = df['timestamp'].min()
-                        current_end = df['timestamp'].max()
-                        
-                        if pad_start:
-                            start_dt = pd.to_datetime(pad_start)
-                            
-                            # TRIM: If start_dt is LATER than current_start, filter out earlier data
-                            # This prevents overlap with historical data
-                            if start_dt > current_start:
-                                st.info(f"Trimming data before {start_dt} to prevent overlap.")
-                                df = df[df['timestamp'] >= start_dt].copy()
-                                current_start = start_dt # Update current start
-                            
-                            # PAD: If start_dt is EARLIER than current_start, extend range
-                            elif start_dt < current_start:
-                                st.info(f"Padding data from {start_dt} to {current_start}")
-                                current_start = start_dt
-                        
-                        # Create full range
-                        full_range = pd.date_range(start=current_start, end=current_end, freq=pad_interval)
-                        
-                        # Use merge instead of reindex to handle potential duplicates from rounding
-                        df_grid = pd.DataFrame({'timestamp': full_range})
-                        df = pd.merge(df_grid, df, on='timestamp', how='left')
-                        
-                        # Mark missing values
-                        # If wtmp is NaN and wtmp_flag is NaN (newly created row), set flag to 'M'
-                        # We need to be careful not to overwrite existing flags if they exist
-                        # But reindex creates NaNs for all columns.
-                        
-                        # Identify rows that were added (wtmp is NaN)
-                        # We assume if wtmp is NaN, it's missing. 
-                        # But original data might have NaN wtmp.
-                        # Let's use the fact that 'station_code' would also be NaN for new rows
-                        
-                        new_rows_mask = df['station_code'].isna()
-                        df.loc[new_rows_mask, 'wtmp_flag'] = 'M'
-                        
-                        # Fill metadata for new rows
-                        # We can forward fill or back fill, or just use the values from the dataframe
-                        # Since we might have trimmed, we should take values from the first valid row
-                        if not df.empty:
-                            # Find first valid row to copy metadata from
-                            valid_row = df.dropna(subset=['station_code']).iloc[0]
-                            for col in ['station_code', 'utc_offset', 'logger_serial', 'data_id']:
-                                if col in df.columns:
-                                    df[col] = df[col].fillna(valid_row[col])
-                    
-                    # QAQC Logic
-                    # 1. Flag 'N' (Not QAQC'd) - Initialize
-                    if 'wtmp_flag' not in df.columns:
-                        df['wtmp_flag'] = 'N'
-
-                    # Remove duplicate timestamps (prefer rows with valid temperature)
-                    # Event rows (button presses, host connects) have no temp and can
-                    # collide with real readings after timestamp rounding to 15-min grid.
-                    # Sort NaN-temp rows last so drop_duplicates keeps real readings.
-                    df = df.sort_values(
-                        ['timestamp', 'wtmp'],
-                        na_position='last'
-                    ).reset_index(drop=True)
-                    dup_count = df.duplicated(subset=['timestamp'], keep='first').sum()
-                    if dup_count > 0:
-                        df = df.drop_duplicates(subset=['timestamp'], keep='first').reset_index(drop=True)
-                        st.warning(f"Dropped {dup_count} duplicate timestamp(s).")
-
-                    # Fill NaNs in flag with 'N' (except 'M's we set during padding)
-                    df['wtmp_flag'] = df['wtmp_flag'].fillna('N')
-                    
-                    # Ensure wtmp is numeric (handle strings/mixed types from bad loads)
-                    if 'wtmp' in df.columns:
-                        df['wtmp'] = pd.to_numeric(df['wtmp'], errors='coerce')
-
-                    # Calculate Stats
-                    df['t_change'] = df['wtmp'].diff().abs().fillna(0)
-                    df['t_change_lead'] = df['wtmp'].diff(-1).abs().fillna(0)
-                    
-                    # Rolling means
-                    df['roll_mean_right'] = df['wtmp'].rolling(window=5, min_periods=1).mean()
-                    df['diff_right'] = (df['wtmp'] - df['roll_mean_right']).abs()
-                    
-                    # Rolling mean left (reverse, roll, reverse)
-                    df['roll_mean_left'] = df['wtmp'].iloc[::-1].rolling(window=5, min_periods=1).mean().iloc[::-1]
-                    df['diff_left'] = (df['wtmp'] - df['roll_mean_left']).abs()
-                    
-                    # Rolling SD
-                    df['stdev_right'] = df['wtmp'].rolling(window=2, min_periods=1).std()
-                    df['stdev_left'] = df['wtmp'].iloc[::-1].rolling(window=2, min_periods=1).std().iloc[::-1]
-
-                    # ============================================================
-                    # Flag Assignment
-                    #
-                    # Standalone flags (M, V, P, E) — always appear alone, never
-                    # concatenated. Priority: V > M > E > P
-                    #
-                    # Concatenatable flags (A, B, S, T) — can co-occur on the
-                    # same row, joined alphabetically with ", " separator.
-                    # Examples: "S", "B, S", "A, B, S, T"
-                    #
-                    # If a standalone flag applies, it wins over any
-                    # concatenatable flags.
-                    # ============================================================
-
-                    # --- Compute all condition masks independently ---
-
-                    # Spikes (S) — concatenatable
-                    spike_mask = (
-                        (df['t_change'] >= spike_threshold) |
-                        (df['t_change_lead'] >= spike_threshold) |
-                        (df['diff_right'] >= roll_diff_threshold) |
-                        (df['diff_left'] >= roll_diff_threshold) |
-                        (df['stdev_right'] >= stdev_threshold) |
-                        (df['stdev_left'] >= stdev_threshold)
+                    run_options = dict(
+                        prev_visit_in=prev_datetime_in,
+                        prev_visit_out=prev_datetime_out,
+                        enable_padding=enable_padding,
+                        pad_start=pad_start if enable_padding else None,
+                        pad_interval=pad_interval if enable_padding else "15min",
+                        params=qaqc_params,
+                        lean=st.session_state.get('lean_mode', True),
+                        visits=visits_df,
                     )
-
-                    # Error Range (E) — standalone
-                    error_mask = (df['wtmp'] < min_temp) | (df['wtmp'] > max_temp)
-
-                    # High Temp / Threshold (T) — concatenatable
-                    high_mask = (df['wtmp'] >= high_temp_threshold)
-
-                    # Below Ice (B) — concatenatable
-                    ice_mask = (df['wtmp'] < 0.0)
-
-                    # Diurnal Range / Air (A) — concatenatable
-                    df['date'] = df['timestamp'].dt.date
-                    daily_stats = df.groupby('date')['wtmp'].agg(['max', 'min'])
-                    daily_stats['range'] = daily_stats['max'] - daily_stats['min']
-                    bad_days = daily_stats[daily_stats['range'] > diurnal_threshold].index
-                    diurnal_mask = df['date'].isin(bad_days) if not bad_days.empty else pd.Series(False, index=df.index)
-                    if not bad_days.empty:
-                        st.warning(f"Flagged {len(bad_days)} days as 'A' (Air/Dewatered) due to diurnal range > {diurnal_threshold}C")
-                    df = df.drop(columns=['date'])
-
-                    # Missing (M) — standalone
-                    missing_mask = df['wtmp'].isna()
-
-                    # Visit (V) — standalone
-                    visit_mask = (df['timestamp'] > dt_in) & (df['timestamp'] <= dt_out)
-
-                    # Previous Visit (V) — standalone
-                    prev_visit_mask = pd.Series(False, index=df.index)
-                    if prev_datetime_in and prev_datetime_out:
-                        try:
-                            prev_dt_in = pd.to_datetime(prev_datetime_in)
-                            prev_dt_out = pd.to_datetime(prev_datetime_out)
-                            prev_visit_mask = (df['timestamp'] > prev_dt_in) & (df['timestamp'] <= prev_dt_out)
-                            st.info(f"Applied 'V' flag for previous visit: {prev_dt_in} to {prev_dt_out}")
-                        except Exception as e:
-                            st.warning(f"Could not parse Previous Visit times: {e}")
-
-                    # --- Build concatenated flags (alphabetical: A, B, S, T) ---
-                    concat_flags = pd.Series('', index=df.index)
-                    for flag_char, mask in sorted([('A', diurnal_mask), ('B', ice_mask), ('S', spike_mask), ('T', high_mask)]):
-                        concat_flags = concat_flags.where(~mask, concat_flags + flag_char + ', ')
-                    # Strip trailing ", "
-                    concat_flags = concat_flags.str.rstrip(', ')
-
-                    # --- Assign final flags ---
-                    # Default: P (pass) for rows with no issues
-                    # If concatenatable flags exist, use them; otherwise P
-                    df['wtmp_flag'] = concat_flags.where(concat_flags != '', 'P')
-
-                    # Standalone overrides (priority: E, M, V — last applied wins)
-                    df.loc[error_mask, 'wtmp_flag'] = 'E'
-                    df.loc[missing_mask, 'wtmp_flag'] = 'M'
-                    df.loc[visit_mask, 'wtmp_flag'] = 'V'
-                    # Previous visit: apply V only to non-M rows
-                    apply_prev_mask = prev_visit_mask & (df['wtmp_flag'] != 'M')
-                    df.loc[apply_prev_mask, 'wtmp_flag'] = 'V'
-
-
-                    st.success("QAQC Complete!")
-                    
-                    # Store in session state
-                    st.session_state['qaqc_df'] = df
-                    st.session_state['qaqc_file'] = selected_file
-                    
-                    # Store metadata for report
-                    st.session_state['qaqc_metadata'] = {
-                        'field_in': datetime_in,
-                        'field_out': datetime_out,
-                        'prev_field_in': prev_datetime_in,
-                        'prev_field_out': prev_datetime_out,
-                        'record_start': df['timestamp'].min().strftime("%Y-%m-%d %H:%M:%S"),
-                        'record_end': df['timestamp'].max().strftime("%Y-%m-%d %H:%M:%S")
-                    }
+                    # QAQC results are shared by all sessions: same data, visit times and parameters
+                    qaqc_key = frame_cache.content_key(
+                        'qaqc', frame_cache.frame_digest(df), datetime_in, datetime_out,
+                        tuple(sorted((k, v) for k, v in run_options.items() if k not in ('params', 'visits'))),
+                        tuple(sorted(qaqc_params.items())),
+                        frame_cache.frame_digest(visits_df) if visits_df is not None else None
+                    )
+                    cached = frame_cache.get_shared(qaqc_key)
+                    if cached is not None:
+                        df_qaqc, notes = cached
+                        st.info("Reusing the QAQC result of an identical run (same data and settings).")
+                        show_notes(notes)
+                        st.success("QAQC Complete!")
+
+                        # Store in session state
+                        st.session_state['qaqc_df'] = df_qaqc
+                        st.session_state['qaqc_file'] = selected_file
+
+                        # Store metadata for report
+                        st.session_state['qaqc_metadata'] = qaqc_engine.qaqc_metadata(
+                            df_qaqc, datetime_in, datetime_out, prev_datetime_in, prev_datetime_out
+                        )
+                    else:
+                        # Long records take a while: run in the background and poll.
+                        # Bad visit times are reported here rather than as a failed job
+                        pd.to_datetime(datetime_in)
+                        pd.to_datetime(datetime_out)
+                        st.session_state['qaqc_job'] = jobs.submit(
+                            project_dir, "qaqc", selected_file,
+                            qaqc_job(df.copy(deep=False), datetime_in, datetime_out, run_options, qaqc_key),
+                            raw_file_date=st.session_state.get('raw_file_date')
+                        )
                         
                 except Exception as e:
                     st.error(f"Error during QAQC: {e}")
 
+            # Background QAQC run of this session
+            job_status = None
+            if 'qaqc_job' in st.session_state:
+                job_status = jobs.status(project_dir, st.session_state['qaqc_job'])
+                show_job(job_status)
+                if not jobs.is_active(job_status):
+                    del st.session_state['qaqc_job']
+                if job_status is not None and job_status['state'] == "done":
+                    frames = jobs.load_frames(project_dir, job_status['id'])
+                    if 'qaqc' in frames:
+                        show_notes(job_status['notes'])
+                        st.success("QAQC Complete!")
+                        st.session_state['qaqc_df'] = frames['qaqc']
+                        st.session_state['qaqc_file'] = job_status['label']
+                        st.session_state['qaqc_metadata'] = job_status['info'].get('metadata', {})
+
             # Check if results exist in session state
             if 'qaqc_df' in st.session_state and st.session_state.get('qaqc_file') == selected_file:
                 df_qaqc = st.session_state['qaqc_df']
@@ -560,56 +443,13 @@ def app():
                 # Plot
                 st.subheader("Data Visualization")
                 
-                # Create a combined Line + Scatter plot
-                fig = go.Figure()
-                
-                # 1. Add Line (All data)
-                fig.add_trace(go.Scatter(
-                    x=df_qaqc['timestamp'], 
-                    y=df_qaqc['wtmp'], 
-                    mode='lines',
-                    name='Temperature',
-                    line=dict(color='gray', width=1)
-                ))
-                
-                colors = {
-                    'P': 'green', 'S': 'red', 'E': 'purple',
-                    'T': 'orange', 'B': 'blue', 'M': 'darkred', 'V': 'pink',
-                    'A': 'black'
-                }
-
-                # Plot single-character flags with exact match
-                for flag, color in colors.items():
-                    subset = df_qaqc[df_qaqc['wtmp_flag'] == flag]
-                    if not subset.empty:
-                        fig.add_trace(go.Scatter(
-                            x=subset['timestamp'],
-                            y=subset['wtmp'],
-                            mode='markers',
-                            name=f"Flag: {flag}",
-                            marker=dict(color=color, size=6)
-                        ))
-
-                # Plot concatenated flags (e.g. "A, S", "B, S, T")
-                concat_mask = df_qaqc['wtmp_flag'].str.contains(',', na=False)
-                if concat_mask.any():
-                    concat_subset = df_qaqc[concat_mask]
-                    # Group by unique concatenated flag combinations
-                    for combo in concat_subset['wtmp_flag'].unique():
-                        combo_data = concat_subset[concat_subset['wtmp_flag'] == combo]
-                        fig.add_trace(go.Scatter(
-                            x=combo_data['timestamp'],
-                            y=combo_data['wtmp'],
-                            mode='markers',
-                            name=f"Flag: {combo}",
-                            marker=dict(color='brown', size=6, symbol='diamond')
-                        ))
-
-                fig.update_layout(
-                    title=f"Water Temperature QAQC - {selected_file}",
-                    xaxis_title="Timestamp",
-                    yaxis_title="Water Temperature",
-                    hovermode="x unified"
+                # Combined Line + Scatter plot; the line is downsampled for long
+                # records (all flagged points are kept)
+                plot_df = time_window(df_qaqc, key="qaqc_plot_window")
+                fig = report_engine.build_timeseries_figure(
+                    plot_df, f"Water Temperature QAQC - {selected_file}",
+                    max_points=downsample.DEFAULT_MAX_POINTS, hovermode="x unified",
+                    render=render_mode(key="qaqc_render_mode")
                 )
                 
                 st.plotly_chart(fig, use_container_width=True)
@@ -618,41 +458,17 @@ def app():
                 if st.button("Save Flagged Data"):
                     # Save to 02_Tidy or similar
                     # Filename: Station_tidy_Serial_Date.csv
-                    station = df_qaqc['station_code'].iloc[0] if 'station_code' in df_qaqc.columns else "Unknown"
-                    serial = df_qaqc['logger_serial'].iloc[0] if 'logger_serial' in df_qaqc.columns else "Unknown"
-
-                    # Sanitize filename components to prevent filesystem errors (e.g. if serial is "n/a")
-                    station = str(station).replace("/", "_").replace("\\", "_")
-                    serial = str(serial).replace("/", "_").replace("\\", "_")
                     # Use the date from the original raw filename if available, otherwise fallback to today
                     raw_file_date = st.session_state.get('raw_file_date', None)
-                    date_str = raw_file_date if raw_file_date else pd.Timestamp.now().strftime("%Y%m%d")
-
-                    save_name = f"{station}_tidy_{serial}_{date_str}.csv"
+                    save_name = qaqc_engine.tidy_filename(df_qaqc, raw_file_date)
                     
                     # Store metadata in Session State ONLY
-                    st.session_state['qaqc_metadata'] = {
-                        'field_in': datetime_in,
-                        'field_out': datetime_out,
-                        'prev_field_in': prev_datetime_in,
-                        'prev_field_out': prev_datetime_out,
-                        'record_start': df_qaqc['timestamp'].min().strftime("%Y-%m-%d %H:%M:%S"),
-                        'record_end': df_qaqc['timestamp'].max().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    
-                    # Filter columns to match standard tidy format (NO EXTRA METADATA COLUMNS)
-                    cols_to_save = ['data_id', 'station_code', 'timestamp', 'utc_offset', 'logger_serial', 'wtmp', 'wtmp_flag']
+                    st.session_state['qaqc_metadata'] = qaqc_engine.qaqc_metadata(
+                        df_qaqc, datetime_in, datetime_out, prev_datetime_in, prev_datetime_out
+                    )
                     
-                    # Ensure we only try to select columns that actually exist
-                    final_cols = [c for c in cols_to_save if c in df_qaqc.columns]
-                    df_to_save = df_qaqc[final_cols].copy()
-
-                    # FIX: Replace Temperature with "NAN" where flag is 'M'
-                    if 'wtmp' in df_to_save.columns and 'wtmp_flag' in df_to_save.columns:
-                        # Ensure wtmp is object data type so it can hold the string "NAN"
-                        df_to_save['wtmp'] = df_to_save['wtmp'].astype(object)
-                        m_mask = df_to_save['wtmp_flag'] == 'M'
-                        df_to_save.loc[m_mask, 'wtmp'] = "NAN"
+                    # Standard tidy columns only, with "NAN" temperatures where flag is 'M'
+                    df_to_save = qaqc_engine.to_tidy(df_qaqc)
                     
                     saved_path = file_manager.save_data(df_to_save, save_name, subfolder="01_Data/02_Tidy")
                     st.success(f"Saved to {saved_path}")
@@ -663,3 +479,4 @@ def app():
                     # Note: No longer saving metadata JSON sidecar as per user request.
                     st.info("Metadata stored in Session Memory. Proceed to Review/Report in THIS SESSION.")
 
+            poll_job(job_status)
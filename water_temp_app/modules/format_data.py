@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
-from utils import file_manager
+from utils import file_manager, format_engine, qaqc_engine, frame_cache, timestamps
+import io
 import os
-import re
 
 def app():
     st.header("Format Raw Data")
@@ -106,39 +106,40 @@ def app():
             # Read Data
             if uploaded_file is not None:
                 file_name_for_meta = uploaded_file.name
-                # Reset file pointer
-                uploaded_file.seek(0)
-                
-                if file_name_for_meta.endswith('.xlsx'):
-                    df = pd.read_excel(uploaded_file, skiprows=skip_rows)
-                else:
-                    # Try CSV, but handle potential "renamed xlsx" issue
-                    try:
-                        df = pd.read_csv(uploaded_file, skiprows=skip_rows, low_memory=False)
-                    except (UnicodeDecodeError, pd.errors.ParserError):
-                         # Fallback for renamed files
-                         uploaded_file.seek(0)
-                         df = pd.read_excel(uploaded_file, skiprows=skip_rows)
-                         st.warning("File read as Excel despite extension. Please rename to .xlsx for clarity.")
-
+                raw_bytes = uploaded_file.getvalue()
             else:
                 # Server file
                 file_name_for_meta = os.path.basename(server_file_path)
-                if file_name_for_meta.endswith('.xlsx'):
-                    df = pd.read_excel(server_file_path, skiprows=skip_rows)
+                with open(server_file_path, 'rb') as f:
+                    raw_bytes = f.read()
+
+            # The parsed file is shared by all sessions, keyed on the file content
+            raw_digest = frame_cache.bytes_digest(raw_bytes)
+            is_xlsx = file_name_for_meta.endswith('.xlsx')
+            raw_key = frame_cache.content_key('raw', raw_digest, is_xlsx, skip_rows)
+            cached = frame_cache.get_shared(raw_key)
+            if cached is not None:
+                df, read_warning = cached
+            else:
+                read_warning = None
+                if is_xlsx:
+                    df = pd.read_excel(io.BytesIO(raw_bytes), skiprows=skip_rows)
                 else:
+                    # Try CSV, but handle potential "renamed xlsx" issue
                     try:
-                         df = pd.read_csv(server_file_path, skiprows=skip_rows, low_memory=False)
+                        # Large exports are read in chunks (Logged rows dropped per chunk)
+                        df = format_engine.read_raw_csv(io.BytesIO(raw_bytes), skip_rows=skip_rows,
+                                                        chunked=len(raw_bytes) > format_engine.CHUNK_BYTES)
                     except (UnicodeDecodeError, pd.errors.ParserError):
-                         df = pd.read_excel(server_file_path, skiprows=skip_rows)
-                         st.warning("File read as Excel despite extension. Please rename to .xlsx for clarity.")
-            
-            # Filter "Logged" rows (from R script logic)
-            # R: df[apply(df, 1, function(row) !any(row == "Logged")), , drop = FALSE]
-            # Python equivalent: remove rows where any column has value "Logged"
-            # We need to be careful with types, so convert to string first for check
-            mask = df.astype(str).apply(lambda x: x.str.contains("Logged", case=False, na=False)).any(axis=1)
-            df = df[~mask]
+                        # Fallback for renamed files
+                        df = pd.read_excel(io.BytesIO(raw_bytes), skiprows=skip_rows)
+                        read_warning = "File read as Excel despite extension. Please rename to .xlsx for clarity."
+
+                # Filter "Logged" rows (from R script logic)
+                df = format_engine.filter_logged_rows(df)
+                df = frame_cache.put_shared(raw_key, df, read_warning)
+            if read_warning:
+                st.warning(read_warning)
             
             st.subheader("Data Preview")
             st.dataframe(df.head())
@@ -164,6 +165,10 @@ def app():
                     col_map[col] = new_name
                 
                 df_selected.rename(columns=col_map, inplace=True)
+                # Timestamp format is remembered per logger file pattern (utils/timestamps.py)
+                format_key = timestamps.pattern_key(
+                    file_name_for_meta, next((c for c, n in col_map.items() if n == 'timestamp'), None)
+                )
                 
                 # Timezone Conversion Helper
                 st.subheader("Timezone Conversion")
@@ -176,7 +181,7 @@ def app():
                         try:
                             # Convert to datetime if not already
                             # Use dayfirst=False and yearfirst=True to handle YY-MM-DD logger format
-                            temp_ts = pd.to_datetime(df_selected[timestamp_col], yearfirst=True, dayfirst=False)
+                            temp_ts = timestamps.parse(df_selected[timestamp_col], key=format_key, errors='raise')
                             # Subtract offset to get UTC (e.g. if -7, we add 7 hours to get UTC? No, if local is -7, UTC is local - (-7) = local + 7)
                             # Wait, usually offset is defined as UTC + offset = Local.
                             # So Local - offset = UTC.
@@ -197,26 +202,9 @@ def app():
                 default_station = ""
                 default_serial = ""
                 # Use file_name_for_meta which is set above
+                # Assumption: filename format is Station_raw_Serial_Date...
                 try:
-                    # Assumption: filename format is Station_raw_Serial_Date...
-                    # Split by '_raw_' to separate Station and the rest
-                    parts = re.split(r'_raw_', file_name_for_meta, flags=re.IGNORECASE)
-                    
-                    if len(parts) > 1:
-                        default_station = parts[0]
-                        # The rest is Serial_Date... or CR<model>_Serial_Date...
-                        # Split by '_' to get the components
-                        rest_parts = parts[1].split('_')
-                        
-                        # Check if filename contains 'raw_CR' pattern (e.g., raw_CR1000X_3875_...)
-                        # In this case, the serial is the SECOND part (after CR model)
-                        if len(rest_parts) > 0 and rest_parts[0].upper().startswith('CR'):
-                            # CR logger detected - serial is the next part (e.g., '3875')
-                            if len(rest_parts) > 1:
-                                default_serial = rest_parts[1]
-                        else:
-                            # Standard format - serial is the first part
-                            default_serial = rest_parts[0]
+                    default_station, default_serial = format_engine.parse_raw_filename(file_name_for_meta)
                 except Exception:
                     pass
 
@@ -255,30 +243,41 @@ def app():
                         station_code = str(station_code).replace("/", "_").replace("\\", "_")
                         logger_serial = str(logger_serial).replace("/", "_").replace("\\", "_")
 
-                        # Add metadata columns
-                        df_selected['station_code'] = station_code
-                        df_selected['logger_serial'] = logger_serial
-                        df_selected['utc_offset'] = utc_offset
-                        df_selected['data_id'] = data_id
+                        # Formatted results are shared by all sessions (same file content and options)
+                        lean = st.session_state.get('lean_mode', True)
+                        formatted_key = frame_cache.content_key(
+                            'formatted', raw_digest, is_xlsx, skip_rows, tuple(col_map.items()),
+                            tz_offset if apply_tz_conversion else None,
+                            station_code, logger_serial, utc_offset, data_id, lean
+                        )
+                        cached = frame_cache.get_shared(formatted_key)
+                        if cached is not None:
+                            df_selected = cached[0]
+                        else:
+                            # Add metadata columns
+                            df_selected['station_code'] = station_code
+                            df_selected['logger_serial'] = logger_serial
+                            df_selected['utc_offset'] = utc_offset
+                            df_selected['data_id'] = data_id
                         
-                        # Apply Timezone Conversion if selected
-                        if apply_tz_conversion:
-                            try:
-                                # Ensure timestamp col is selected
-                                if 'timestamp_col' in locals():
-                                    df_selected[timestamp_col] = pd.to_datetime(df_selected[timestamp_col], yearfirst=True, dayfirst=False) - pd.Timedelta(hours=tz_offset)
-                                    st.info(f"Converted {timestamp_col} to UTC using offset {tz_offset}")
-                            except Exception as e:
-                                st.error(f"Failed to convert timezone: {e}")
-                                return # Stop saving if conversion fails
+                            # Apply Timezone Conversion if selected
+                            if apply_tz_conversion:
+                                try:
+                                    # Ensure timestamp col is selected
+                                    if 'timestamp_col' in locals():
+                                        df_selected[timestamp_col] = timestamps.parse(df_selected[timestamp_col], key=format_key, errors='raise') - pd.Timedelta(hours=tz_offset)
+                                        st.info(f"Converted {timestamp_col} to UTC using offset {tz_offset}")
+                                except Exception as e:
+                                    st.error(f"Failed to convert timezone: {e}")
+                                    return # Stop saving if conversion fails
                         
+                            if lean:
+                                df_selected = qaqc_engine.compact_frame(df_selected)
+                            df_selected = frame_cache.put_shared(formatted_key, df_selected)
+
                         # Extract the date from the raw filename (last segment before extension)
                         # e.g. 04MF001_raw_21432485_20240808.csv → 20240808
-                        raw_date_match = re.search(r'_(\d{8})(?:\.\w+)?$', file_name_for_meta)
-                        if raw_date_match:
-                            st.session_state['raw_file_date'] = raw_date_match.group(1)
-                        else:
-                            st.session_state['raw_file_date'] = None
+                        st.session_state['raw_file_date'] = format_engine.raw_file_date(file_name_for_meta)
 
                         # Save to Session State instead of file
                         st.session_state['formatted_df'] = df_selected
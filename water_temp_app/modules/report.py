@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-from utils import file_manager
+from utils import file_manager, report_engine, downsample, catalog, timestamps
+from utils.ui import time_window, render_mode
 import os
 
 def app():
@@ -11,20 +11,19 @@ def app():
     # 1. Select Tidy Data File
     st.subheader("1. Select Tidy Data")
     # Look for files in 02_Tidy
-    tidy_files = file_manager.list_files(subfolder="01_Data/02_Tidy", pattern=".csv")
-    # Filter out any lingering notes/json files just in case (though we stopped making them)
-    tidy_files = [f for f in tidy_files if not f.endswith("_notes.csv") and not f.endswith("_metadata.json")]
-    if not tidy_files:
+    # The catalog leaves out lingering notes/json files (utils/catalog.py)
+    tidy_labels = {e['name']: catalog.label(e) for e in file_manager.list_catalog("tidy")}
+    if not tidy_labels:
         st.warning("No data found in Tidy folder.")
         return
 
-    selected_file = st.selectbox("Choose File", tidy_files)
+    selected_file = st.selectbox("Choose File", list(tidy_labels), format_func=tidy_labels.get)
     
     if selected_file:
         df = file_manager.load_data(selected_file, subfolder="01_Data/02_Tidy")
         if df is not None:
             if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                df['timestamp'] = timestamps.parse(df['timestamp'], key=timestamps.TIDY_KEY)
             
             # FIX: Coerce temperature to numeric (handles "NAN" strings)
             if 'wtmp' in df.columns:
@@ -58,51 +57,11 @@ def app():
             st.markdown("### Final Time Series")
             
             # Create a combined Line + Scatter plot similar to Review/Flag modules
-            fig = go.Figure()
-            
-            # 1. Add Line (All data) - Gray background line for connectivity
-            fig.add_trace(go.Scatter(
-                x=df['timestamp'], 
-                y=df['wtmp'], 
-                mode='lines',
-                name='Temperature',
-                line=dict(color='gray', width=1),
-                hoverinfo='skip' # Skip hover on the line, focus on points
-            ))
-            
-            # 2. Add markers for each flag type
-            colors = {
-                'P': 'green', 'S': 'red', 'E': 'purple',
-                'T': 'orange', 'B': 'blue', 'M': 'darkred', 'V': 'pink',
-                'N': 'gray', 'A': 'black'
-            }
-
-            # Get all unique flags present in the data
-            present_flags = df['wtmp_flag'].unique()
-
-            for flag in present_flags:
-                subset = df[df['wtmp_flag'] == flag]
-                # For concatenated flags (e.g. "A, S"), use brown/diamond
-                if ',' in str(flag):
-                    color = 'brown'
-                    symbol = 'diamond'
-                else:
-                    color = colors.get(flag, 'black')
-                    symbol = 'circle'
-
-                fig.add_trace(go.Scatter(
-                    x=subset['timestamp'],
-                    y=subset['wtmp'],
-                    mode='markers',
-                    name=f"Flag: {flag}",
-                    marker=dict(color=color, size=6, symbol=symbol)
-                ))
-
-            fig.update_layout(
-                title=f"Water Temperature Time Series - {selected_file}",
-                xaxis_title="Timestamp",
-                yaxis_title="Water Temperature",
-                hovermode="closest"
+            # (downsampled on screen; the HTML report gets the full-resolution figure)
+            plot_df = time_window(df, key="report_plot_window")
+            fig = report_engine.build_timeseries_figure(
+                plot_df, f"Water Temperature Time Series - {selected_file}",
+                max_points=downsample.DEFAULT_MAX_POINTS, render=render_mode(key="report_render_mode")
             )
             
             st.plotly_chart(fig, use_container_width=True)
@@ -115,12 +74,6 @@ def app():
             if st.button("Generate HTML Report"):
                 try:
                     # 1. Prepare Content
-                    station = df['station_code'].iloc[0] if 'station_code' in df.columns else "Unknown"
-                    serial = df['logger_serial'].iloc[0] if 'logger_serial' in df.columns else "Unknown"
-                    utc_offset = df['utc_offset'].iloc[0] if 'utc_offset' in df.columns else "Unknown"
-                    data_id = df['data_id'].iloc[0] if 'data_id' in df.columns else "Unknown"
-                    date_str = pd.Timestamp.now().strftime("%Y-%m-%d")
-
                     # Calculate Dates
                     record_start = df['timestamp'].min().strftime("%Y-%m-%d %H:%M:%S")
                     record_end = df['timestamp'].max().strftime("%Y-%m-%d %H:%M:%S")
@@ -165,98 +118,6 @@ def app():
                             prev_field_out = st.text_input("Prev Visit Out", value=default_prev_out)
                             record_end = st.text_input("Record End", value=default_end)
                     
-                    # Metadata HTML Block
-                    
-                    # Metadata HTML Block
-                    metadata_html = f"""
-                    <h3>Metadata</h3>
-                    <p>
-                    <b>Station Code:</b> {station}<br>
-                    <b>Logger Serial Number:</b> {serial}<br>
-                    <b>UTC Offset:</b> {utc_offset}<br>
-                    <b>Data ID:</b> {data_id}<br>
-                    <b>Field time-in:</b> {field_in}<br>
-                    <b>Field time-out:</b> {field_out}<br>
-                    <b>Previous field time-in:</b> {prev_field_in}<br>
-                    <b>Previous field time-out:</b> {prev_field_out}<br>
-                    <b>Record Start Date:</b> {record_start}<br>
-                    <b>Record End Date:</b> {record_end}
-                    </p>
-                    """
-                    
-                    # Flag Summary Table
-                    if 'wtmp_flag' in df.columns:
-                        flag_counts = df['wtmp_flag'].value_counts().reset_index()
-                        flag_counts.columns = ['flag_symbol', 'flag_count']
-                        
-                        # Define flag names
-                        flag_names = {
-                            'P': 'Pass',
-                            'N': 'No QAQC',
-                            'B': 'Below ice',
-                            'S': 'Spike',
-                            'E': 'Outside sensor limits',
-                            'T': 'Above threshold 35',
-                            'M': 'Missing value',
-                            'V': 'Visit',
-                            'A': 'Air/Dewatered'
-                        }
-                        
-                        # Handle concatenated flags (e.g. "A, S" → "Air/Dewatered + Spike")
-                        def resolve_flag_name(symbol):
-                            if symbol in flag_names:
-                                return flag_names[symbol]
-                            # Split on comma/space separators, then look up each flag
-                            individual_flags = [f.strip() for f in str(symbol).replace(',', ' ').split() if f.strip()]
-                            parts = [flag_names.get(f, f) for f in individual_flags]
-                            if parts:
-                                return ' + '.join(parts)
-                            return 'Unknown'
-
-                        flag_counts['flag_name'] = flag_counts['flag_symbol'].apply(resolve_flag_name)
-                        flag_counts['flag_prop'] = (flag_counts['flag_count'] / total_records) * 100
-                        
-                        # Ensure all standard flags are present even if count is 0
-                        for sym, name in flag_names.items():
-                            if sym not in flag_counts['flag_symbol'].values:
-                                new_row = pd.DataFrame({'flag_symbol': [sym], 'flag_count': [0], 'flag_name': [name], 'flag_prop': [0.0]})
-                                flag_counts = pd.concat([flag_counts, new_row], ignore_index=True)
-                        
-                        # Sort by some logical order or just symbol
-                        # User example order: P, N, B, S, E, T, D, M, V, A
-                        order = ['P', 'N', 'B', 'S', 'E', 'T', 'M', 'V', 'A']
-                        flag_counts['order'] = flag_counts['flag_symbol'].map({k: i for i, k in enumerate(order)})
-                        flag_counts = flag_counts.sort_values('order').drop(columns=['order'])
-
-                        # Create HTML Table
-                        table_html = """
-                        <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; width: 50%;">
-                        <thead>
-                            <tr style="background-color: #f2f2f2;">
-                                <th>flag_symbol</th>
-                                <th>flag_name</th>
-                                <th>flag_count</th>
-                                <th>flag_prop</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                        """
-                        for _, row in flag_counts.iterrows():
-                            table_html += f"""
-                            <tr>
-                                <td style="text-align: center;">{row['flag_symbol']}</td>
-                                <td>{row['flag_name']}</td>
-                                <td style="text-align: right;">{row['flag_count']}</td>
-                                <td style="text-align: right;">{row['flag_prop']:.9f}</td>
-                            </tr>
-                            """
-                        table_html += "</tbody></table>"
-                    else:
-                        table_html = "<p>No flag data available.</p>"
-
-                    # Plot HTML
-                    plot_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-                    
                     # Notes with Edit Capability
                     default_notes = "No notes entered in session."
                     if 'qaqc_notes' in st.session_state:
@@ -268,41 +129,24 @@ def app():
                     with st.expander("Edit QAQC Notes", expanded=True):
                         notes_content = st.text_area("Notes", value=default_notes)
                     
-                    # Full HTML
-                    full_html = f"""
-                    <html>
-                    <head><title>QAQC Report - {station}</title></head>
-                    <body style="font-family: Arial, sans-serif; margin: 40px;">
-                        <h1>Water Temperature QAQC Report</h1>
-                        <hr>
-                        {metadata_html}
-                        <hr>
-                        <h3>Flag Summary</h3>
-                        {table_html}
-                        <hr>
-                        <h3>Time Series Plot</h3>
-                        {plot_html}
-                        <hr>
-                        <h3>QAQC Notes</h3>
-                        <p>{notes_content}</p>
-                    </body>
-                    </html>
-                    """
+                    metadata = {
+                        'field_in': field_in,
+                        'field_out': field_out,
+                        'prev_field_in': prev_field_in,
+                        'prev_field_out': prev_field_out,
+                        'record_start': record_start,
+                        'record_end': record_end,
+                    }
+                    report_fig = report_engine.build_timeseries_figure(df, f"Water Temperature Time Series - {selected_file}")
+                    full_html = report_engine.build_report_html(df, report_fig, metadata, notes_content)
                     
                     # Save
                     # Format: {station_id}_qaqcReport_{logger_serial}_{YYYYMMDD}.html
                     # Example: 01FW002_qaqcReport_21731701_20250704.html
                     # Use the date from the original raw filename if available, otherwise fallback to today
                     raw_file_date = st.session_state.get('raw_file_date', None)
-                    date_for_filename = raw_file_date if raw_file_date else pd.Timestamp.now().strftime("%Y%m%d")
-                    report_name = f"{station}_qaqcReport_{serial}_{date_for_filename}.html"
-                    
-                    project_dir = file_manager.get_project_dir()
-                    report_path = os.path.join(project_dir, "03_Reports", "02_QAQC", report_name)
-                    os.makedirs(os.path.dirname(report_path), exist_ok=True)
-                    
-                    with open(report_path, "w") as f:
-                        f.write(full_html)
+                    report_name = report_engine.report_filename(df, raw_file_date)
+                    report_path = report_engine.write_report(full_html, file_manager.get_project_dir(), report_name)
                         
                     st.success(f"Report saved to: {report_path}")
                     
@@ -1,9 +1,18 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from utils import file_manager
+import numpy as np
+from utils import file_manager, downsample, report_engine, flag_edits, flag_codes, catalog, timestamps
+from utils.ui import time_window, render_mode
 import os
 
+# Rows per page of the flag editor
+PAGE_ROWS = 500
+
+def next_flagged(flagged_pos, start):
+    """First flagged row position at or after `start`, or None."""
+    i = np.searchsorted(flagged_pos, start)
+    return int(flagged_pos[i]) if i < len(flagged_pos) else None
+
 def app():
     st.header("Review Data")
 
@@ -18,23 +27,29 @@ def app():
     if st.button("Refresh File List"):
         st.rerun()
 
-    tidy_files = file_manager.list_files(subfolder="01_Data/02_Tidy", pattern=".csv")
-    if not tidy_files:
+    # Indexed file list with each file's time range (utils/catalog.py)
+    tidy_labels = {e['name']: catalog.label(e) for e in file_manager.list_catalog("tidy")}
+    if not tidy_labels:
         st.warning("No tidy files found. Please go to 'Flag Compile' first.")
         return
 
-    selected_file = st.selectbox("Choose File", tidy_files)
+    selected_file = st.selectbox("Choose File", list(tidy_labels), format_func=tidy_labels.get)
     
     if selected_file:
         df = file_manager.load_data(selected_file, subfolder="01_Data/02_Tidy")
         if df is not None:
             if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                df['timestamp'] = timestamps.parse(df['timestamp'], key=timestamps.TIDY_KEY)
             
             # FIX: Coerce temperature to numeric (handles "NAN" strings)
             if 'wtmp' in df.columns:
                 df['wtmp'] = pd.to_numeric(df['wtmp'], errors='coerce')
             
+            # Flags come back categorical from the Parquet copy; use plain strings
+            # so any flag can be typed into the editor
+            if 'wtmp_flag' in df.columns and isinstance(df['wtmp_flag'].dtype, pd.CategoricalDtype):
+                df['wtmp_flag'] = df['wtmp_flag'].astype(object)
+
             st.write(f"Loaded {len(df)} rows.")
 
             # Check for required columns
@@ -50,35 +65,84 @@ def app():
             selected_flags = st.multiselect("Filter by Flag", all_flags, default=all_flags)
             
             filtered_df = df[df['wtmp_flag'].isin(selected_flags)]
-            
-            fig = px.scatter(filtered_df, x='timestamp', y='wtmp', color='wtmp_flag',
-                             color_discrete_map={
-                                 'P': 'green', 'S': 'red', 'E': 'purple', 
-                                 'T': 'orange', 'B': 'blue', 'M': 'darkred', 'V': 'pink',
-                                 'A': 'black'
-                             },
-                             title=f"Review: {selected_file}")
+            # Long records: P points are thinned out, every other flag is plotted
+            filtered_df = time_window(filtered_df, key="review_plot_window")
+            fig = report_engine.build_timeseries_figure(
+                filtered_df, f"Review: {selected_file}", max_points=downsample.DEFAULT_MAX_POINTS,
+                render=render_mode(key="review_render_mode"), show_line=False
+            )
             st.plotly_chart(fig, use_container_width=True)
 
             # 3. Manual Editing
             st.subheader("3. Edit Flags")
             st.info("You can edit the 'wtmp_flag' column directly below.")
             
+            # The editor shows one page of rows of the plot window at a time, so
+            # only PAGE_ROWS rows go to the browser on each rerun
+            window = st.session_state.get("review_plot_window")
+            in_window = df.index[(df['timestamp'] >= window[0]) & (df['timestamp'] <= window[1])] if window else df.index
+            window_pos = df.index.get_indexer(in_window)
+            n_pages = max((len(window_pos) - 1) // PAGE_ROWS + 1, 1)
+
+            # Start over at page 1 when the file or window changes
+            page_scope = (selected_file, str(window))
+            if st.session_state.get('review_page_scope') != page_scope:
+                st.session_state['review_page_scope'] = page_scope
+                st.session_state['review_page'] = 1
+
+            # Non-P rows in the window, for "jump to next flag"
+            flagged_pos = np.flatnonzero(df['wtmp_flag'].iloc[window_pos].ne('P').to_numpy())
+
+            col_prev, col_next, col_flag = st.columns(3)
+            if col_prev.button("◀ Previous page") and st.session_state['review_page'] > 1:
+                st.session_state['review_page'] -= 1
+            if col_next.button("Next page ▶") and st.session_state['review_page'] < n_pages:
+                st.session_state['review_page'] += 1
+            if col_flag.button("Jump to next non-P flag"):
+                next_pos = next_flagged(flagged_pos, st.session_state['review_page'] * PAGE_ROWS)
+                if next_pos is None:
+                    st.info("No more non-P flags after this page.")
+                else:
+                    st.session_state['review_page'] = next_pos // PAGE_ROWS + 1
+            page = st.number_input("Page", min_value=1, max_value=n_pages, key='review_page')
+            page_pos = window_pos[(page - 1) * PAGE_ROWS:page * PAGE_ROWS]
+            st.caption(f"Rows {(page - 1) * PAGE_ROWS + 1}–{(page - 1) * PAGE_ROWS + len(page_pos)} of "
+                       f"{len(window_pos)} in the plot window ({len(flagged_pos)} non-P).")
+
             # Use data_editor for editing
-            # We'll show a subset of columns to make it easier
+            # We'll show a subset of columns to make it easier; only the flag is editable
             cols_to_show = ['timestamp', 'wtmp', 'wtmp_flag']
             if 'station_code' in df.columns: cols_to_show.append('station_code')
+
+            # Unsaved edits of every page, {timestamp: flag}; shown again when coming back to a page
+            pending = st.session_state.setdefault('review_pending_edits', {}).setdefault(selected_file, {})
+            page_df = df[cols_to_show].iloc[page_pos].copy()
+            original_flags = page_df['wtmp_flag'].copy()
+            page_df['wtmp_flag'] = page_df['timestamp'].map(pending).fillna(original_flags)
+
+            editor_key = f"editor_{selected_file}_{page_pos[0] if len(page_pos) else 0}"
+            edited_df = st.data_editor(page_df, num_rows="fixed", key=editor_key,
+                                       disabled=[c for c in cols_to_show if c != 'wtmp_flag'])
             
-            edited_df = st.data_editor(df[cols_to_show], num_rows="fixed", key="editor")
-            
-            # Update the original dataframe with edits
-            # Note: st.data_editor returns the edited dataframe. 
-            # We need to merge it back if we only showed a subset, but here we can just use the index if it matches.
-            # Or simpler: just let them edit the whole thing but hide columns? 
-            # st.data_editor supports column configuration.
-            
-            # Let's just assume they edited 'edited_df'. We need to update 'df' with these changes.
-            df.update(edited_df)
+            # The editor's change set: {row position in the page: {column: new value}}
+            changes = st.session_state.get(editor_key, {}).get("edited_rows", {})
+            for pos, cols in changes.items():
+                if 'wtmp_flag' not in cols:
+                    continue
+                pos = int(pos)
+                ts = page_df['timestamp'].iloc[pos]
+                if edited_df['wtmp_flag'].iloc[pos] == original_flags.iloc[pos]:
+                    pending.pop(ts, None)
+                else:
+                    pending[ts] = edited_df['wtmp_flag'].iloc[pos]
+
+            # Only the edited rows are saved, as a patch (see utils/flag_edits.py)
+            edits = flag_edits.from_pending(df, pending)
+            if not edits.empty:
+                st.caption(f"{len(edits)} unsaved flag edit(s).")
+                unknown = sorted({f for f in edits['wtmp_flag'] if flag_codes.parse_flag(f) is None})
+                if unknown:
+                    st.warning(f"Not a standard flag: {', '.join(map(str, unknown))}")
 
             # 4. Notes
             st.subheader("4. QAQC Notes")
@@ -92,24 +156,28 @@ def app():
                 st.info("Notes modified. Will update Session State on save.")
 
             # 5. Save
+            file_path = os.path.join(tidy_dir, selected_file)
             if st.button("Save Reviewed Data"):
                 # Update Session State
                 st.session_state['qaqc_notes'] = notes
                 
-                # Save back to Tidy folder (OVERWRITE)
-                # Ensure no 'qaqc_notes' column is in df
-                if 'qaqc_notes' in df.columns:
-                    df = df.drop(columns=['qaqc_notes'])
-
-                # FIX: Convert 'wtmp' back to object and replace NaN with "NAN" strings before saving
-                # This ensures we don't lose the "NAN"s when overwriting
-                df_to_save = df.copy()
-                if 'wtmp' in df_to_save.columns:
-                    df_to_save['wtmp'] = df_to_save['wtmp'].astype(object)
-                    df_to_save['wtmp'] = df_to_save['wtmp'].fillna("NAN")
-
-                save_name = selected_file
-                
-                saved_path = file_manager.save_data(df_to_save, save_name, subfolder="01_Data/02_Tidy", overwrite=True)
-                st.success(f"Reviewed data saved (overwritten) to {saved_path}")
+                # Append the edited flags to the file's edits journal instead of
+                # rewriting the whole tidy file
+                written = flag_edits.append(file_path, edits)
+                pending.clear()
+                if flag_edits.count(file_path) >= flag_edits.COMPACT_AFTER:
+                    flag_edits.compact(file_path)
+                    st.success(f"Saved {written} flag edit(s) and wrote all edits into {file_path}")
+                else:
+                    st.success(f"Saved {written} flag edit(s) to {flag_edits.edits_path(file_path)}")
                 st.info("Notes saved to Session Memory.")
+
+            # Saved edits live in the journal until written into the CSV
+            # (needed before using the tidy CSV outside the app, e.g. in R)
+            saved_count = flag_edits.count(file_path)
+            if saved_count:
+                st.caption(f"{saved_count} saved edit(s) are kept in {os.path.basename(flag_edits.edits_path(file_path))}; "
+                           "the app applies them when loading the file.")
+                if st.button("Write Edits into Tidy File"):
+                    changed = flag_edits.compact(file_path)
+                    st.success(f"Wrote {changed} flag change(s) into {file_path}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the app's engines the way the pages do: from utils import x
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import os
+
+import pandas as pd
+
+from utils import catalog, qaqc_engine
+
+
+def _tidy(directory, name, serial, start):
+    pd.DataFrame({
+        'data_id': 1, 'station_code': 'X', 'timestamp': pd.date_range(start, periods=4, freq="15min"),
+        'utc_offset': -7, 'logger_serial': serial, 'wtmp': 10.0, 'wtmp_flag': 'P',
+    }).to_csv(os.path.join(directory, name), index=False, date_format='%Y-%m-%d %H:%M:%S')
+
+
+def test_latest_tidy_serial_with_underscore(tmp_path):
+    tidy_dir = tmp_path / catalog.FOLDERS['tidy']
+    tidy_dir.mkdir(parents=True)
+    _tidy(tidy_dir, "X_tidy_SN_1234_20240101.csv", "SN_1234", "2024-01-01")
+    _tidy(tidy_dir, "X_tidy_SN_1234_20240301.csv", "SN_1234", "2024-03-01")
+    _tidy(tidy_dir, "X_tidy_5678_20240401.csv", "5678", "2024-04-01")
+    names = os.listdir(tidy_dir)
+
+    catalog.refresh(str(tmp_path), folders=['tidy'], contents=False)
+
+    for mode, expected in [("Sequential", "X_tidy_SN_1234_20240301.csv"),
+                           ("Logger Swap", "X_tidy_5678_20240401.csv")]:
+        assert qaqc_engine.find_latest_tidy_file(names, 'X', 'SN_1234', mode) == expected
+        assert catalog.latest_tidy(str(tmp_path), 'X', 'SN_1234', mode)['name'] == expected
+    assert catalog.latest_tidy(str(tmp_path), 'X', 'SN', "Sequential") is None
+
+
+def test_latest_tidy_overwrite_suffix(tmp_path):
+    # Re-runs and batch_qaqc save through qaqc_engine.unique_path: ..._20240101_1.csv
+    tidy_dir = tmp_path / catalog.FOLDERS['tidy']
+    tidy_dir.mkdir(parents=True)
+    _tidy(tidy_dir, "ST_tidy_1234_20231201.csv", "1234", "2023-12-01")
+    _tidy(tidy_dir, "ST_tidy_1234_20240101.csv", "1234", "2024-01-01")
+    _tidy(tidy_dir, "ST_tidy_1234_20240101_1.csv", "1234", "2024-01-01")
+    names = os.listdir(tidy_dir)
+
+    catalog.refresh(str(tmp_path), folders=['tidy'], contents=False)
+
+    entry = catalog.latest_tidy(str(tmp_path), 'ST', '1234', "Sequential")
+    assert entry['name'] == "ST_tidy_1234_20240101_1.csv"
+    assert entry['serial'] == "1234" and entry['file_date'] == "20240101"
+    assert qaqc_engine.find_latest_tidy_file(names, 'ST', '1234', "Sequential") == entry['name']
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from utils import compile_stream, timestamps
+
+
+def _tidy(path, serial, data_id, times, wtmp):
+    pd.DataFrame({
+        'data_id': data_id, 'station_code': '01FW002', 'timestamp': times,
+        'utc_offset': -7, 'logger_serial': serial, 'wtmp': wtmp, 'wtmp_flag': 'P',
+    }).to_csv(path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+    return str(path)
+
+
+def test_record_ending_at_midnight(tmp_path):
+    # Two overlapping loggers; the last streamed batch holds only the 00:00 row
+    a = _tidy(tmp_path / "01FW002_tidy_111_20240102.csv", '111', 1,
+              pd.date_range("2024-01-01 12:00", "2024-01-01 23:00", freq="h"), 10.0)
+    b = _tidy(tmp_path / "01FW002_tidy_222_20240102.csv", '222', 2,
+              pd.date_range("2024-01-01 20:00", "2024-01-02 00:00", freq="h"), 10.2)
+    out = tmp_path / "01FW002_compiled.csv"
+
+    summary, _ = compile_stream.stream_compile([a, b], str(out), chunk_rows=4, parquet=False)
+
+    lines = out.read_text().splitlines()
+    assert summary['last'] == pd.Timestamp("2024-01-02 00:00")
+    assert lines[-1].split(',')[2] == "2024-01-02 00:00:00"
+    parsed = timestamps.parse(pd.read_csv(out)['timestamp'], key=timestamps.TIDY_KEY)
+    assert parsed.notna().all()
+    assert len(parsed) == summary['rows'] == 13
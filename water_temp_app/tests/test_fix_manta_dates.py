@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from modules import fix_manta_dates
+
+
+def _reference_swaps(datetimes):
+    """Swap mask of the sequential "last good date" loop fix_manta_dates used to run per row."""
+    series = pd.Series(pd.to_datetime(datetimes))
+    swap = np.zeros(len(series), dtype=bool)
+    june = series[(series.dt.year == 2024) & (series.dt.month == 6) & (series.dt.day == 30)].index
+    if not len(june):
+        return None
+    last_good = series[june[-1]]
+    for idx in range(june[-1] + 1, len(series)):
+        dt = series[idx]
+        if pd.isna(dt):
+            continue
+        if dt.day <= 12 and dt.month <= 12:
+            swapped = dt.replace(month=dt.day, day=dt.month)
+            if dt < datetime(2024, 7, 1) and swapped >= datetime(2024, 7, 1):
+                needs_swap = True
+            else:
+                diff_to_current = abs((dt - last_good).total_seconds())
+                diff_to_swapped = abs((swapped - last_good).total_seconds())
+                needs_swap = diff_to_swapped < diff_to_current and diff_to_swapped <= 86400
+            swap[idx] = needs_swap
+            last_good = swapped if needs_swap else dt
+        else:
+            last_good = dt
+    return swap
+
+
+def _masterfile(seed):
+    """30-min dates across July 2024 - Feb 2025 with days 1-12 day/month swapped, NaT rows and stray dates."""
+    rng = np.random.default_rng(seed)
+    true = pd.date_range("2024-06-28", "2025-02-15", freq="30min")
+    true = true[np.sort(rng.choice(len(true), len(true) // 3, replace=False))]
+    parsed = pd.Series(true)
+    bad = (true >= "2024-07-01") & (true.day <= 12)
+    parsed[bad] = [t.replace(month=t.day, day=t.month) for t in true[bad]]
+    parsed[rng.choice(len(parsed), 40, replace=False)] = pd.NaT
+    # Stray entries that were already parsed right, and pre-July 2024 dates
+    stray = rng.choice(np.flatnonzero(bad), 40, replace=False)
+    parsed[stray[:20]] = true[stray[:20]]
+    parsed[rng.choice(np.flatnonzero(true >= "2024-07-01"), 20, replace=False)] = \
+        pd.to_datetime(rng.choice(pd.date_range("2024-01-01", "2024-06-29", freq="7h"), 20))
+    return parsed.to_numpy(dtype='datetime64[ns]')
+
+
+def test_find_corrections_matches_row_loop():
+    for seed in range(5):
+        datetimes = _masterfile(seed)
+        corrections = fix_manta_dates.find_corrections(datetimes)
+        assert np.array_equal(corrections['swap'], _reference_swaps(datetimes))
+        swap = corrections['swap']
+        expected = pd.to_datetime(datetimes[swap])
+        expected = [t.replace(month=t.day, day=t.month) for t in expected]
+        assert list(pd.to_datetime(corrections['swapped'][swap])) == expected
+
+
+def test_streaming_matches_in_memory(tmp_path):
+    datetimes = _masterfile(11)
+    last_june = fix_manta_dates.find_last_june_30(datetimes)
+    df = pd.DataFrame({'Datetime': pd.Series(datetimes).dt.strftime('%Y-%m-%d %H:%M:%S'),
+                       'Temp': np.arange(len(datetimes)) / 10})
+    source = tmp_path / "Manta Masterfile.csv"
+    df.to_csv(source, index=False)
+
+    in_memory = tmp_path / "fixed.csv"
+    summary = fix_manta_dates.fix_manta_dates(str(source), str(in_memory), backup=False)
+    assert summary['rows_corrected'] == _reference_swaps(datetimes).sum()
+    expected = pd.read_csv(in_memory, dtype=str, keep_default_na=False)['Datetime']
+
+    # A chunk boundary right after the last 2024-06-30 row, and odd chunk sizes
+    for chunk_rows in (last_june + 1, 7, 997):
+        streamed = tmp_path / f"streamed_{chunk_rows}.csv"
+        assert fix_manta_dates.fix_manta_dates(str(source), str(streamed), backup=False,
+                                               chunk_rows=chunk_rows) == summary
+        assert pd.read_csv(streamed, dtype=str, keep_default_na=False)['Datetime'].equals(expected)
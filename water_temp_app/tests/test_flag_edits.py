@@ -0,0 +1,26 @@
+import pandas as pd
+
+from utils import flag_edits
+
+
+def test_apply_skips_unparseable_timestamps(tmp_path):
+    csv_path = str(tmp_path / "X_tidy_1_20240101.csv")
+    flag_edits.append(csv_path, pd.DataFrame({'timestamp': [pd.Timestamp("2024-01-01 00:15")], 'wtmp_flag': ["S"]}))
+    df = pd.DataFrame({'timestamp': ["2024-01-01 00:00:00", "2024-01-01 00:15:00", "not a time"],
+                       'wtmp_flag': ["P", "P", "P"]})
+
+    flag_edits.apply(df, csv_path)
+
+    assert list(df['wtmp_flag']) == ["P", "S", "P"]
+
+
+def test_from_pending_with_repeated_timestamp():
+    df = pd.DataFrame({'timestamp': pd.to_datetime(["2024-01-01 00:00", "2024-01-01 00:15", "2024-01-01 00:15"]),
+                       'wtmp_flag': ["P", "P", "S"]})
+
+    assert flag_edits.from_pending(df, {}).empty
+
+    edits = flag_edits.from_pending(df, {pd.Timestamp("2024-01-01 00:00"): "V",
+                                         pd.Timestamp("2024-01-01 00:15"): "S"})
+    assert list(edits['wtmp_flag']) == ["V"]
+    assert list(edits['previous_flag']) == ["P"]
@@ -0,0 +1,32 @@
+import time
+
+import pandas as pd
+
+from utils import jobs
+
+
+def _wait(project_dir, job_id):
+    for _ in range(200):
+        s = jobs.status(project_dir, job_id)
+        if not jobs.is_active(s):
+            return s
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def test_result_frames_keep_dtypes(tmp_path):
+    df = pd.DataFrame({
+        'timestamp': pd.date_range("2024-01-01", periods=3, freq="15min"),
+        'wtmp': [10.0, None, 10.2],
+        'wtmp_flag': pd.Categorical(['P', 'S', 'P']),
+        'data_id': [174.0, "174.175", None],
+    })
+    job_id = jobs.submit(str(tmp_path), "qaqc", "test", lambda progress: {'frames': {'qaqc': df}})
+    assert _wait(str(tmp_path), job_id)['state'] == "done"
+
+    loaded = jobs.load_frames(str(tmp_path), job_id)['qaqc']
+    assert pd.api.types.is_datetime64_any_dtype(loaded['timestamp'])
+    assert isinstance(loaded['wtmp_flag'].dtype, pd.CategoricalDtype)
+    assert loaded['timestamp'].equals(df['timestamp'])
+    assert list(loaded['data_id'][:2]) == ["174.0", "174.175"] and pd.isna(loaded['data_id'][2])
+    assert not list(tmp_path.rglob("*.pkl"))
@@ -0,0 +1,272 @@
+"""
+catalog.py
+----------
+SQLite index of a project's raw, tidy and compiled files.
+
+Finding the historical file for the Flag page used to mean listing
+01_Data/02_Tidy, matching names by prefix/substring, sorting by the date in
+the name and loading the whole latest file just for its last timestamp.
+The catalog (`01_Data/catalog.sqlite`) keeps one row per file:
+
+  folder, name, station, serial, data_id, file_date, rows,
+  first_ts, last_ts, flag_counts (JSON), size, mtime_ns, edits
+
+refresh() stats the folders and only reads files that are new or whose size,
+mtime or Review edits journal (utils/flag_edits.py) changed since they were
+indexed; rows of deleted files are dropped. refresh(contents=False) only
+reads the time range of those files, from their first and last lines.
+Lookups are then indexed queries. Tidy and compiled files are read once to
+fill in their contents; raw files are only described by their name (station,
+serial, date), since parsing the logger exports is format-specific.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+
+from utils import tidy_store, flag_edits, timestamps
+
+CATALOG_NAME = os.path.join("01_Data", "catalog.sqlite")
+
+FOLDERS = {
+    'raw': os.path.join("01_Data", "01_Raw"),
+    'tidy': os.path.join("01_Data", "02_Tidy"),
+    'compiled': os.path.join("01_Data", "03_Compiled"),
+}
+
+# Name part between station and serial/date, per folder
+NAME_TAGS = {'raw': "_raw_", 'tidy': "_tidy_", 'compiled': "_compiled_"}
+
+RAW_EXTENSIONS = (".csv", ".txt", ".xlsx")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    folder      TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    station     TEXT,
+    serial      TEXT,
+    data_id     TEXT,
+    file_date   TEXT,
+    rows        INTEGER,
+    first_ts    TEXT,
+    last_ts     TEXT,
+    flag_counts TEXT,
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    edits       TEXT,
+    PRIMARY KEY (folder, name)
+);
+CREATE INDEX IF NOT EXISTS files_station ON files (folder, station, serial, file_date);
+"""
+
+# Bump when the way rows are described from file names changes; older
+# catalogs are then re-indexed from scratch on the next connect
+NAME_RULES_VERSION = 3
+
+_COLUMNS = ['folder', 'name', 'station', 'serial', 'data_id', 'file_date', 'rows',
+            'first_ts', 'last_ts', 'flag_counts', 'size', 'mtime_ns', 'edits']
+
+_lock = threading.Lock()
+
+
+def catalog_path(project_dir):
+    return os.path.join(project_dir, CATALOG_NAME)
+
+
+def _connect(project_dir):
+    path = catalog_path(project_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    if conn.execute("PRAGMA user_version").fetchone()[0] < NAME_RULES_VERSION:
+        conn.execute("DELETE FROM files")
+        conn.execute(f"PRAGMA user_version = {NAME_RULES_VERSION}")
+        conn.commit()
+    return conn
+
+
+def is_catalogued(folder, name):
+    if folder == 'raw':
+        return name.lower().endswith(RAW_EXTENSIONS)
+    if not name.endswith(".csv"):
+        return False
+    # Incremental compile state, report notes and other side files
+    return not name.endswith(("_compiled_state.csv", "_notes.csv"))
+
+
+def _file_date(name):
+    # Same rule as the historical-file sort: YYYYMMDD right before the
+    # extension or before an overwrite suffix (_1, _2, see qaqc_engine.unique_path)
+    match = re.search(r"_(\d{8})(?:_\d+)?\.\w+$", name)
+    return match.group(1) if match else "00000000"
+
+
+def _name_parts(folder, name):
+    """
+    (station, serial) from a file name, e.g. 01FW002_tidy_21731701_20250704.csv.
+    Tidy serials are everything between the tag and the trailing _YYYYMMDD
+    (plus any _1, _2 overwrite suffix), so serials with underscores (SN_1234)
+    stay whole.
+    """
+    base, _ = os.path.splitext(name)
+    parts = base.split(NAME_TAGS[folder], 1)
+    if len(parts) < 2:
+        return None, None
+    rest = parts[1].split('_')
+    if folder == 'compiled':
+        return parts[0], None
+    if folder == 'raw' and rest and rest[0].upper().startswith('CR') and len(rest) > 1:
+        # Campbell loggers: Station_raw_CR1000X_3875_...
+        return parts[0], rest[1]
+    if folder == 'tidy':
+        serial = re.sub(r"_\d{8}(?:_\d+)?$", "", parts[1])
+        return parts[0], serial or None
+    return parts[0], rest[0] if rest else None
+
+
+def _distinct(series):
+    values = pd.Series(series).dropna().astype(str).unique()
+    return ", ".join(sorted(values)) if len(values) else None
+
+
+def _describe(folder, path, name, contents=True):
+    """
+    Catalog row values read from the file itself (tidy/compiled). Without
+    contents only the time range is read (tidy_store.time_range: first and
+    last lines or Parquet footer); rows, data_id and flag counts stay empty.
+    """
+    station, serial = _name_parts(folder, name)
+    entry = {'station': station, 'serial': serial, 'data_id': None, 'rows': None,
+             'first_ts': None, 'last_ts': None, 'flag_counts': None}
+    if folder == 'raw':
+        return entry
+    if not contents:
+        first, last = tidy_store.time_range(path)
+        entry['first_ts'] = str(first) if first is not None else None
+        entry['last_ts'] = str(last) if last is not None else None
+        return entry
+    df = tidy_store.load_tidy(path)
+    if df is None:
+        return entry
+    df = flag_edits.apply(df, path)
+    entry['rows'] = len(df)
+    # The name is written from these columns and keeps their exact text
+    # (e.g. leading zeros); the contents fill in what the name lacks
+    if station is None and 'station_code' in df.columns:
+        entry['station'] = _distinct(df['station_code'])
+    if serial is None and 'logger_serial' in df.columns:
+        entry['serial'] = _distinct(df['logger_serial'])
+    if 'data_id' in df.columns:
+        entry['data_id'] = _distinct(df['data_id'])
+    if 'timestamp' in df.columns and len(df):
+        ts = timestamps.parse(df['timestamp'], key=timestamps.TIDY_KEY)
+        entry['first_ts'] = str(ts.min())
+        entry['last_ts'] = str(ts.max())
+    if 'wtmp_flag' in df.columns:
+        counts = df['wtmp_flag'].astype(str).value_counts()
+        entry['flag_counts'] = json.dumps({k: int(v) for k, v in counts.items()})
+    return entry
+
+
+def refresh(project_dir, folders=None, contents=True):
+    """
+    Bring the catalog up to date with the files on disk. Only new or changed
+    files are read. With contents=False new or changed files only get their
+    names and time range (enough for latest_tidy); a later full refresh
+    fills in the rest. Returns the number of files (re)indexed.
+    """
+    indexed = 0
+    with _lock:
+        conn = _connect(project_dir)
+        try:
+            for folder in folders or FOLDERS:
+                directory = os.path.join(project_dir, FOLDERS[folder])
+                known = {row['name']: row for row in conn.execute(
+                    "SELECT name, size, mtime_ns, edits, rows FROM files WHERE folder = ?", (folder,))}
+                on_disk = set()
+                if os.path.isdir(directory):
+                    for entry in os.scandir(directory):
+                        if not entry.is_file() or not is_catalogued(folder, entry.name):
+                            continue
+                        on_disk.add(entry.name)
+                        stat = entry.stat()
+                        edits = json.dumps(flag_edits.stamp(entry.path)) if folder != 'raw' else None
+                        row = known.get(entry.name)
+                        if (row is not None and row['size'] == stat.st_size
+                                and row['mtime_ns'] == stat.st_mtime_ns and row['edits'] == edits
+                                and (row['rows'] is not None or not contents or folder == 'raw')):
+                            continue
+                        values = _describe(folder, entry.path, entry.name, contents)
+                        values.update(folder=folder, name=entry.name, file_date=_file_date(entry.name),
+                                      size=stat.st_size, mtime_ns=stat.st_mtime_ns, edits=edits)
+                        conn.execute(
+                            f"INSERT OR REPLACE INTO files ({', '.join(_COLUMNS)}) "
+                            f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                            [values[c] for c in _COLUMNS]
+                        )
+                        indexed += 1
+                gone = [(folder, name) for name in known if name not in on_disk]
+                conn.executemany("DELETE FROM files WHERE folder = ? AND name = ?", gone)
+            conn.commit()
+        finally:
+            conn.close()
+    return indexed
+
+
+def _entry(row):
+    entry = dict(row)
+    entry['flag_counts'] = json.loads(entry['flag_counts']) if entry['flag_counts'] else {}
+    for key in ('first_ts', 'last_ts'):
+        entry[key] = pd.Timestamp(entry[key]) if entry[key] else None
+    return entry
+
+
+def files(project_dir, folder, station=None):
+    """Catalog entries (dicts) of a folder, optionally for one station, oldest file date first."""
+    query = "SELECT * FROM files WHERE folder = ?"
+    args = [folder]
+    if station:
+        query += " AND station = ?"
+        args.append(station)
+    query += " ORDER BY file_date, name"
+    conn = _connect(project_dir)
+    try:
+        return [_entry(row) for row in conn.execute(query, args)]
+    finally:
+        conn.close()
+
+
+def latest_tidy(project_dir, station, serial, mode="Sequential"):
+    """
+    Catalog entry of the most recent historical tidy file for a station, like
+    qaqc_engine.find_latest_tidy_file: Sequential matches Station Code and
+    Serial Number, Logger Swap Station Code only. None if nothing matches
+    (or mode is "First Data Set").
+    """
+    if mode not in ["Sequential", "Logger Swap"] or not station:
+        return None
+    query = "SELECT * FROM files WHERE folder = 'tidy' AND station = ?"
+    args = [str(station)]
+    if mode == "Sequential":
+        query += " AND serial = ?"
+        args.append(str(serial))
+    query += " ORDER BY file_date DESC, name DESC LIMIT 1"
+    conn = _connect(project_dir)
+    try:
+        row = conn.execute(query, args).fetchone()
+    finally:
+        conn.close()
+    return _entry(row) if row is not None else None
+
+
+def label(entry):
+    """Picker label for a catalog entry: name, time range and row count."""
+    if entry['first_ts'] is None:
+        return entry['name']
+    rows = f", {entry['rows']} rows" if entry.get('rows') is not None else ""
+    return f"{entry['name']}  ({entry['first_ts']:%Y-%m-%d} → {entry['last_ts']:%Y-%m-%d}{rows})"
@@ -0,0 +1,245 @@
+"""
+compile_engine.py
+-----------------
+Streamlit-free annual compilation: combine tidy files and resolve duplicate
+timestamps from overlapping loggers.
+
+Ported from R: WT_AnnualReport.R (lines 127-193). When two loggers overlap at
+the same timestamp, duplicates are resolved using three cases:
+
+Case 1 — Both P:
+  Average wtmp, concatenate logger_serial with ".",
+  concatenate data_id with ".", flag = "AVG"
+
+Case 2 — One P, one not-P:
+  Keep the P record as-is (no averaging, no concatenation).
+  The non-P record is discarded.
+
+Case 3 — Neither P:
+  Average wtmp (NA if both NA), concatenate logger_serial
+  with "_", concatenate data_id with ".", flag = "C" (Caution).
+  Exception: if both flags are "M", flag stays "M".
+
+All three cases are resolved in one pass with grouped aggregations and
+masks (no per-group Python functions).
+"""
+
+import pandas as pd
+import numpy as np
+
+from utils import timestamps
+
+
+def prepare_tidy(d):
+    """Parse timestamps and coerce temperature to numeric (handles "NAN" strings)."""
+    if 'timestamp' in d.columns:
+        d['timestamp'] = timestamps.parse(d['timestamp'], key=timestamps.TIDY_KEY)
+    if 'wtmp' in d.columns:
+        d['wtmp'] = pd.to_numeric(d['wtmp'], errors='coerce')
+    # Categorical flags/metadata from different files don't concat cleanly
+    for col in ['station_code', 'logger_serial', 'wtmp_flag']:
+        if col in d.columns and isinstance(d[col].dtype, pd.CategoricalDtype):
+            d[col] = d[col].astype(object)
+    return d
+
+
+def sort_combined(combined_df):
+    """
+    Sort by timestamp (asc) and data_id (asc) so duplicate groups are always
+    ordered by data_id and the "first" record is deterministic.
+    """
+    if 'data_id' in combined_df.columns:
+        return combined_df.sort_values(['timestamp', 'data_id'])
+    # Fallback to simple sort if no data_id
+    return combined_df.sort_values('timestamp')
+
+
+def dedupe_same_logger(combined_df):
+    """
+    Step A: Same-logger dedup. Two tidy files from the same logger that
+    overlap give exact duplicate rows (same serial, same timestamp); keep the
+    first. Returns (df, removed_count).
+    """
+    before_dedup = len(combined_df)
+    combined_df = combined_df.drop_duplicates(subset=['timestamp', 'logger_serial'], keep='first')
+    return combined_df, before_dedup - len(combined_df)
+
+
+def _data_id_strings(data_id):
+    # str(int(s)) per id, 'NA' for missing
+    numeric = pd.to_numeric(data_id)
+    as_int = np.trunc(numeric).astype('Int64').astype(str)
+    return as_int.where(numeric.notna(), 'NA')
+
+
+def _wide_within_groups(keys, values):
+    """
+    Pivot `values` to one row per key and one column per position within the
+    group (row order kept). Loops over these columns run over the largest
+    group size (usually 2) instead of over groups.
+    """
+    rank = keys.groupby(keys, sort=False).cumcount()
+    index = pd.MultiIndex.from_arrays([keys.to_numpy(), rank.to_numpy()])
+    return pd.Series(values.to_numpy(), index=index).unstack()
+
+
+def _join_within_groups(keys, values, sep):
+    """Join string `values` within each group of `keys`, in row order."""
+    wide = _wide_within_groups(keys, values)
+    joined = wide[0]
+    for pos in wide.columns[1:]:
+        nxt = wide[pos]
+        joined = joined.where(nxt.isna(), joined + sep + nxt)
+    return joined
+
+
+def _mean_within_groups(keys, values):
+    """
+    NaN-skipping mean within each group, summed in row order like
+    Series.mean() so results match the per-group calculation bit for bit.
+    NaN if every value in the group is NaN.
+    """
+    wide = _wide_within_groups(keys, values.astype(float))
+    total = pd.Series(0.0, index=wide.index)
+    for pos in wide.columns:
+        total = total + wide[pos].fillna(0.0)
+    count = wide.notna().sum(axis=1)
+    return (total / count.where(count > 0)).where(count > 0)
+
+
+def resolve_duplicates(combined_df):
+    """
+    Step B: Multi-logger averaging. After same-logger dedup any remaining
+    duplicates are from different loggers at the same timestamp (R:
+    n_distinct(logger_serial) > 1).
+
+    Returns (final_df, case_counts) where case_counts has the number of
+    resolved timestamps per case ('avg', 'keep_p', 'caution'); final_df is
+    combined_df unchanged if there were no duplicates.
+    """
+    dupes_mask = combined_df.duplicated(subset=['timestamp'], keep=False)
+    case_counts = {'avg': 0, 'keep_p': 0, 'caution': 0}
+    if not dupes_mask.any():
+        return combined_df, case_counts
+
+    # Split into non-duplicate (unique timestamps) and duplicate groups
+    non_dupe_df = combined_df[~dupes_mask].copy()
+    dupe_df = combined_df[dupes_mask].copy()
+
+    # Per-timestamp statistics in one grouped pass
+    ts = dupe_df['timestamp']
+    is_p = dupe_df['wtmp_flag'].eq('P')
+    is_m = dupe_df['wtmp_flag'].eq('M')
+    grouped = pd.DataFrame({'is_p': is_p, 'is_m': is_m, 'wtmp': dupe_df['wtmp']}).groupby(ts)
+    stats = grouped.agg(p_count=('is_p', 'sum'), m_count=('is_m', 'sum'),
+                        size=('is_p', 'size'), wtmp=('wtmp', 'mean'))
+
+    case1_ts = stats['p_count'] == stats['size']                              # all P
+    case2_ts = (stats['p_count'] > 0) & (stats['p_count'] < stats['size'])    # some P
+    case3_ts = stats['p_count'] == 0                                          # no P
+
+    # Row-level case masks
+    row_case1 = ts.map(case1_ts).astype(bool)
+    row_case2 = ts.map(case2_ts).astype(bool)
+    row_case3 = ts.map(case3_ts).astype(bool)
+
+    resolved_parts = [non_dupe_df]
+
+    # --- Case 1: Both loggers passed ---
+    # Average wtmp, concatenate serials with ".", data_ids with ".", flag = "AVG"
+    if row_case1.any():
+        c1 = dupe_df[row_case1]
+        c1_keys = c1['timestamp']
+        case1_resolved = pd.DataFrame({
+            'wtmp': stats.loc[case1_ts, 'wtmp'],
+            'logger_serial': _join_within_groups(c1_keys, c1['logger_serial'].astype(str), '.'),
+            'data_id': _join_within_groups(c1_keys, _data_id_strings(c1['data_id']), '.'),
+        })
+        # Carry forward metadata from the first record in each group
+        firsts = c1.groupby('timestamp')[['station_code', 'utc_offset']].first()
+        case1_resolved['station_code'] = firsts['station_code']
+        case1_resolved['utc_offset'] = firsts['utc_offset']
+        case1_resolved.index.name = 'timestamp'
+        case1_resolved = case1_resolved.reset_index()
+        case1_resolved['wtmp_flag'] = 'AVG'
+        resolved_parts.append(case1_resolved)
+        case_counts['avg'] = len(case1_resolved)
+
+    # --- Case 2: One P, one (or more) not-P ---
+    # Keep the P record as-is (first one if several), discard non-P records.
+    if row_case2.any():
+        case2_resolved = dupe_df[row_case2 & is_p].drop_duplicates(subset=['timestamp'], keep='first')
+        resolved_parts.append(case2_resolved)
+        case_counts['keep_p'] = len(case2_resolved)
+
+    # --- Case 3: Neither logger passed ---
+    # Average wtmp (NA if all NA), concatenate serials with "_", data_ids with ".",
+    # flag = "C" (Caution), or "M" if all flags are "M". Other columns come
+    # from the first record of the group.
+    if row_case3.any():
+        c3 = dupe_df[row_case3]
+        c3_keys = c3['timestamp']
+        first_rows = c3[~c3_keys.duplicated(keep='first')].set_index('timestamp', drop=False)
+        c3_stats = stats.loc[case3_ts]
+        first_rows['wtmp'] = _mean_within_groups(c3_keys, c3['wtmp'])
+        first_rows['wtmp_flag'] = pd.Series(np.where(c3_stats['m_count'] == c3_stats['size'], 'M', 'C'), index=c3_stats.index)
+        first_rows['logger_serial'] = _join_within_groups(c3_keys, c3['logger_serial'].astype(str), '_')
+        first_rows['data_id'] = _join_within_groups(c3_keys, _data_id_strings(c3['data_id']), '.')
+        case3_resolved = first_rows.reset_index(drop=True)
+        resolved_parts.append(case3_resolved)
+        case_counts['caution'] = len(case3_resolved)
+
+    final_df = pd.concat(resolved_parts, ignore_index=True).sort_values('timestamp')
+    return final_df, case_counts
+
+
+def compile_frames(dfs):
+    """
+    Merge prepared tidy frames into one compiled record.
+    Returns (final_df, notes) with notes as (level, message) tuples.
+    """
+    notes = []
+    combined_df = sort_combined(pd.concat(dfs, ignore_index=True))
+    notes.append(('write', f"Combined {len(combined_df)} records."))
+    notes.append(('write', "Handling duplicate timestamps..."))
+
+    combined_df, same_logger_dupes = dedupe_same_logger(combined_df)
+    if same_logger_dupes > 0:
+        notes.append(('info', f"Removed {same_logger_dupes} same-logger duplicate records."))
+
+    dupe_count = combined_df.duplicated(subset=['timestamp'], keep=False).sum()
+    if dupe_count:
+        notes.append(('info', f"Found {dupe_count} records with multi-logger overlap. Resolving with averaging..."))
+        final_df, counts = resolve_duplicates(combined_df)
+
+        case_counts = []
+        if counts['avg']:
+            case_counts.append(f"{counts['avg']} averaged (AVG)")
+        if counts['keep_p']:
+            case_counts.append(f"{counts['keep_p']} kept P record")
+        if counts['caution']:
+            case_counts.append(f"{counts['caution']} averaged with caution (C)")
+        notes.append(('success', f"Multi-logger merge complete: {', '.join(case_counts)}"))
+
+        # Sanity check: no remaining duplicate timestamps
+        remaining_dupes = final_df.duplicated(subset=['timestamp'], keep=False).sum()
+        if remaining_dupes > 0:
+            notes.append(('error', f"WARNING: {remaining_dupes} duplicate timestamps remain after merge! Check data."))
+        else:
+            notes.append(('info', "No remaining duplicate timestamps — merge successful."))
+    else:
+        final_df = combined_df
+        notes.append(('info', "No multi-logger overlap found — no averaging needed."))
+
+    if 'wtmp' in final_df.columns:
+        final_df['wtmp'] = pd.to_numeric(final_df['wtmp'], errors='coerce')
+    return final_df, notes
+
+
+def to_compiled_csv(final_df):
+    """Copy for CSV export with missing temperatures written as "NAN"."""
+    final_df_to_save = final_df.copy()
+    if 'wtmp' in final_df_to_save.columns:
+        final_df_to_save['wtmp'] = final_df_to_save['wtmp'].astype(object)
+        final_df_to_save['wtmp'] = final_df_to_save['wtmp'].fillna("NAN")
+    return final_df_to_save
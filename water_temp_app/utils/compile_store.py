@@ -0,0 +1,208 @@
+"""
+compile_store.py
+----------------
+Incremental annual compilation.
+
+A compile keeps its result in 01_Data/03_Compiled as
+`{station}_compiled_state.parquet` (or .csv without pyarrow) together with
+`{station}_compiled_manifest.json`, which lists the tidy files it was built
+from (name, size, mtime, sha1, first/last timestamp, rows, and the state
+of its Review edits journal).
+
+The next compile compares the selected files with the manifest:
+  - unchanged files (same size and mtime, or same hash) are not read again
+  - added or changed files are read and merged
+  - files no longer selected are dropped
+Duplicate resolution only depends on the rows at one timestamp, so only the
+time windows touched by added/changed/removed files are re-resolved, from the
+rows of every selected file inside those windows. Everything outside the
+windows is reused from the stored compile.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from utils import compile_engine, tidy_store, flag_edits
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def station_from_tidy_name(filename):
+    """Station code from a tidy filename (Station_tidy_Serial_Date.csv)."""
+    return filename.split("_tidy_")[0] if "_tidy_" in filename else os.path.splitext(filename)[0]
+
+
+def state_paths(compiled_dir, station):
+    """(state csv path, manifest path). The Parquet state sits next to the csv path."""
+    base = os.path.join(compiled_dir, f"{station}_compiled_state")
+    return base + ".csv", base.replace("_compiled_state", "_compiled_manifest") + ".json"
+
+
+def load_state(compiled_dir, station):
+    """Stored compile and manifest, or (None, {}) if there is none (or it is unreadable)."""
+    state_csv, manifest_path = state_paths(compiled_dir, station)
+    if not os.path.exists(manifest_path):
+        return None, {}
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        state_df = tidy_store.load_tidy(state_csv)
+    except (OSError, ValueError):
+        return None, {}
+    if state_df is None:
+        return None, {}
+    return compile_engine.prepare_tidy(state_df), manifest
+
+
+def save_state(final_df, manifest, compiled_dir, station):
+    os.makedirs(compiled_dir, exist_ok=True)
+    state_csv, manifest_path = state_paths(compiled_dir, station)
+    if tidy_store.HAS_PARQUET:
+        tidy_store.write_parquet(final_df, state_csv)
+        # Drop a CSV state left by a run without pyarrow
+        if os.path.exists(state_csv):
+            os.remove(state_csv)
+    else:
+        compile_engine.to_compiled_csv(final_df).to_csv(state_csv, index=False)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _load_prepared(path, start=None, end=None):
+    d = tidy_store.load_tidy(path, start=start, end=end)
+    return compile_engine.prepare_tidy(flag_edits.apply(d, path)) if d is not None else None
+
+
+def _manifest_entry(path, d, sha1=None):
+    stat = os.stat(path)
+    has_ts = d is not None and 'timestamp' in d.columns and not d.empty
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha1': sha1 or file_sha1(path),
+        'first': d['timestamp'].min().isoformat() if has_ts else None,
+        'last': d['timestamp'].max().isoformat() if has_ts else None,
+        'rows': 0 if d is None else len(d),
+        'edits': flag_edits.stamp(path),
+    }
+
+
+def _merge_windows(windows):
+    """Merge overlapping (start, end) timestamp windows."""
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _in_windows(ts, windows):
+    mask = pd.Series(False, index=ts.index)
+    for start, end in windows:
+        mask |= (ts >= start) & (ts <= end)
+    return mask
+
+
+def incremental_compile(tidy_dir, compiled_dir, selected_files, station=None):
+    """
+    Compile `selected_files` (tidy filenames in tidy_dir), reusing the stored
+    compile where possible. Returns (final_df, notes); the stored compile and
+    manifest are updated.
+    """
+    station = station or station_from_tidy_name(selected_files[0])
+    state_df, manifest = load_state(compiled_dir, station)
+    old_files = manifest.get('files', {})
+
+    new_manifest = {'station': station, 'files': {}}
+    unchanged, changed, loaded = [], [], {}
+    for f in selected_files:
+        path = os.path.join(tidy_dir, f)
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        entry = old_files.get(f)
+        if entry and entry.get('edits') != flag_edits.stamp(path):
+            # Flags edited on the Review page since the last compile
+            entry = None
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            unchanged.append(f)
+            new_manifest['files'][f] = entry
+            continue
+        sha1 = file_sha1(path)
+        if entry and entry['sha1'] == sha1:
+            # Touched but not modified
+            unchanged.append(f)
+            new_manifest['files'][f] = dict(entry, mtime=stat.st_mtime)
+            continue
+        d = _load_prepared(path)
+        loaded[f] = d
+        changed.append(f)
+        new_manifest['files'][f] = _manifest_entry(path, d, sha1)
+    removed = [f for f in old_files if f not in new_manifest['files']]
+
+    # Nothing to reuse: plain full compile
+    if state_df is None or not unchanged:
+        dfs = [loaded[f] for f in changed if loaded[f] is not None]
+        if not dfs:
+            return None, [('warning', "No data loaded from the selected files.")]
+        final_df, notes = compile_engine.compile_frames(dfs)
+        notes.insert(0, ('info', f"Full compile of {len(dfs)} file(s)."))
+        save_state(final_df, new_manifest, compiled_dir, station)
+        return final_df, notes
+
+    if not changed and not removed:
+        notes = [('info', f"All {len(unchanged)} file(s) unchanged since the last compile — reusing it.")]
+        return state_df, notes
+
+    # Time windows touched by added/changed/removed files (old and new ranges)
+    windows = []
+    for f in changed + removed:
+        for entry in (old_files.get(f), new_manifest['files'].get(f)):
+            if entry and entry.get('first'):
+                windows.append((pd.Timestamp(entry['first']), pd.Timestamp(entry['last'])))
+    windows = _merge_windows(windows)
+
+    notes = [('info', f"Incremental compile: {len(unchanged)} unchanged, {len(changed)} added/changed, "
+                      f"{len(removed)} removed file(s); re-resolving {len(windows)} time window(s).")]
+
+    # Rows of every selected file inside the windows (selection order kept)
+    window_start, window_end = windows[0][0], windows[-1][1]
+    window_dfs = []
+    for f in selected_files:
+        entry = new_manifest['files'].get(f)
+        if entry is None or not entry.get('first'):
+            continue
+        first, last = pd.Timestamp(entry['first']), pd.Timestamp(entry['last'])
+        if not any(first <= end and last >= start for start, end in windows):
+            continue
+        d = loaded.get(f)
+        if d is None:
+            d = _load_prepared(os.path.join(tidy_dir, f), start=window_start, end=window_end)
+        if d is not None and not d.empty:
+            window_dfs.append(d[_in_windows(d['timestamp'], windows)])
+
+    kept_df = state_df[~_in_windows(state_df['timestamp'], windows)]
+    parts = [kept_df]
+    if window_dfs:
+        window_final, window_notes = compile_engine.compile_frames(window_dfs)
+        notes.extend(window_notes)
+        parts.append(window_final)
+
+    final_df = pd.concat(parts, ignore_index=True).sort_values('timestamp')
+    remaining_dupes = final_df.duplicated(subset=['timestamp'], keep=False).sum()
+    if remaining_dupes > 0:
+        notes.append(('error', f"WARNING: {remaining_dupes} duplicate timestamps remain after merge! Check data."))
+
+    save_state(final_df, new_manifest, compiled_dir, station)
+    return final_df, notes
@@ -0,0 +1,192 @@
+"""
+compile_stream.py
+-----------------
+Low-memory annual compilation for long station records.
+
+Tidy files are time-sorted, so instead of concatenating every file and
+sorting the whole record they are read in chunks and merged k-way: a heap
+holds, per file, the last timestamp read so far. Everything before the
+smallest of those timestamps can no longer receive rows from any file, so it
+is resolved (same-logger dedup + AVG/P/C/M rules from compile_engine) and
+appended to the compiled CSV (and Parquet copy) straight away. Only about one
+chunk per file is held in memory at a time.
+
+Duplicate resolution works per timestamp, so the output is the same as
+compile_engine.compile_frames on the concatenated files.
+"""
+
+import heapq
+import os
+
+import pandas as pd
+
+from utils import compile_engine, tidy_store, flag_edits
+
+# Rows read per file per step
+CHUNK_ROWS = 50_000
+
+
+def _check_sorted(chunk, source, last_ts):
+    ts = chunk['timestamp']
+    if not ts.is_monotonic_increasing or (last_ts is not None and ts.iloc[0] < last_ts):
+        raise ValueError(f"'{os.path.basename(source)}' is not sorted by timestamp; "
+                         "use the in-memory compile for this file.")
+
+
+def _parquet_schema(columns):
+    import pyarrow as pa
+    fields = []
+    for col in columns:
+        if col == 'timestamp':
+            fields.append(pa.field(col, pa.timestamp('ns')))
+        elif col in ('wtmp', 'utc_offset'):
+            fields.append(pa.field(col, pa.float64()))
+        elif col in tidy_store.CATEGORICAL_COLUMNS:
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            # data_id becomes "174.175" on merged rows, keep it as text throughout
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def _write_batch(writer, batch):
+    """Append a resolved batch to the compiled CSV and its Parquet copy."""
+    if batch.empty:
+        return
+    if writer['columns'] is None:
+        writer['columns'] = list(batch.columns)
+        writer['csv'] = open(writer['csv_path'], 'w', newline='')
+    batch = batch.reindex(columns=writer['columns'])
+    # Explicit date_format: pandas writes a datetime column whose rows are all
+    # at midnight as date only, which a single-row or small batch easily is
+    compile_engine.to_compiled_csv(batch).to_csv(writer['csv'], index=False, header=writer['csv'].tell() == 0,
+                                                 date_format='%Y-%m-%d %H:%M:%S')
+
+    if writer['parquet']:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if writer['pq'] is None:
+            writer['schema'] = _parquet_schema(writer['columns'])
+            writer['pq'] = pq.ParquetWriter(tidy_store.parquet_path(writer['csv_path']), writer['schema'])
+        typed = batch.copy()
+        for col in writer['columns']:
+            if col in ('wtmp', 'utc_offset'):
+                typed[col] = pd.to_numeric(typed[col], errors='coerce')
+            elif col != 'timestamp':
+                typed[col] = typed[col].astype(str).where(typed[col].notna())
+        table = pa.Table.from_pandas(typed, preserve_index=False).cast(writer['schema'])
+        writer['pq'].write_table(table, row_group_size=tidy_store.ROW_GROUP_SIZE)
+
+
+def _close_writer(writer, remove=False):
+    # CSV first, so the Parquet copy ends up the newer file (see tidy_store.is_fresh)
+    if writer['csv'] is not None:
+        writer['csv'].close()
+    if writer['pq'] is not None:
+        writer['pq'].close()
+    if remove and writer['columns'] is not None:
+        for path in (writer['csv_path'], tidy_store.parquet_path(writer['csv_path'])):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def stream_compile(paths, out_csv, chunk_rows=CHUNK_ROWS, parquet=True, progress=None):
+    """
+    Compile the tidy files at `paths` (CSV paths; fresh Parquet copies are
+    read instead) into `out_csv`, chunk by chunk. `progress`, if given, is
+    called with the number of records written so far after each batch.
+
+    Returns (summary, notes): summary has 'rows', 'first' and 'last'
+    timestamps; notes are (level, message) tuples like compile_frames.
+    """
+    readers = [tidy_store.iter_tidy(p, chunk_rows) for p in paths]
+    edits = [flag_edits.read(p) for p in paths]
+    buffers = [None] * len(paths)
+    last_read = [None] * len(paths)
+    heap = []  # (last timestamp read, file index) for files not yet exhausted
+    totals = {'combined': 0, 'same_logger': 0, 'multi': 0, 'avg': 0, 'keep_p': 0, 'caution': 0}
+    summary = {'rows': 0, 'first': None, 'last': None}
+
+    def advance(i):
+        for chunk in readers[i]:
+            if chunk.empty:
+                continue
+            if edits[i] is not None:
+                chunk = flag_edits.apply(chunk, paths[i], edits[i])
+            chunk = compile_engine.prepare_tidy(chunk)
+            _check_sorted(chunk, paths[i], last_read[i])
+            last_read[i] = chunk['timestamp'].iloc[-1]
+            buffers[i] = chunk if buffers[i] is None else pd.concat([buffers[i], chunk], ignore_index=True)
+            heapq.heappush(heap, (last_read[i], i))
+            return
+
+    def emit(horizon=None):
+        parts = []
+        for i, buf in enumerate(buffers):
+            if buf is None or buf.empty:
+                continue
+            if horizon is None:
+                parts.append(buf)
+                buffers[i] = None
+            else:
+                ready = buf['timestamp'] < horizon
+                if ready.any():
+                    parts.append(buf[ready])
+                    buffers[i] = buf[~ready]
+        if not parts:
+            return
+        batch = compile_engine.sort_combined(pd.concat(parts, ignore_index=True))
+        totals['combined'] += len(batch)
+        batch, removed = compile_engine.dedupe_same_logger(batch)
+        totals['same_logger'] += removed
+        multi = batch.duplicated(subset=['timestamp'], keep=False).sum()
+        if multi:
+            totals['multi'] += multi
+            batch, counts = compile_engine.resolve_duplicates(batch)
+            for key, value in counts.items():
+                totals[key] += value
+        if 'wtmp' in batch.columns:
+            batch['wtmp'] = pd.to_numeric(batch['wtmp'], errors='coerce')
+        _write_batch(writer, batch)
+        summary['rows'] += len(batch)
+        if summary['first'] is None:
+            summary['first'] = batch['timestamp'].iloc[0]
+        summary['last'] = batch['timestamp'].iloc[-1]
+        if progress is not None:
+            progress(summary['rows'])
+
+    writer = {'csv_path': out_csv, 'parquet': parquet and tidy_store.HAS_PARQUET,
+              'columns': None, 'csv': None, 'pq': None, 'schema': None}
+    try:
+        for i in range(len(paths)):
+            advance(i)
+        while heap:
+            # No file can still produce rows before the smallest last-read timestamp
+            emit(heap[0][0])
+            _, i = heapq.heappop(heap)
+            advance(i)
+        emit()
+    except BaseException:
+        # Don't leave a half-written compiled file behind
+        _close_writer(writer, remove=True)
+        raise
+    _close_writer(writer)
+
+    notes = [('write', f"Combined {totals['combined']} records (streamed from {len(paths)} files).")]
+    if totals['same_logger']:
+        notes.append(('info', f"Removed {totals['same_logger']} same-logger duplicate records."))
+    if totals['multi']:
+        case_counts = []
+        if totals['avg']:
+            case_counts.append(f"{totals['avg']} averaged (AVG)")
+        if totals['keep_p']:
+            case_counts.append(f"{totals['keep_p']} kept P record")
+        if totals['caution']:
+            case_counts.append(f"{totals['caution']} averaged with caution (C)")
+        notes.append(('info', f"Found {totals['multi']} records with multi-logger overlap."))
+        notes.append(('success', f"Multi-logger merge complete: {', '.join(case_counts)}"))
+    else:
+        notes.append(('info', "No multi-logger overlap found — no averaging needed."))
+    if summary['rows'] == 0:
+        notes.append(('warning', "No data loaded from the selected files."))
+    return summary, notes
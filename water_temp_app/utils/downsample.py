@@ -0,0 +1,117 @@
+"""
+downsample.py
+-------------
+Server-side thinning of time series before they go to the browser.
+
+A multi-year 15-minute record is hundreds of thousands of points, far more
+than the plot has pixels. The gray temperature line is reduced to about
+`max_points` points, either with min/max per bucket (keeps every spike,
+the default for QAQC) or with LTTB (Largest-Triangle-Three-Buckets, keeps
+the visual shape with fewer points). Flagged (non-P) points are never
+dropped, and gaps (missing wtmp) stay visible as breaks in the line.
+
+The pages only plot a user-chosen time window, so narrowing the window
+re-samples from the full data and shows full resolution once the window
+holds fewer than `max_points` rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils import flag_codes
+
+# About two points per horizontal pixel of a wide plot
+DEFAULT_MAX_POINTS = 4000
+
+METHODS = ["minmax", "lttb"]
+
+
+def minmax_indices(y, n_out):
+    """
+    Positions of the minimum and maximum of `y` in each of n_out/2 equal
+    buckets, plus the first and last position. NaNs are ignored.
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    n_buckets = max(n_out // 2, 1)
+    bucket = np.arange(n) * n_buckets // n
+    s = pd.Series(np.asarray(y, dtype=float))
+    valid = s.notna().to_numpy()
+    if not valid.any():
+        return np.array([0, n - 1])
+    grouped = s[valid].groupby(bucket[valid])
+    idx = np.concatenate([grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy(), [0, n - 1]])
+    return np.unique(idx)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: positions of `n_out` points that keep the
+    shape of the (x, y) line. NaN values are skipped.
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    valid = np.flatnonzero(~np.isnan(np.asarray(y, dtype=float)))
+    if len(valid) <= n_out:
+        return np.unique(np.concatenate([valid, [0, n - 1]]))
+    xv = np.asarray(x, dtype=float)[valid]
+    yv = np.asarray(y, dtype=float)[valid]
+    m = len(valid)
+
+    every = (m - 2) / (n_out - 2)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        # Average of the next bucket is the third triangle corner
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, m)
+        avg_x = xv[next_start:next_end].mean()
+        avg_y = yv[next_start:next_end].mean()
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        area = np.abs((xv[a] - avg_x) * (yv[start:end] - yv[a])
+                      - (xv[a] - xv[start:end]) * (avg_y - yv[a]))
+        a = start + int(np.argmax(area))
+        picked[i + 1] = a
+    picked[-1] = m - 1
+    return np.unique(np.concatenate([valid[picked], [0, n - 1]]))
+
+
+def gap_starts(y):
+    """Positions where a run of missing values starts (keeps gaps as line breaks)."""
+    na = pd.isna(np.asarray(y, dtype=float))
+    return np.flatnonzero(na & ~np.r_[False, na[:-1]])
+
+
+def line_positions(df, max_points=DEFAULT_MAX_POINTS, method="minmax"):
+    """Row positions of df to draw the temperature line with."""
+    y = pd.to_numeric(df['wtmp'], errors='coerce').to_numpy(dtype=float)
+    if len(df) <= max_points:
+        return np.arange(len(df))
+    if method == "lttb":
+        x = df['timestamp'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+        idx = lttb_indices(x, y, max_points)
+    else:
+        idx = minmax_indices(y, max_points)
+    return np.union1d(idx, gap_starts(y))
+
+
+def plot_frames(df, max_points=DEFAULT_MAX_POINTS, method="minmax"):
+    """
+    (line_df, marker_df) for plotting df: the thinned line, and the line's
+    points plus every row whose flag is not P. Both are df itself when it is
+    small enough to plot in full.
+    """
+    if max_points is None or len(df) <= max_points:
+        return df, df
+    positions = line_positions(df, max_points, method)
+    line_df = df.iloc[positions]
+    keep = np.zeros(len(df), dtype=bool)
+    keep[positions] = True
+    if flag_codes.has_flags(df):
+        keep |= flag_codes.not_pass(df)
+    return line_df, df[keep]
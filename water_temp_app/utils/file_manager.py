@@ -1,6 +1,8 @@
 import streamlit as st
 import os
 import pandas as pd
+import sqlite3
+from utils import tidy_store, frame_cache, flag_edits, catalog
 
 def get_project_dir():
     if 'project_dir' not in st.session_state:
@@ -13,7 +15,12 @@ def set_project_dir(path):
         return True
     return False
 
-def save_data(df, filename, subfolder="01_Data/01_Raw_Formatted", overwrite=False):
+def save_data(df, filename, subfolder="01_Data/01_Raw_Formatted", overwrite=False, columnar=None):
+    """
+    Save df as CSV under the project dir. For tidy/compiled folders (or
+    columnar=True) a typed Parquet copy is written next to the CSV when
+    pyarrow is installed; the CSV stays the R-compatible export.
+    """
     project_dir = get_project_dir()
     full_path_dir = os.path.join(project_dir, subfolder)
     os.makedirs(full_path_dir, exist_ok=True)
@@ -36,25 +43,81 @@ def save_data(df, filename, subfolder="01_Data/01_Raw_Formatted", overwrite=Fals
         file_path = new_file_path
         
     df.to_csv(file_path, index=False)
+    if overwrite:
+        # New content: edits journaled against the old file no longer apply
+        flag_edits.discard(file_path)
+    frame_cache.invalidate(file_path)
+    frame_cache.invalidate(tidy_store.parquet_path(file_path))
+
+    if columnar is None:
+        columnar = subfolder in tidy_store.COLUMNAR_SUBFOLDERS
+    if columnar and tidy_store.HAS_PARQUET:
+        try:
+            tidy_store.write_parquet(df, file_path)
+        except Exception as e:
+            # The CSV is saved; just make sure no stale copy is left behind
+            tidy_store.remove_parquet(file_path)
+            st.warning(f"Could not write Parquet copy of '{os.path.basename(file_path)}': {e}")
     return file_path
 
-def load_data(filename, subfolder="01_Data/01_Raw_Formatted"):
+def load_data(filename, subfolder="01_Data/01_Raw_Formatted", columns=None, start=None, end=None):
+    """
+    Load a CSV from the project dir. If an up-to-date Parquet copy exists it
+    is read instead (typed timestamps/wtmp/flags, no parsing).
+
+    columns    : only load these columns
+    start, end : only return rows with start <= timestamp <= end
+
+    Results are kept in the process-wide frame cache keyed on the file's
+    path, size and mtime, so reruns reuse the already parsed frame.
+
+    Review edits journaled next to the file (utils/flag_edits.py) are applied.
+    """
     project_dir = get_project_dir()
     file_path = os.path.join(project_dir, subfolder, filename)
+    source_path = tidy_store.parquet_path(file_path) if tidy_store.is_fresh(file_path) else file_path
+    edits_stamp = flag_edits.stamp(file_path)
+    cache_key = frame_cache.file_key(
+        source_path, tuple(columns) if columns else None, str(start), str(end),
+        tuple(edits_stamp) if edits_stamp else None
+    )
+    df = frame_cache.get(cache_key)
+    if df is not None:
+        return df
+
+    df = _read_data(file_path, filename, subfolder, columns, start, end)
+    if edits_stamp and df is not None:
+        df = flag_edits.apply(df, file_path)
+    frame_cache.put(cache_key, df)
+    return df
+
+def _read_data(file_path, filename, subfolder, columns=None, start=None, end=None):
+    if tidy_store.is_fresh(file_path):
+        try:
+            return tidy_store.read_parquet(file_path, columns=columns, start=start, end=end)
+        except Exception:
+            # Unreadable copy (e.g. interrupted write) - fall back to the CSV
+            pass
     if os.path.exists(file_path):
         try:
-            return pd.read_csv(file_path)
+            df = pd.read_csv(file_path, usecols=columns)
         except (UnicodeDecodeError, pd.errors.ParserError):
             # Fallback: User might have renamed .xlsx to .csv
             try:
                 # Attempt to read as Excel
-                df = pd.read_excel(file_path)
+                df = pd.read_excel(file_path, usecols=columns)
                 st.warning(f"File '{filename}' appears to be an Excel file renamed to '.csv'. This may cause issues. Please save as CSV properly.")
-                return df
             except Exception:
                 # If both fail, raise the original CSV error or return None/Error
                 st.error(f"Error reading file '{filename}'. Please ensure it is a valid CSV file.")
                 return None
+        if subfolder in tidy_store.COLUMNAR_SUBFOLDERS:
+            # Same types as the Parquet copy, so cached frames are ready to use
+            try:
+                df = tidy_store.typed_tidy(df)
+            except (ValueError, TypeError):
+                pass
+        return tidy_store.filter_range(df, start, end)
     return None
 
 def list_files(subfolder="01_Data/01_Raw_Formatted", pattern=None):
@@ -66,3 +129,19 @@ def list_files(subfolder="01_Data/01_Raw_Formatted", pattern=None):
     if pattern:
         files = [f for f in files if pattern in f]
     return files
+
+def list_catalog(folder="tidy"):
+    """
+    Catalog entries (utils/catalog.py) of a project folder ('raw', 'tidy' or
+    'compiled'), oldest file date first. Only new or changed files are read.
+    Falls back to the plain file list if the catalog can't be used.
+    """
+    project_dir = get_project_dir()
+    try:
+        catalog.refresh(project_dir, folders=[folder])
+        return catalog.files(project_dir, folder)
+    except (sqlite3.Error, OSError) as e:
+        st.caption(f"File catalog unavailable ({e}); listing the folder instead.")
+        names = sorted(f for f in list_files(subfolder=catalog.FOLDERS[folder].replace(os.sep, "/"))
+                       if catalog.is_catalogued(folder, f))
+        return [{'name': f, 'first_ts': None} for f in names]
@@ -0,0 +1,93 @@
+"""
+flag_codes.py
+-------------
+Integer representation of the QAQC flags.
+
+In memory a flagged frame carries two small integer columns instead of the
+"A, S" style strings:
+
+  flag_bits : uint8 bitmask of the concatenatable flags A=1, B=2, S=4, T=8
+              (bit order is alphabetical, the order they are written in)
+  flag_code : uint8 standalone code, P=0 (pass, or the concatenated flags
+              when bits are set), M, V, E, N, and the compile-only AVG, C
+
+A standalone code other than P wins over the bits, which are then 0.
+Setting, testing and counting flags are integer operations; the strings
+are only produced when writing tidy files (qaqc_engine.to_tidy) and for
+labels, once per distinct flag combination.
+
+Frames loaded from tidy CSVs still have the string wtmp_flag column; the
+helpers below accept either form.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Concatenatable flags, alphabetical = bit order = export order
+FLAG_BITS = {'A': 1, 'B': 2, 'S': 4, 'T': 8}
+
+# Standalone flags (P = no standalone flag)
+FLAG_CODES = {'P': 0, 'M': 1, 'V': 2, 'E': 3, 'N': 4, 'AVG': 5, 'C': 6}
+CODE_NAMES = {code: name for name, code in FLAG_CODES.items()}
+
+# Keys combine both columns: code * KEY_STRIDE + bits
+KEY_STRIDE = 16
+
+
+def format_flag(code, bits):
+    """String for one (code, bits) pair, e.g. (0, 5) -> "A, S", (1, 0) -> "M"."""
+    if code != FLAG_CODES['P']:
+        return CODE_NAMES.get(code, '?')
+    if not bits:
+        return 'P'
+    return ', '.join(flag for flag, bit in FLAG_BITS.items() if bits & bit)
+
+
+def parse_flag(flag):
+    """(code, bits) for one flag string; None if it isn't a known flag."""
+    flag = str(flag).strip()
+    if flag in FLAG_CODES:
+        return FLAG_CODES[flag], 0
+    parts = [f.strip() for f in flag.replace(',', ' ').split() if f.strip()]
+    if parts and all(f in FLAG_BITS for f in parts):
+        return FLAG_CODES['P'], sum(FLAG_BITS[f] for f in set(parts))
+    return None
+
+
+def has_codes(df):
+    return 'flag_code' in df.columns and 'flag_bits' in df.columns
+
+
+def has_flags(df):
+    return has_codes(df) or 'wtmp_flag' in df.columns
+
+
+def flag_keys(df):
+    """Integer key per row (code * KEY_STRIDE + bits) from the flag columns."""
+    return df['flag_code'].to_numpy(dtype=np.int16) * KEY_STRIDE + df['flag_bits'].to_numpy(dtype=np.int16)
+
+
+def flag_categorical(df):
+    """
+    Flags of df as a pandas Categorical of strings. With integer flag columns
+    each distinct combination is formatted once; string flags are used as-is.
+    """
+    if not has_codes(df):
+        return pd.Categorical(df['wtmp_flag'])
+    keys = flag_keys(df)
+    uniques, codes = np.unique(keys, return_inverse=True)
+    labels = [format_flag(k // KEY_STRIDE, k % KEY_STRIDE) for k in uniques]
+    return pd.Categorical.from_codes(codes.reshape(-1), categories=labels)
+
+
+def flag_series(df):
+    """flag_categorical(df) as a Series aligned with df."""
+    return pd.Series(flag_categorical(df), index=df.index, name='wtmp_flag')
+
+
+def not_pass(df):
+    """Boolean array: rows whose flag is anything but P."""
+    if has_codes(df):
+        return (df['flag_code'].to_numpy() != FLAG_CODES['P']) | (df['flag_bits'].to_numpy() != 0)
+    return (df['wtmp_flag'] != 'P').to_numpy()
+
@@ -0,0 +1,150 @@
+"""
+flag_edits.py
+-------------
+Append-only journal of manual flag edits made on the Review page.
+
+Saving a few edited flags used to rewrite the whole tidy CSV. Instead the
+changes go to `<tidy name>.edits.jsonl` next to the CSV, one line per edit:
+
+    {"timestamp": "2024-06-01 12:15:00", "wtmp_flag": "S", "previous_flag": "P", "edited_at": "..."}
+
+so a save costs as much as the edits. Everything that reads tidy files in
+the app (file_manager.load_data, the annual compiles) applies the journal on
+load, the latest edit of a timestamp wins. compact() writes the edits into
+the CSV (and Parquet copy) and removes the journal; do that before using
+the CSV outside the app (e.g. in R). It also happens automatically once the
+journal holds COMPACT_AFTER edits.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+from utils import tidy_store, timestamps
+
+# Journal size at which the Review page writes the edits into the CSV
+COMPACT_AFTER = 5000
+
+
+def edits_path(csv_path):
+    base, _ = os.path.splitext(csv_path)
+    return base + ".edits.jsonl"
+
+
+def stamp(csv_path):
+    """[size, mtime_ns] of the journal, or None; part of cache keys and compile manifests."""
+    try:
+        stat = os.stat(edits_path(csv_path))
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def append(csv_path, edits):
+    """
+    Append edits (DataFrame with timestamp, wtmp_flag and optionally
+    previous_flag) to the journal. Returns the number of edits written.
+    """
+    if edits is None or edits.empty:
+        return 0
+    edited_at = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open(edits_path(csv_path), "a") as f:
+        for row in edits.itertuples(index=False):
+            previous = getattr(row, 'previous_flag', None)
+            f.write(json.dumps({
+                'timestamp': pd.Timestamp(row.timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+                'wtmp_flag': row.wtmp_flag,
+                'previous_flag': None if pd.isna(previous) else str(previous),
+                'edited_at': edited_at,
+            }) + "\n")
+    return len(edits)
+
+
+def from_pending(df, pending):
+    """
+    Edits frame (timestamp, wtmp_flag, previous_flag) for append() from the
+    Review page's unsaved {timestamp: flag} edits of `df`, leaving out edits
+    back to the flag the row already has. A repeated timestamp takes the
+    previous flag of its last row.
+    """
+    edits = pd.DataFrame({'timestamp': list(pending.keys()), 'wtmp_flag': list(pending.values())})
+    if edits.empty:
+        edits['previous_flag'] = pd.Series(dtype=object)
+        return edits
+    previous = df.drop_duplicates('timestamp', keep='last').set_index('timestamp')['wtmp_flag']
+    edits['previous_flag'] = edits['timestamp'].map(previous)
+    return edits[edits['wtmp_flag'] != edits['previous_flag']]
+
+
+def read(csv_path):
+    """Latest flag per edited timestamp (Series indexed by Timestamp), or None."""
+    path = edits_path(csv_path)
+    if not os.path.exists(path):
+        return None
+    journal = pd.read_json(path, lines=True, dtype={'timestamp': str, 'wtmp_flag': str}, convert_dates=False)
+    if journal.empty:
+        return None
+    journal['timestamp'] = timestamps.parse(journal['timestamp'], key=timestamps.TIDY_KEY)
+    journal = journal.dropna(subset=['timestamp'])
+    if journal.empty:
+        return None
+    return journal.drop_duplicates(subset=['timestamp'], keep='last').set_index('timestamp')['wtmp_flag']
+
+
+def count(csv_path):
+    path = edits_path(csv_path)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+def apply(df, csv_path, edits=None):
+    """Apply the journal of `csv_path` to a frame loaded from it (in place, also returned)."""
+    if edits is None:
+        edits = read(csv_path)
+    if edits is None or df is None or 'timestamp' not in df.columns or 'wtmp_flag' not in df.columns:
+        return df
+    # Rows whose timestamp doesn't parse (NaT) are never edited
+    new_flags = timestamps.parse(df['timestamp'], key=timestamps.TIDY_KEY).map(edits)
+    hit = new_flags.notna()
+    if hit.any():
+        was_categorical = isinstance(df['wtmp_flag'].dtype, pd.CategoricalDtype)
+        flags = df['wtmp_flag'].astype(object)
+        flags[hit] = new_flags[hit]
+        df['wtmp_flag'] = flags.astype('category') if was_categorical else flags
+    return df
+
+
+def compact(csv_path):
+    """
+    Write the journal into the CSV (text kept as-is apart from the edited
+    flags), refresh the Parquet copy and delete the journal.
+    Returns the number of rows changed.
+    """
+    edits = read(csv_path)
+    if edits is None:
+        discard(csv_path)
+        return 0
+    # Read everything as text so untouched values ("NAN", number formats) stay byte-identical
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    before = df['wtmp_flag'].copy()
+    apply(df, csv_path, edits)
+    changed = int((df['wtmp_flag'] != before).sum())
+    df.to_csv(csv_path, index=False)
+    if tidy_store.HAS_PARQUET:
+        try:
+            # Parse the rewritten CSV normally so the copy gets the usual types
+            tidy_store.write_parquet(pd.read_csv(csv_path), csv_path)
+        except Exception:
+            tidy_store.remove_parquet(csv_path)
+    discard(csv_path)
+    return changed
+
+
+def discard(csv_path):
+    """Delete the journal (e.g. when the tidy file is overwritten)."""
+    path = edits_path(csv_path)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,175 @@
+"""
+format_engine.py
+----------------
+Streamlit-free helpers for the "Format Data" step (modules/format_data.py):
+reading raw logger exports, dropping "Logged" event rows, pulling station /
+serial / date out of the raw filename and adding the metadata columns.
+"""
+
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from utils import timestamps
+
+
+# Raw CSVs larger than this are read in chunks, dropping "Logged" rows per chunk
+CHUNK_BYTES = 64 * 1024 * 1024
+CHUNK_ROWS = 200_000
+
+# Event rows: any text cell containing "Logged" (case-insensitive)
+LOGGED_PATTERN = re.compile("logged", re.IGNORECASE)
+
+
+def read_raw_file(path, skip_rows=1):
+    """
+    Read a raw logger export (.csv/.txt/.xlsx).
+
+    Files with a .csv extension that fail to parse are retried as Excel
+    (users sometimes rename .xlsx to .csv). CSVs over CHUNK_BYTES are read
+    in chunks (see read_raw_csv) and come back with "Logged" rows removed.
+    """
+    if str(path).endswith('.xlsx'):
+        return pd.read_excel(path, skiprows=skip_rows)
+    try:
+        return read_raw_csv(path, skip_rows=skip_rows, chunked=os.path.getsize(path) > CHUNK_BYTES)
+    except (UnicodeDecodeError, pd.errors.ParserError):
+        return pd.read_excel(path, skiprows=skip_rows)
+
+
+def iter_raw_csv(source, skip_rows=1, chunk_rows=CHUNK_ROWS):
+    """Yield a raw CSV (path or file object) in chunks, "Logged" rows already removed."""
+    for chunk in pd.read_csv(source, skiprows=skip_rows, chunksize=chunk_rows):
+        yield filter_logged_rows(chunk)
+
+
+def read_raw_csv(source, skip_rows=1, chunked=False, chunk_rows=CHUNK_ROWS):
+    """
+    Read a raw CSV. With chunked=True it is read through iter_raw_csv and
+    "Logged" rows are dropped per chunk, so the unfiltered file is never
+    parsed in one go. This is not streaming: the filtered chunks are kept
+    and concatenated, so peak memory is about twice the returned frame (use
+    iter_raw_csv to process a file chunk by chunk). Columns get their types
+    per chunk (a numeric column with text in some chunks ends up as object,
+    as in a whole-file read).
+    """
+    if not chunked:
+        return pd.read_csv(source, skiprows=skip_rows, low_memory=False)
+    chunks = list(iter_raw_csv(source, skip_rows=skip_rows, chunk_rows=chunk_rows))
+    if chunks:
+        return pd.concat(chunks)
+    # Header only: read it again for the column names
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return pd.read_csv(source, skiprows=skip_rows, nrows=0)
+
+
+def logged_mask(df):
+    """
+    Boolean array: rows with "Logged" in any text column. Only object /
+    string / categorical columns can hold it, and only their distinct
+    values are matched against LOGGED_PATTERN.
+    """
+    mask = np.zeros(len(df), dtype=bool)
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if not (col.dtype == object or pd.api.types.is_string_dtype(col.dtype)
+                or isinstance(col.dtype, pd.CategoricalDtype)):
+            continue
+        codes, uniques = pd.factorize(col)
+        if len(uniques) == 0:
+            continue
+        hit = pd.Series(uniques).astype(str).str.contains(LOGGED_PATTERN, na=False).to_numpy(dtype=bool)
+        if hit.any():
+            mask |= (codes >= 0) & hit[np.maximum(codes, 0)]
+    return mask
+
+
+def filter_logged_rows(df):
+    """
+    Remove rows where any column has the value "Logged" (event rows).
+    R: df[apply(df, 1, function(row) !any(row == "Logged")), , drop = FALSE]
+    """
+    return df[~logged_mask(df)]
+
+
+def parse_raw_filename(file_name):
+    """
+    Station code and logger serial from a raw filename.
+
+    Assumption: filename format is Station_raw_Serial_Date... Campbell files
+    carry the logger model first (Station_raw_CR1000X_3875_...), in which case
+    the serial is the part after it. Returns ("", "") if the pattern is absent.
+    """
+    station, serial = "", ""
+    parts = re.split(r'_raw_', file_name, flags=re.IGNORECASE)
+    if len(parts) > 1:
+        station = parts[0]
+        rest_parts = parts[1].split('_')
+        if len(rest_parts) > 0 and rest_parts[0].upper().startswith('CR'):
+            # CR logger detected - serial is the next part (e.g., '3875')
+            if len(rest_parts) > 1:
+                serial = rest_parts[1]
+        else:
+            # Standard format - serial is the first part
+            serial = rest_parts[0]
+    return station, serial
+
+
+def raw_file_date(file_name):
+    """
+    Date from the raw filename (last segment before extension), or None.
+    e.g. 04MF001_raw_21432485_20240808.csv → 20240808
+    """
+    match = re.search(r'_(\d{8})(?:\.\w+)?$', file_name)
+    return match.group(1) if match else None
+
+
+def guess_columns(df):
+    """
+    Best guess at the timestamp and temperature columns of a raw export
+    (e.g. HOBO "Date-Time (PDT)" / "Temperature (°C)"). Returns (ts_col, wtmp_col),
+    either of which may be None.
+    """
+    ts_col, wtmp_col = None, None
+    for col in df.columns:
+        name = str(col).lower()
+        if ts_col is None and ('date' in name or 'time' in name):
+            ts_col = col
+        elif wtmp_col is None and ('temp' in name or name == 'wtmp'):
+            wtmp_col = col
+    return ts_col, wtmp_col
+
+
+def format_raw(df, timestamp_col, wtmp_col, station_code, logger_serial,
+               utc_offset=0.0, data_id=0, tz_offset=None, format_key=None):
+    """
+    Headless version of "Save Formatted Data": keep the timestamp and
+    temperature columns, rename them to 'timestamp'/'wtmp' and add the
+    metadata columns. If `tz_offset` is given the timestamps are converted to
+    UTC (Local - offset = UTC); `format_key` is the timestamps.parse key
+    of the file (timestamps.pattern_key).
+    """
+    df_selected = df[[timestamp_col, wtmp_col]].copy()
+    df_selected.rename(columns={timestamp_col: 'timestamp', wtmp_col: 'wtmp'}, inplace=True)
+
+    # Sanitize inputs to prevent filename issues
+    station_code = str(station_code).replace("/", "_").replace("\\", "_")
+    logger_serial = str(logger_serial).replace("/", "_").replace("\\", "_")
+
+    df_selected['station_code'] = station_code
+    df_selected['logger_serial'] = logger_serial
+    df_selected['utc_offset'] = utc_offset
+    df_selected['data_id'] = data_id
+
+    if tz_offset is not None:
+        df_selected['timestamp'] = timestamps.parse(df_selected['timestamp'], key=format_key, errors='raise') - pd.Timedelta(hours=tz_offset)
+    return df_selected
+
+
+def list_raw_files(raw_dir):
+    """Raw logger files (.csv/.txt/.xlsx) in a folder, sorted by name."""
+    if not os.path.exists(raw_dir):
+        return []
+    return sorted(f for f in os.listdir(raw_dir) if f.endswith(".csv") or f.endswith(".txt") or f.endswith(".xlsx"))
@@ -0,0 +1,161 @@
+"""
+frame_cache.py
+--------------
+Process-wide LRU cache of loaded DataFrames for file_manager.load_data.
+
+Streamlit reruns the whole page script on every widget interaction, which
+used to re-read and re-parse the same tidy file each time. Entries are keyed
+on (absolute path, file size, mtime) plus the load options, so any change to
+the file on disk is a cache miss. The cache is shared by all sessions in the
+server process and is bounded by MAX_BYTES (least recently used frames are
+evicted first).
+
+Frames are copied on the way in and out: pages modify the frames they load
+(adding 'date' columns, applying edits), which must not leak into the cache.
+
+The same cache also holds computed results shared between sessions (the
+formatted raw file and the QAQC result, see get_shared/put_shared). Those are
+keyed on a content digest of their input plus every option that affects the
+result, so two technicians opening the same raw file with the same visit
+times and parameters reuse one computation. With pandas Copy-on-Write (always
+on from pandas 3) the sessions get shallow copies: one copy of the data in
+memory, and a session modifying its frame copies only what it modifies.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budget for all cached frames together
+MAX_BYTES = 512 * 1024 * 1024
+
+_cache = OrderedDict()  # key -> (df, nbytes, extra)
+_total_bytes = 0
+_lock = threading.Lock()
+
+
+def file_key(path, *options):
+    """Cache key for a file and load options, or None if the file doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns) + tuple(options)
+
+
+def bytes_digest(data):
+    """Content digest of raw file bytes."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def frame_digest(df):
+    """Content digest of a DataFrame (column names, dtypes and values, not the index)."""
+    h = hashlib.sha1()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def content_key(kind, digest, *options):
+    """Cache key for a result computed from content with `digest` and options."""
+    return (kind, digest) + tuple(options)
+
+
+def _copy_on_write():
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except (KeyError, pd.errors.OptionError):
+        return False
+
+
+def _share(df):
+    # Shallow copies only share data safely under Copy-on-Write
+    return df.copy(deep=not _copy_on_write())
+
+
+def get(key):
+    """Copy of the cached frame for `key`, or None."""
+    if key is None:
+        return None
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        _cache.move_to_end(key)
+        df = entry[0]
+    return df.copy()
+
+
+def put(key, df):
+    """Cache a copy of `df`, evicting least recently used frames over the budget."""
+    if df is not None:
+        _store(key, df.copy())
+
+
+def get_shared(key):
+    """(frame, extra) cached by put_shared for `key`, or None. The frame shares its data with the cache."""
+    if key is None:
+        return None
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        _cache.move_to_end(key)
+        df, _, extra = entry
+    return _share(df), extra
+
+
+def put_shared(key, df, extra=None):
+    """
+    Cache a computed result for all sessions; `extra` is kept alongside
+    (e.g. the notes of the run). Returns the frame to keep in the session,
+    which shares its data with the cached one.
+    """
+    if df is None:
+        return df
+    _store(key, _share(df), extra)
+    return _share(df)
+
+
+def _store(key, df, extra=None):
+    global _total_bytes
+    if key is None:
+        return
+    nbytes = int(df.memory_usage(deep=True).sum())
+    if nbytes > MAX_BYTES:
+        return
+    with _lock:
+        if key in _cache:
+            _total_bytes -= _cache.pop(key)[1]
+        _cache[key] = (df, nbytes, extra)
+        _total_bytes += nbytes
+        while _total_bytes > MAX_BYTES and _cache:
+            _, (_, evicted_bytes, _) = _cache.popitem(last=False)
+            _total_bytes -= evicted_bytes
+
+
+def invalidate(path):
+    """Drop every cached frame loaded from `path`."""
+    global _total_bytes
+    abs_path = os.path.abspath(path)
+    with _lock:
+        for key in [k for k in _cache if k[0] == abs_path]:
+            _total_bytes -= _cache.pop(key)[1]
+
+
+def clear():
+    global _total_bytes
+    with _lock:
+        _cache.clear()
+        _total_bytes = 0
+
+
+def stats():
+    """Number of cached frames and their total size in bytes."""
+    with _lock:
+        return {'entries': len(_cache), 'bytes': _total_bytes, 'max_bytes': MAX_BYTES}
@@ -0,0 +1,226 @@
+"""
+jobs.py
+-------
+Background runner for the long QAQC and annual compile runs.
+
+"Run QAQC" and "Compile & Generate Annual Report" used to run inside the
+Streamlit script: a long run blocked the session and a browser refresh threw
+the work away. Now the pages submit a job, which runs on a worker thread of
+this server process, and poll its status on every rerun.
+
+Each job is persisted under `<project>/01_Data/.jobs`:
+
+  <job id>.json            status: kind, label, state, progress message,
+                           notes, error, timestamps and page-specific info
+  <job id>.<name>.parquet  result frames (Parquet, so datetime and
+                           categorical dtypes survive)
+
+Each job's status file is kept on disk so a refreshed or new session can
+list the project's jobs and pick up a finished result.
+
+Result frames are never pickled: the project folder is a shared (OneDrive)
+tree and unpickling a planted file would run arbitrary code. Without
+pyarrow they are only kept in this process's memory.
+
+Job functions run outside any Streamlit session, so they must not use st.*
+or file_manager (which reads the session's project dir); they take a
+`progress(message)` callback and return a dict
+
+  {'frames': {name: DataFrame}, 'notes': [(level, message)], 'info': {...}}
+
+States: queued -> running -> done / failed. A queued or running job that is
+not known to this process (the server was restarted) reads as interrupted.
+"""
+
+import json
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import tidy_store
+
+JOBS_SUBFOLDER = os.path.join("01_Data", ".jobs")
+
+# Jobs running at the same time; further jobs wait in the queue
+MAX_WORKERS = 2
+
+# Finished jobs kept per project (oldest are deleted with their results)
+KEEP_JOBS = 20
+
+ACTIVE_STATES = ("queued", "running")
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="qaqc-job")
+_active = set()  # ids of jobs submitted in this process that haven't finished
+_memory_frames = {}  # job id -> {name: DataFrame}, only used without pyarrow
+_lock = threading.Lock()
+
+
+def jobs_dir(project_dir):
+    return os.path.join(project_dir, JOBS_SUBFOLDER)
+
+
+def _status_path(directory, job_id):
+    return os.path.join(directory, f"{job_id}.json")
+
+
+def _frame_path(directory, job_id, name):
+    return os.path.join(directory, f"{job_id}.{name}.parquet")
+
+
+def _save_frame(df, path):
+    # Arrow can't store object columns holding mixed types, store those as strings
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].astype(str).where(df[col].notna())
+    df.to_parquet(path, engine='pyarrow')
+
+
+def _now():
+    return pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _write_status(directory, status):
+    # Write-then-rename so a polling page never reads a half-written file
+    path = _status_path(directory, status['id'])
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(status, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+def _update(directory, job_id, **changes):
+    with _lock:
+        status = _read_status(directory, job_id)
+        if status is None:
+            return
+        status.update(changes)
+        _write_status(directory, status)
+
+
+def _read_status(directory, job_id):
+    try:
+        with open(_status_path(directory, job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def submit(project_dir, kind, label, func, **info):
+    """
+    Queue func(progress) as a background job. `label` names what it works on
+    (e.g. the file), `info` is stored in the status for the page.
+    Returns the job id.
+    """
+    directory = jobs_dir(project_dir)
+    os.makedirs(directory, exist_ok=True)
+    job_id = f"{kind}_{pd.Timestamp.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    status = {
+        'id': job_id, 'kind': kind, 'label': label, 'state': "queued",
+        'submitted': _now(), 'started': None, 'finished': None,
+        'progress': None, 'notes': [], 'error': None, 'frames': [], 'info': info,
+    }
+    with _lock:
+        _write_status(directory, status)
+        _active.add(job_id)
+    _executor.submit(_run, directory, job_id, func)
+    _prune(project_dir)
+    return job_id
+
+
+def _run(directory, job_id, func):
+    _update(directory, job_id, state="running", started=_now())
+
+    def progress(message):
+        _update(directory, job_id, progress=str(message))
+
+    try:
+        result = func(progress) or {}
+        frames = result.get('frames') or {}
+        if tidy_store.HAS_PARQUET:
+            for name, df in frames.items():
+                _save_frame(df, _frame_path(directory, job_id, name))
+        else:
+            _memory_frames[job_id] = dict(frames)
+        status = _read_status(directory, job_id) or {}
+        info = dict(status.get('info') or {})
+        info.update(result.get('info') or {})
+        _update(directory, job_id, state="done", finished=_now(), frames=list(frames),
+                notes=[list(n) for n in result.get('notes', [])], info=info)
+    except Exception as e:
+        _update(directory, job_id, state="failed", finished=_now(), error=str(e),
+                traceback=traceback.format_exc())
+    finally:
+        with _lock:
+            _active.discard(job_id)
+
+
+def status(project_dir, job_id):
+    """Status dict of a job, or None if it doesn't exist."""
+    with _lock:
+        status = _read_status(jobs_dir(project_dir), job_id)
+        if status is not None and status['state'] in ACTIVE_STATES and job_id not in _active:
+            status['state'] = "interrupted"
+    return status
+
+
+def is_active(status):
+    return status is not None and status['state'] in ACTIVE_STATES
+
+
+def list_jobs(project_dir, kind=None):
+    """Status dicts of the project's jobs, newest first."""
+    directory = jobs_dir(project_dir)
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            s = status(project_dir, name[:-len(".json")])
+            if s is not None and (kind is None or s['kind'] == kind):
+                found.append(s)
+    return sorted(found, key=lambda s: s['submitted'], reverse=True)
+
+
+def load_frames(project_dir, job_id):
+    """Result frames of a finished job as {name: DataFrame}."""
+    s = status(project_dir, job_id)
+    if s is None or s['state'] != "done":
+        return {}
+    if not tidy_store.HAS_PARQUET:
+        return dict(_memory_frames.get(job_id, {}))
+    directory = jobs_dir(project_dir)
+    frames = {}
+    for name in s['frames']:
+        try:
+            frames[name] = pd.read_parquet(_frame_path(directory, job_id, name), engine='pyarrow')
+        except (OSError, ValueError):
+            pass
+    return frames
+
+
+def delete(project_dir, job_id):
+    """Remove a job's status and result files (not while it is running)."""
+    directory = jobs_dir(project_dir)
+    with _lock:
+        if job_id in _active:
+            return False
+        status = _read_status(directory, job_id)
+        paths = [_status_path(directory, job_id)]
+        if status is not None:
+            paths += [_frame_path(directory, job_id, name) for name in status.get('frames', [])]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        _memory_frames.pop(job_id, None)
+    return True
+
+
+def _prune(project_dir):
+    finished = [s for s in list_jobs(project_dir) if not is_active(s)]
+    for s in finished[KEEP_JOBS:]:
+        delete(project_dir, s['id'])
@@ -0,0 +1,369 @@
+"""
+qaqc_engine.py
+--------------
+Streamlit-free QAQC engine.
+
+This is the flagging logic from the "Flag & Compile" page (modules/flag_compile.py)
+pulled out into plain functions so it can be imported by scripts and batch jobs.
+Nothing here touches st.* -- functions that want to tell the user something
+append (level, message) tuples to a `notes` list and the caller decides how
+to show them ('info', 'warning' or 'success').
+
+Typical use:
+    df = prepare_timestamps(df)
+    flagged, notes = run_qaqc(df, visit_in, visit_out)
+    to_tidy(flagged).to_csv(path, index=False)
+"""
+
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from utils import flag_codes, qaqc_kernels, timestamps
+
+
+# Default QAQC thresholds (same values as the locked inputs on the Flag page)
+DEFAULT_PARAMS = {
+    'spike_threshold': 0.8,
+    'roll_diff_threshold': 1.5,
+    'stdev_threshold': 2.0,
+    'min_temp': -20.0,
+    'max_temp': 50.0,
+    'high_temp_threshold': 35.0,
+    'diurnal_threshold': 10.0,
+}
+
+# Standard tidy file columns (NO EXTRA METADATA COLUMNS)
+TIDY_COLUMNS = ['data_id', 'station_code', 'timestamp', 'utc_offset', 'logger_serial', 'wtmp', 'wtmp_flag']
+
+PROCESSING_MODES = ["First Data Set", "Sequential", "Logger Swap"]
+
+# Intermediate statistics older versions of flag_data added to the frame
+# (now computed in utils/qaqc_kernels.py); compact_frame still drops them
+STAT_COLUMNS = ['t_change', 't_change_lead', 'roll_mean_right', 'diff_right',
+                'roll_mean_left', 'diff_left', 'stdev_right', 'stdev_left']
+
+# Lean frames keep wtmp as float32 only if every value has at most this many
+# decimals (and |wtmp| < 1000), so the float32 value still writes out as the
+# same text and widen_wtmp() gets the exact float64 back
+LEAN_DECIMALS = 4
+
+
+def parse_timestamps(series, key=None):
+    """
+    Parse a timestamp column the same way the Flag page does: one explicit
+    format sniffed from the data (or remembered for `key`, see
+    utils/timestamps.py), yearfirst inference with errors='coerce' if no
+    single format fits.
+    """
+    return timestamps.parse(series, key=key)
+
+
+def prepare_timestamps(df, key=None):
+    """Parse 'timestamp' and round it to the nearest 15 minutes to align with the grid."""
+    if 'timestamp' not in df.columns:
+        raise ValueError("Column 'timestamp' not found in file.")
+    df['timestamp'] = parse_timestamps(df['timestamp'], key=key)
+    df['timestamp'] = df['timestamp'].dt.round('15min')
+    return df
+
+
+def default_visit_window(df):
+    """
+    Default field visit times from the data: time out is the last data point
+    recorded, time in is one hour before that. Returns (in, out) strings.
+    """
+    last_ts = df['timestamp'].max()
+    default_out_dt = last_ts
+    default_in_dt = last_ts - pd.Timedelta(hours=1)
+    return default_in_dt.strftime("%Y-%m-%d %H:%M"), default_out_dt.strftime("%Y-%m-%d %H:%M")
+
+
+def _tidy_date_key(f):
+    # Extract date from end of filename (YYYYMMDD, optionally followed by an
+    # overwrite suffix _1, _2 from unique_path), then sort by filename
+    match = re.search(r"_(\d{8})(?:_\d+)?\.csv$", f)
+    date_val = match.group(1) if match else "00000000"
+    return (date_val, f)
+
+
+def find_latest_tidy_file(tidy_files, station, serial, mode="Sequential"):
+    """
+    Pick the most recent historical tidy file for a station.
+
+    Sequential matches Station Code AND Serial Number, Logger Swap matches
+    Station Code only. Returns None if nothing matches (or mode is
+    "First Data Set").
+    """
+    if mode not in ["Sequential", "Logger Swap"] or not station:
+        return None
+
+    if mode == "Logger Swap":
+        # Relaxed: Match Station Code only
+        matching_files = [f for f in tidy_files if f.startswith(f"{station}_tidy_")]
+    else:
+        # Strict: Match Station Code AND Serial Number
+        matching_files = [f for f in tidy_files if f.startswith(f"{station}_tidy_") and str(serial) in f]
+
+    if not matching_files:
+        return None
+    matching_files.sort(key=_tidy_date_key)
+    return matching_files[-1]
+
+
+def pad_missing(df, pad_start=None, pad_interval="15min", notes=None):
+    """
+    Trim or pad the record so it starts at `pad_start`, then fill every
+    missing timestamp on the `pad_interval` grid with an 'M' row.
+    """
+    notes = notes if notes is not None else []
+    df = df.sort_values('timestamp')
+
+    # Determine start/end
+    current_start = df['timestamp'].min()
+    current_end = df['timestamp'].max()
+
+    if pad_start:
+        start_dt = pd.to_datetime(pad_start)
+
+        # TRIM: If start_dt is LATER than current_start, filter out earlier data
+        # This prevents overlap with historical data
+        if start_dt > current_start:
+            notes.append(('info', f"Trimming data before {start_dt} to prevent overlap."))
+            df = df[df['timestamp'] >= start_dt].copy()
+            current_start = start_dt
+
+        # PAD: If start_dt is EARLIER than current_start, extend range
+        elif start_dt < current_start:
+            notes.append(('info', f"Padding data from {start_dt} to {current_start}"))
+            current_start = start_dt
+
+    # Create full range
+    full_range = pd.date_range(start=current_start, end=current_end, freq=pad_interval)
+
+    # Use merge instead of reindex to handle potential duplicates from rounding
+    df_grid = pd.DataFrame({'timestamp': full_range})
+    df = pd.merge(df_grid, df, on='timestamp', how='left')
+
+    # Rows added by the merge have no station_code -> missing ('M')
+    new_rows_mask = df['station_code'].isna()
+    df.loc[new_rows_mask, 'wtmp_flag'] = 'M'
+
+    # Fill metadata for new rows from the first valid row (we might have trimmed)
+    if not df.empty:
+        valid_row = df.dropna(subset=['station_code']).iloc[0]
+        for col in ['station_code', 'utc_offset', 'logger_serial', 'data_id']:
+            if col in df.columns:
+                df[col] = df[col].fillna(valid_row[col])
+    return df
+
+
+def drop_duplicate_timestamps(df, notes=None):
+    """
+    Remove duplicate timestamps, preferring rows with a valid temperature.
+
+    Event rows (button presses, host connects) have no temp and can collide
+    with real readings after rounding to the 15-min grid. NaN-temp rows are
+    sorted last so drop_duplicates keeps the real readings.
+    """
+    notes = notes if notes is not None else []
+    df = df.sort_values(['timestamp', 'wtmp'], na_position='last').reset_index(drop=True)
+    dup_count = df.duplicated(subset=['timestamp'], keep='first').sum()
+    if dup_count > 0:
+        df = df.drop_duplicates(subset=['timestamp'], keep='first').reset_index(drop=True)
+        notes.append(('warning', f"Dropped {dup_count} duplicate timestamp(s)."))
+    return df
+
+
+def flag_data(df, visit_in, visit_out, prev_visit_in=None, prev_visit_out=None, params=None, notes=None, visits=None):
+    """
+    Flag every row. Flags are stored as the integer columns flag_code and
+    flag_bits (utils/flag_codes.py); the wtmp_flag string is only written
+    by to_tidy.
+
+    Standalone flags (M, V, P, E) always appear alone, never concatenated.
+    Priority: V > M > E > P.
+
+    Concatenatable flags (A, B, S, T) can co-occur on the same row, joined
+    alphabetically with ", " (e.g. "S", "B, S", "A, B, S, T"). If a
+    standalone flag applies it wins over any concatenatable flags.
+
+    `visits` (utils/visits.load_visits) adds more field visit windows,
+    flagged V like the current visit.
+    """
+    notes = notes if notes is not None else []
+    p = dict(DEFAULT_PARAMS)
+    if params:
+        p.update(params)
+
+    dt_in = pd.to_datetime(visit_in)
+    dt_out = pd.to_datetime(visit_out)
+
+    # Ensure wtmp is numeric (handle strings/mixed types from bad loads)
+    if 'wtmp' in df.columns:
+        df['wtmp'] = widen_wtmp(pd.to_numeric(df['wtmp'], errors='coerce'))
+
+    # Previous Visit (V) — standalone
+    prev_visit = None
+    prev_note = None
+    if prev_visit_in and prev_visit_out:
+        try:
+            prev_visit = (pd.to_datetime(prev_visit_in), pd.to_datetime(prev_visit_out))
+            prev_note = ('info', f"Applied 'V' flag for previous visit: {prev_visit[0]} to {prev_visit[1]}")
+        except Exception as e:
+            prev_note = ('warning', f"Could not parse Previous Visit times: {e}")
+
+    # All flags in one pass (utils/qaqc_kernels.py, numba when installed):
+    # concatenatable A, B, S, T as flag_bits, standalone E, M, V as flag_code
+    # (priority V > M > E > P; a standalone flag clears the bits)
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]')
+    windows = None
+    if visits is not None and len(visits):
+        windows = (visits['visit_in'].to_numpy(dtype='datetime64[ns]'), visits['visit_out'].to_numpy(dtype='datetime64[ns]'))
+    code, bits, bad_days = qaqc_kernels.flag_arrays(
+        timestamps, df['wtmp'].to_numpy(dtype=np.float64, na_value=np.nan),
+        p, dt_in, dt_out, prev_visit=prev_visit, visits=windows,
+    )
+    if bad_days:
+        notes.append(('warning', f"Flagged {bad_days} days as 'A' (Air/Dewatered) due to diurnal range > {p['diurnal_threshold']}C"))
+    if prev_note:
+        notes.append(prev_note)
+    if windows is not None and df['timestamp'].notna().any():
+        first, last = df['timestamp'].min().to_datetime64(), df['timestamp'].max().to_datetime64()
+        overlapping = int(((windows[0] < last) & (windows[1] > first)).sum())
+        notes.append(('info', f"Applied 'V' flag for {overlapping} field visits from the visits table"))
+
+    df = df.drop(columns=['wtmp_flag'], errors='ignore')
+    df['flag_bits'] = bits
+    df['flag_code'] = code
+
+    return df
+
+
+def widen_wtmp(wtmp):
+    """float64 temperatures; float32 ones from a lean frame are rounded back to their decimal value."""
+    if wtmp.dtype == np.float32:
+        return wtmp.astype(np.float64).round(LEAN_DECIMALS)
+    return wtmp
+
+
+def compact_frame(df):
+    """
+    Memory-lean copy of a formatted/flagged frame for keeping in session
+    state: intermediate statistic columns dropped, metadata and string flag
+    columns as categoricals, and wtmp as float32 when that is lossless
+    (see LEAN_DECIMALS). Flags are always computed in float64.
+    """
+    df = df.drop(columns=[c for c in STAT_COLUMNS if c in df.columns])
+    for col in ['station_code', 'logger_serial', 'wtmp_flag']:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype) \
+                and pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype('category')
+    if 'wtmp' in df.columns:
+        wtmp = pd.to_numeric(df['wtmp'], errors='coerce')
+        if wtmp.dtype == np.float64:
+            values = wtmp.to_numpy()
+            finite = values[~np.isnan(values)]
+            if (np.abs(finite) < 1000).all() and np.array_equal(np.round(finite, LEAN_DECIMALS), finite):
+                wtmp = wtmp.astype(np.float32)
+        df['wtmp'] = wtmp
+    return df
+
+
+def run_qaqc(df, visit_in, visit_out, prev_visit_in=None, prev_visit_out=None,
+             enable_padding=True, pad_start=None, pad_interval="15min", params=None, lean=False, visits=None):
+    """
+    Full QAQC run: padding/trimming, duplicate removal and flag assignment.
+
+    `df` must already have a parsed 'timestamp' column (see prepare_timestamps).
+    With lean=True the result is passed through compact_frame. `visits` is a
+    table of more field visits to flag V (see flag_data).
+    Returns (flagged_df, notes).
+    """
+    notes = []
+
+    # Visit times are validated up front so a bad entry fails before any work
+    pd.to_datetime(visit_in)
+    pd.to_datetime(visit_out)
+
+    # Sort by timestamp
+    df = df.sort_values('timestamp')
+
+    # Apply Padding / Trimming
+    if enable_padding:
+        df = pad_missing(df, pad_start=pad_start, pad_interval=pad_interval, notes=notes)
+
+    # 1. Flag 'N' (Not QAQC'd) - Initialize
+    if 'wtmp_flag' not in df.columns:
+        df['wtmp_flag'] = 'N'
+
+    df = drop_duplicate_timestamps(df, notes=notes)
+
+    # Fill NaNs in flag with 'N' (except 'M's we set during padding)
+    df['wtmp_flag'] = df['wtmp_flag'].fillna('N')
+
+    df = flag_data(df, visit_in, visit_out, prev_visit_in, prev_visit_out, params=params, notes=notes, visits=visits)
+    if lean:
+        df = compact_frame(df)
+    return df, notes
+
+
+def qaqc_metadata(df, visit_in, visit_out, prev_visit_in="", prev_visit_out=""):
+    """Metadata dict used by the Report page (field times and record range)."""
+    return {
+        'field_in': visit_in,
+        'field_out': visit_out,
+        'prev_field_in': prev_visit_in,
+        'prev_field_out': prev_visit_out,
+        'record_start': df['timestamp'].min().strftime("%Y-%m-%d %H:%M:%S"),
+        'record_end': df['timestamp'].max().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def tidy_filename(df, date_str=None):
+    """Filename: Station_tidy_Serial_Date.csv (Date falls back to today)."""
+    station = df['station_code'].iloc[0] if 'station_code' in df.columns else "Unknown"
+    serial = df['logger_serial'].iloc[0] if 'logger_serial' in df.columns else "Unknown"
+
+    # Sanitize filename components to prevent filesystem errors (e.g. if serial is "n/a")
+    station = str(station).replace("/", "_").replace("\\", "_")
+    serial = str(serial).replace("/", "_").replace("\\", "_")
+    date_str = date_str if date_str else pd.Timestamp.now().strftime("%Y%m%d")
+    return f"{station}_tidy_{serial}_{date_str}.csv"
+
+
+def to_tidy(df):
+    """
+    Select the standard tidy columns, format the integer flags as wtmp_flag
+    strings and write "NAN" into wtmp where the flag is 'M' (R-compatible
+    export convention).
+    """
+    if flag_codes.has_codes(df):
+        df = df.assign(wtmp_flag=flag_codes.flag_series(df).astype(object))
+    final_cols = [c for c in TIDY_COLUMNS if c in df.columns]
+    df_to_save = df[final_cols].copy()
+
+    if 'wtmp' in df_to_save.columns:
+        # float32 (lean) temperatures back to their exact float64 values
+        df_to_save['wtmp'] = widen_wtmp(df_to_save['wtmp'])
+
+    if 'wtmp' in df_to_save.columns and 'wtmp_flag' in df_to_save.columns:
+        # Ensure wtmp is object data type so it can hold the string "NAN"
+        df_to_save['wtmp'] = df_to_save['wtmp'].astype(object)
+        m_mask = df_to_save['wtmp_flag'] == 'M'
+        df_to_save.loc[m_mask, 'wtmp'] = "NAN"
+    return df_to_save
+
+
+def unique_path(file_path):
+    """Overwrite protection: append _1, _2, ... until the path is free."""
+    if not os.path.exists(file_path):
+        return file_path
+    base, ext = os.path.splitext(file_path)
+    counter = 1
+    new_file_path = f"{base}_{counter}{ext}"
+    while os.path.exists(new_file_path):
+        counter += 1
+        new_file_path = f"{base}_{counter}{ext}"
+    return new_file_path
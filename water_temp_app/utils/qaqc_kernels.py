@@ -0,0 +1,329 @@
+"""
+qaqc_kernels.py
+---------------
+Array kernels behind qaqc_engine.flag_data.
+
+They work on plain contiguous float64 / int64 NumPy arrays instead of adding
+intermediate columns to the frame.
+
+Daily statistics (the diurnal range for the A flag, the annual page's daily
+means) group rows by an integer day number from the int64 timestamps and
+reduce each day's run with ufunc.reduceat (day_segments / daily_reduce),
+instead of building a column of Python date objects to group on.
+
+spike_mask replaces the pandas statistics flag_data used to keep as columns
+(t_change, t_change_lead, roll_mean_right/left, diff_right/left,
+stdev_right/left). Those were computed with six rolling passes, two of them
+on reversed copies of the series.
+
+flag_arrays computes every flag of a record (spike, range, ice, threshold,
+diurnal, missing; visit windows come in as row masks from utils/visits.py)
+and returns the integer flag_code / flag_bits columns (utils/flag_codes.py).
+When numba is installed this is one JIT-compiled loop over the rows (plus
+one for the daily ranges), which matters for multi-year batch re-QAQC runs
+after threshold changes. Without numba the same flags come from NumPy array
+operations. Both paths do the same floating-point operations in the same
+order, so their results are bit-identical.
+
+numba is optional. Without it HAS_NUMBA is False.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from utils import flag_codes
+from utils.visits import visit_mask
+
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Rolling-mean window of the spike test (rows, centred left and right)
+SPIKE_WINDOW = 5
+
+NS_PER_DAY = 86_400 * 10**9
+NAT = np.iinfo(np.int64).min
+
+# Flag values as plain ints (numba treats module globals as constants)
+BIT_A = flag_codes.FLAG_BITS['A']
+BIT_B = flag_codes.FLAG_BITS['B']
+BIT_S = flag_codes.FLAG_BITS['S']
+BIT_T = flag_codes.FLAG_BITS['T']
+CODE_P = flag_codes.FLAG_CODES['P']
+CODE_M = flag_codes.FLAG_CODES['M']
+CODE_V = flag_codes.FLAG_CODES['V']
+CODE_E = flag_codes.FLAG_CODES['E']
+
+
+def spike_mask(wtmp, spike_threshold, roll_diff_threshold, stdev_threshold, window=SPIKE_WINDOW):
+    """
+    Boolean spike (S) mask of a temperature array. A row is a spike if any of
+
+      |x[i] - x[i-1]|, |x[i] - x[i+1]|            >= spike_threshold
+      |x[i] - mean(x[i-4..i])|, |x[i] - mean(x[i..i+4])| >= roll_diff_threshold
+      std(x[i-1], x[i]), std(x[i], x[i+1])         >= stdev_threshold
+
+    with the same missing-value rules as the pandas version: differences
+    next to a NaN count as 0, means skip NaNs (min_periods=1), and a 2-point
+    SD needs both values.
+    """
+    x = np.ascontiguousarray(wtmp, dtype=np.float64)
+    n = len(x)
+    mask = np.zeros(n, dtype=bool)
+    if n == 0:
+        return mask
+    valid = ~np.isnan(x)
+
+    # Neighbour differences, shared by the difference and 2-point SD tests:
+    # step[i] is |x[i-1] - x[i]|, step[0] and step[n] are the missing ends
+    step = np.full(n + 1, np.nan)
+    step[1:-1] = np.abs(x[1:] - x[:-1])
+
+    # Forward / backward difference (NaN -> 0, like diff().abs().fillna(0))
+    change = np.where(np.isnan(step), 0.0, step)
+    mask |= change[:-1] >= spike_threshold
+    mask |= change[1:] >= spike_threshold
+
+    # 2-point sample SD (ddof=1) of neighbours is |difference| / sqrt(2)
+    sd = step / np.sqrt(2.0)
+    mask |= sd[:-1] >= stdev_threshold
+    mask |= sd[1:] >= stdev_threshold
+
+    # Rolling sums and counts of valid values from shifted views of a
+    # zero-padded copy: sums[j] covers padded[j..j+window-1], so row i's
+    # trailing window is sums[i] and its leading window sums[i + pad]
+    pad = window - 1
+    padded = np.zeros(n + 2 * pad)
+    padded[pad:pad + n] = np.where(valid, x, 0.0)
+    counted = np.zeros(n + 2 * pad)
+    counted[pad:pad + n] = valid
+    sums = np.zeros(n + pad)
+    counts = np.zeros(n + pad)
+    for k in range(window):
+        sums += padded[k:k + n + pad]
+        counts += counted[k:k + n + pad]
+
+    # A valid row is in both of its windows, so counts there are >= 1;
+    # NaN rows give NaN deviations and never flag
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mask |= np.abs(x - sums[:n] / counts[:n]) >= roll_diff_threshold
+        mask |= np.abs(x - sums[pad:] / counts[pad:]) >= roll_diff_threshold
+    return mask
+
+
+def day_segments(ts):
+    """
+    Group int64 ns timestamps by calendar day without date objects.
+
+    Returns (day, rows, starts, days):
+      day    : day number per row, 0..n_days-1 (-1 for NaT)
+      rows   : positions of the non-NaT rows, sorted by day
+      starts : where each day's run begins in `rows` (for ufunc.reduceat)
+      days   : the days as datetime64[D]
+    Sorted records (the usual case) skip the sort.
+    """
+    keys = np.where(ts != NAT, ts // NS_PER_DAY, NAT)
+    rows = np.flatnonzero(keys != NAT)
+    ordered = keys[rows]
+    if len(ordered) > 1 and (ordered[1:] < ordered[:-1]).any():
+        rows = rows[np.argsort(ordered, kind='stable')]
+        ordered = keys[rows]
+    new_day = np.empty(len(ordered), dtype=bool)
+    new_day[:1] = True
+    new_day[1:] = ordered[1:] != ordered[:-1]
+    starts = np.flatnonzero(new_day)
+    day = np.full(len(ts), -1, dtype=np.int64)
+    day[rows] = np.cumsum(new_day) - 1
+    return day, rows, starts, ordered[starts].astype('datetime64[D]')
+
+
+def segment_reduce(values, rows, starts, stat):
+    """
+    Per-day 'mean', 'max', 'min' or 'range' (max - min) of float values over
+    day_segments' rows/starts, ignoring NaN like a pandas groupby (NaN for a
+    day without values).
+    """
+    x = np.asarray(values, dtype=np.float64)[rows]
+    if not len(starts):
+        return np.empty(0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if stat == 'mean':
+            valid = ~np.isnan(x)
+            return np.add.reduceat(np.where(valid, x, 0.0), starts) / np.add.reduceat(valid.astype(np.int64), starts)
+        high = np.fmax.reduceat(x, starts)
+        low = np.fmin.reduceat(x, starts)
+    if stat == 'max':
+        return high
+    if stat == 'min':
+        return low
+    if stat == 'range':
+        return high - low
+    raise ValueError(f"Unknown daily statistic: {stat}")
+
+
+def daily_reduce(timestamps, values, stat="mean"):
+    """
+    (days, result): a daily statistic of `values` (see segment_reduce) per
+    calendar day of `timestamps` (datetime64, NaT rows skipped). Days come
+    out sorted, as datetime64[D].
+    """
+    ts = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+    _, rows, starts, days = day_segments(ts)
+    return days, segment_reduce(values, rows, starts, stat)
+
+
+def _flag_numpy(x, day, rows, starts, n_days, in_visit, in_prev,
+                spike_threshold, roll_diff_threshold, stdev_threshold,
+                min_temp, max_temp, high_temp_threshold, diurnal_threshold):
+    n = len(x)
+    missing = np.isnan(x)
+
+    # Diurnal range per day (NaN temperatures and NaT rows ignored)
+    bad_day = segment_reduce(x, rows, starts, 'range') > diurnal_threshold
+    diurnal = np.zeros(n, dtype=bool)
+    diurnal[day >= 0] = bad_day[day[day >= 0]]
+
+    bits = np.zeros(n, dtype=np.uint8)
+    bits[diurnal] |= BIT_A
+    bits[x < 0.0] |= BIT_B
+    bits[spike_mask(x, spike_threshold, roll_diff_threshold, stdev_threshold)] |= BIT_S
+    bits[x >= high_temp_threshold] |= BIT_T
+
+    # Standalone codes, later ones win: E, M, V, then previous-visit V on non-M rows
+    code = np.full(n, CODE_P, dtype=np.uint8)
+    code[(x < min_temp) | (x > max_temp)] = CODE_E
+    code[missing] = CODE_M
+    code[in_visit] = CODE_V
+    code[in_prev & (code != CODE_M)] = CODE_V
+    bits[code != CODE_P] = 0
+    return code, bits, int(bad_day.sum())
+
+
+def _flag_loop(x, day, rows, starts, n_days, in_visit, in_prev,
+               spike_threshold, roll_diff_threshold, stdev_threshold,
+               min_temp, max_temp, high_temp_threshold, diurnal_threshold):
+    # Same flags as _flag_numpy, row by row; compiled with numba.njit when
+    # numba is installed. Keep the arithmetic in the order _flag_numpy and
+    # spike_mask use, so both give bit-identical results (rows/starts are
+    # only used by _flag_numpy; day max/min don't depend on the order).
+    n = len(x)
+    window = SPIKE_WINDOW
+    pad = window - 1
+    root2 = math.sqrt(2.0)
+
+    day_max = np.full(n_days, -np.inf)
+    day_min = np.full(n_days, np.inf)
+    seen = np.zeros(n_days, dtype=np.bool_)
+    for i in range(n):
+        d = day[i]
+        if d >= 0 and not np.isnan(x[i]):
+            seen[d] = True
+            if x[i] > day_max[d]:
+                day_max[d] = x[i]
+            if x[i] < day_min[d]:
+                day_min[d] = x[i]
+    bad_day = np.zeros(n_days, dtype=np.bool_)
+    bad_days = 0
+    for d in range(n_days):
+        if seen[d] and day_max[d] - day_min[d] > diurnal_threshold:
+            bad_day[d] = True
+            bad_days += 1
+
+    code = np.empty(n, dtype=np.uint8)
+    bits = np.empty(n, dtype=np.uint8)
+    for i in range(n):
+        xi = x[i]
+        missing = np.isnan(xi)
+
+        # Spike: neighbour differences (NaN -> 0), 2-point SDs, rolling means
+        back = abs(xi - x[i - 1]) if i > 0 else np.nan
+        ahead = abs(x[i + 1] - xi) if i + 1 < n else np.nan
+        spike = ((0.0 if np.isnan(back) else back) >= spike_threshold
+                 or (0.0 if np.isnan(ahead) else ahead) >= spike_threshold
+                 or back / root2 >= stdev_threshold
+                 or ahead / root2 >= stdev_threshold)
+        if not spike and not missing:
+            for start in (i - pad, i):
+                total = 0.0
+                count = 0.0
+                for j in range(start, start + window):
+                    if 0 <= j < n and not np.isnan(x[j]):
+                        total += x[j]
+                        count += 1.0
+                if abs(xi - total / count) >= roll_diff_threshold:
+                    spike = True
+
+        b = 0
+        if day[i] >= 0 and bad_day[day[i]]:
+            b |= BIT_A
+        if xi < 0.0:
+            b |= BIT_B
+        if spike:
+            b |= BIT_S
+        if xi >= high_temp_threshold:
+            b |= BIT_T
+
+        c = CODE_P
+        if xi < min_temp or xi > max_temp:
+            c = CODE_E
+        if missing:
+            c = CODE_M
+        if in_visit[i]:
+            c = CODE_V
+        if in_prev[i] and c != CODE_M:
+            c = CODE_V
+        code[i] = c
+        bits[i] = b if c == CODE_P else 0
+    return code, bits, bad_days
+
+
+if HAS_NUMBA:
+    _flag_loop = numba.njit(cache=True)(_flag_loop)
+
+
+def flag_arrays(timestamps, wtmp, params, visit_in, visit_out, prev_visit=None, visits=None, use_numba=None):
+    """
+    Integer flags of a record: (flag_code, flag_bits, number of diurnal 'A' days).
+
+    timestamps : datetime64 values (any unit; NaT allowed)
+    wtmp       : temperatures, NaN for missing
+    params     : thresholds, keys as qaqc_engine.DEFAULT_PARAMS
+    visit_in/visit_out : current visit window (in, out], flagged V
+    prev_visit : optional (in, out) of the previous visit, flagged V except M rows
+    visits     : optional (ins, outs) of more visit windows (a visits table,
+                 utils/visits.py), flagged like the current visit
+    use_numba  : None = numba when installed, False = the NumPy path
+    """
+    times = np.asarray(timestamps, dtype='datetime64[ns]')
+    ts = np.ascontiguousarray(times.view(np.int64))
+    x = np.ascontiguousarray(wtmp, dtype=np.float64)
+    day, rows, starts, days = day_segments(ts)
+
+    # Visit windows as row masks (sorted windows + searchsorted)
+    ins = [pd.Timestamp(visit_in).to_datetime64()]
+    outs = [pd.Timestamp(visit_out).to_datetime64()]
+    if visits is not None:
+        ins += list(visits[0])
+        outs += list(visits[1])
+    in_visit = visit_mask(times, np.array(ins, dtype='datetime64[ns]'), np.array(outs, dtype='datetime64[ns]'))
+    if prev_visit is not None:
+        in_prev = visit_mask(times, np.array([prev_visit[0]], dtype='datetime64[ns]'),
+                             np.array([prev_visit[1]], dtype='datetime64[ns]'))
+    else:
+        in_prev = np.zeros(len(ts), dtype=bool)
+
+    args = (
+        x, day, rows, starts, len(days), in_visit, in_prev,
+        float(params['spike_threshold']), float(params['roll_diff_threshold']), float(params['stdev_threshold']),
+        float(params['min_temp']), float(params['max_temp']),
+        float(params['high_temp_threshold']), float(params['diurnal_threshold']),
+    )
+    if use_numba is None:
+        use_numba = HAS_NUMBA
+    if use_numba and HAS_NUMBA:
+        return _flag_loop(*args)
+    return _flag_numpy(*args)
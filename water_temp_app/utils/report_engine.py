@@ -0,0 +1,274 @@
+"""
+report_engine.py
+----------------
+Streamlit-free pieces of the "Generate Report" page (modules/report.py):
+the flag summary table, the time series figure and the QAQC report HTML.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils import downsample, flag_codes
+
+
+# Marker colours per flag (shared by the QAQC plots)
+FLAG_COLORS = {
+    'P': 'green', 'S': 'red', 'E': 'purple',
+    'T': 'orange', 'B': 'blue', 'M': 'darkred', 'V': 'pink',
+    'N': 'gray', 'A': 'black'
+}
+
+FLAG_NAMES = {
+    'P': 'Pass',
+    'N': 'No QAQC',
+    'B': 'Below ice',
+    'S': 'Spike',
+    'E': 'Outside sensor limits',
+    'T': 'Above threshold 35',
+    'M': 'Missing value',
+    'V': 'Visit',
+    'A': 'Air/Dewatered'
+}
+
+# User example order: P, N, B, S, E, T, D, M, V, A
+FLAG_ORDER = ['P', 'N', 'B', 'S', 'E', 'T', 'M', 'V', 'A']
+
+
+def resolve_flag_name(symbol):
+    """Flag name, including concatenated flags (e.g. "A, S" → "Air/Dewatered + Spike")."""
+    if symbol in FLAG_NAMES:
+        return FLAG_NAMES[symbol]
+    # Split on comma/space separators, then look up each flag
+    individual_flags = [f.strip() for f in str(symbol).replace(',', ' ').split() if f.strip()]
+    parts = [FLAG_NAMES.get(f, f) for f in individual_flags]
+    if parts:
+        return ' + '.join(parts)
+    return 'Unknown'
+
+
+# "WebGL" draws all flags in one Scattergl marker trace (fast for long
+# records); "SVG" is the classic one-trace-per-flag figure
+RENDER_MODES = ["WebGL", "SVG"]
+
+
+def flag_style(flag):
+    """(colour, marker symbol) for a flag; concatenated flags (e.g. "A, S") are brown diamonds."""
+    if ',' in str(flag):
+        return 'brown', 'diamond'
+    return FLAG_COLORS.get(flag, 'black'), 'circle'
+
+
+def build_timeseries_figure(df, title, max_points=None, method="minmax", hovermode="closest",
+                            render="SVG", show_line=True):
+    """
+    Gray line for all data plus markers coloured by flag.
+
+    With max_points the line is downsampled (see utils/downsample.py); every
+    non-P point is still drawn. render="WebGL" uses Scattergl and puts all
+    flags in one marker trace coloured by flag code (a second one for the
+    diamond combo markers); legend entries are empty placeholder traces.
+    render="SVG" adds one marker trace per flag.
+    """
+    fig = go.Figure()
+    line_df, marker_df = downsample.plot_frames(df, max_points, method)
+    line_name = 'Temperature' if len(line_df) == len(df) else f'Temperature ({len(line_df)} of {len(df)} points)'
+    scatter = go.Scattergl if render == "WebGL" else go.Scatter
+
+    # 1. Add Line (All data) - Gray background line for connectivity
+    if show_line:
+        fig.add_trace(scatter(
+            x=line_df['timestamp'],
+            y=line_df['wtmp'],
+            mode='lines',
+            name=line_name,
+            line=dict(color='gray', width=1),
+            hoverinfo='skip' # Skip hover on the line, focus on points
+        ))
+
+    # 2. Add markers for each flag type present in the data
+    if render == "WebGL":
+        # Category codes + labels, so styles are looked up once per distinct flag
+        flags = flag_codes.flag_categorical(marker_df)
+        if flags.isna().any():
+            flags = flags.add_categories(['NA']).fillna('NA')
+        codes, categories = flags.codes, [str(c) for c in flags.categories]
+        styles = [flag_style(flag) for flag in categories]
+        # Numeric colour array (one discrete colorscale stop per flag)
+        # validates and serialises much faster than per-point colour names
+        if len(categories) > 1:
+            last = len(categories) - 1
+            color = codes
+            colorscale = [[i / last, c] for i, (c, _) in enumerate(styles)]
+        else:
+            color, colorscale = (styles[0][0] if styles else 'black'), None
+        # Per-point symbol arrays are slow to validate: one trace per marker
+        # symbol instead (circles, plus diamonds for concatenated flags)
+        point_symbols = np.array([sym for _, sym in styles], dtype=object)[codes] if len(codes) else codes
+        for symbol in dict.fromkeys(sym for _, sym in styles):
+            on = point_symbols == symbol
+            fig.add_trace(go.Scattergl(
+                x=marker_df['timestamp'][on],
+                y=marker_df['wtmp'][on],
+                mode='markers',
+                name='Flags',
+                showlegend=False,
+                customdata=np.array(categories, dtype=str)[codes[on]],
+                hovertemplate="%{x}<br>%{y}<br>Flag: %{customdata}<extra></extra>",
+                marker=dict(color=color[on] if colorscale else color, colorscale=colorscale,
+                            cmin=0, cmax=max(len(categories) - 1, 1), showscale=False,
+                            symbol=symbol, size=6)
+            ))
+        # Legend only: one empty trace per flag present
+        for flag, (color, symbol) in zip(categories, styles):
+            fig.add_trace(go.Scattergl(
+                x=[None], y=[None], mode='markers', name=f"Flag: {flag}",
+                marker=dict(color=color, size=6, symbol=symbol)
+            ))
+    else:
+        for flag, subset in marker_df.groupby(flag_codes.flag_series(marker_df), sort=False, observed=True, dropna=False):
+            color, symbol = flag_style(flag)
+            fig.add_trace(go.Scatter(
+                x=subset['timestamp'],
+                y=subset['wtmp'],
+                mode='markers',
+                name=f"Flag: {flag}",
+                marker=dict(color=color, size=6, symbol=symbol)
+            ))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title="Timestamp",
+        yaxis_title="Water Temperature",
+        hovermode=hovermode
+    )
+    return fig
+
+
+def flag_summary(df):
+    """Flag counts/proportions with every standard flag present (0 if absent)."""
+    total_records = len(df)
+    flag_counts = flag_codes.flag_series(df).value_counts().reset_index()
+    flag_counts.columns = ['flag_symbol', 'flag_count']
+
+    flag_counts['flag_name'] = flag_counts['flag_symbol'].apply(resolve_flag_name)
+    flag_counts['flag_prop'] = (flag_counts['flag_count'] / total_records) * 100
+
+    # Ensure all standard flags are present even if count is 0
+    for sym, name in FLAG_NAMES.items():
+        if sym not in flag_counts['flag_symbol'].values:
+            new_row = pd.DataFrame({'flag_symbol': [sym], 'flag_count': [0], 'flag_name': [name], 'flag_prop': [0.0]})
+            flag_counts = pd.concat([flag_counts, new_row], ignore_index=True)
+
+    flag_counts['order'] = flag_counts['flag_symbol'].map({k: i for i, k in enumerate(FLAG_ORDER)})
+    return flag_counts.sort_values('order').drop(columns=['order'])
+
+
+def flag_table_html(flag_counts):
+    table_html = """
+    <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; width: 50%;">
+    <thead>
+        <tr style="background-color: #f2f2f2;">
+            <th>flag_symbol</th>
+            <th>flag_name</th>
+            <th>flag_count</th>
+            <th>flag_prop</th>
+        </tr>
+    </thead>
+    <tbody>
+    """
+    for _, row in flag_counts.iterrows():
+        table_html += f"""
+        <tr>
+            <td style="text-align: center;">{row['flag_symbol']}</td>
+            <td>{row['flag_name']}</td>
+            <td style="text-align: right;">{row['flag_count']}</td>
+            <td style="text-align: right;">{row['flag_prop']:.9f}</td>
+        </tr>
+        """
+    table_html += "</tbody></table>"
+    return table_html
+
+
+def _meta_value(metadata, key):
+    value = metadata.get(key)
+    return "N/A" if value is None else value
+
+
+def build_report_html(df, fig, metadata=None, notes="No notes entered in session."):
+    """
+    Full QAQC report HTML. `metadata` holds field_in/field_out/prev_field_in/
+    prev_field_out/record_start/record_end (missing entries show as N/A or
+    the record range).
+    """
+    metadata = metadata or {}
+    station = df['station_code'].iloc[0] if 'station_code' in df.columns else "Unknown"
+    serial = df['logger_serial'].iloc[0] if 'logger_serial' in df.columns else "Unknown"
+    utc_offset = df['utc_offset'].iloc[0] if 'utc_offset' in df.columns else "Unknown"
+    data_id = df['data_id'].iloc[0] if 'data_id' in df.columns else "Unknown"
+    record_start = metadata.get('record_start') or df['timestamp'].min().strftime("%Y-%m-%d %H:%M:%S")
+    record_end = metadata.get('record_end') or df['timestamp'].max().strftime("%Y-%m-%d %H:%M:%S")
+
+    metadata_html = f"""
+    <h3>Metadata</h3>
+    <p>
+    <b>Station Code:</b> {station}<br>
+    <b>Logger Serial Number:</b> {serial}<br>
+    <b>UTC Offset:</b> {utc_offset}<br>
+    <b>Data ID:</b> {data_id}<br>
+    <b>Field time-in:</b> {_meta_value(metadata, 'field_in')}<br>
+    <b>Field time-out:</b> {_meta_value(metadata, 'field_out')}<br>
+    <b>Previous field time-in:</b> {_meta_value(metadata, 'prev_field_in')}<br>
+    <b>Previous field time-out:</b> {_meta_value(metadata, 'prev_field_out')}<br>
+    <b>Record Start Date:</b> {record_start}<br>
+    <b>Record End Date:</b> {record_end}
+    </p>
+    """
+
+    if flag_codes.has_flags(df):
+        table_html = flag_table_html(flag_summary(df))
+    else:
+        table_html = "<p>No flag data available.</p>"
+
+    plot_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
+
+    return f"""
+    <html>
+    <head><title>QAQC Report - {station}</title></head>
+    <body style="font-family: Arial, sans-serif; margin: 40px;">
+        <h1>Water Temperature QAQC Report</h1>
+        <hr>
+        {metadata_html}
+        <hr>
+        <h3>Flag Summary</h3>
+        {table_html}
+        <hr>
+        <h3>Time Series Plot</h3>
+        {plot_html}
+        <hr>
+        <h3>QAQC Notes</h3>
+        <p>{notes}</p>
+    </body>
+    </html>
+    """
+
+
+def report_filename(df, date_str=None):
+    """
+    Format: {station_id}_qaqcReport_{logger_serial}_{YYYYMMDD}.html
+    Example: 01FW002_qaqcReport_21731701_20250704.html
+    """
+    station = df['station_code'].iloc[0] if 'station_code' in df.columns else "Unknown"
+    serial = df['logger_serial'].iloc[0] if 'logger_serial' in df.columns else "Unknown"
+    date_str = date_str if date_str else pd.Timestamp.now().strftime("%Y%m%d")
+    return f"{station}_qaqcReport_{serial}_{date_str}.html"
+
+
+def write_report(html, project_dir, report_name):
+    """Write report HTML to 03_Reports/02_QAQC under the project dir and return the path."""
+    report_path = os.path.join(project_dir, "03_Reports", "02_QAQC", report_name)
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, "w") as f:
+        f.write(html)
+    return report_path
@@ -0,0 +1,244 @@
+"""
+tidy_store.py
+-------------
+Optional Parquet (Arrow) copy of tidy / compiled files.
+
+The CSV in 01_Data/02_Tidy (or 03_Compiled) stays the R-compatible export.
+Next to it we keep `<name>.parquet` with proper types: datetime64 timestamps,
+float wtmp (the "NAN" strings become real NaN), and categorical flags and
+metadata. Reading the Parquet copy skips all CSV parsing, only loads the
+columns asked for, and uses the row group timestamp statistics to skip data
+outside a requested time range.
+
+pyarrow is optional. Without it HAS_PARQUET is False and everything falls
+back to the CSV.
+"""
+
+import csv
+import io
+import os
+import pandas as pd
+
+from utils import timestamps
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# Folders that get a Parquet copy next to the CSV
+COLUMNAR_SUBFOLDERS = ("01_Data/02_Tidy", "01_Data/03_Compiled")
+
+# Columns stored as pandas categoricals (few distinct values repeated on every row)
+CATEGORICAL_COLUMNS = ['station_code', 'logger_serial', 'wtmp_flag']
+
+# Rows per Parquet row group; each group keeps min/max timestamp statistics
+ROW_GROUP_SIZE = 50_000
+
+
+def parquet_path(csv_path):
+    """Path of the Parquet copy for a CSV (same folder, .parquet extension)."""
+    base, _ = os.path.splitext(csv_path)
+    return base + ".parquet"
+
+
+def is_fresh(csv_path):
+    """
+    True if a Parquet copy exists and is at least as new as the CSV.
+    A CSV edited outside the app (e.g. in Excel) makes the copy stale.
+    """
+    pq_path = parquet_path(csv_path)
+    if not HAS_PARQUET or not os.path.exists(pq_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(pq_path) >= os.path.getmtime(csv_path)
+
+
+def typed_tidy(df):
+    """
+    Coerce a tidy frame to its in-memory types: datetime timestamps,
+    numeric wtmp ("NAN" -> NaN) and categorical flag/metadata columns.
+    """
+    df = df.copy()
+    if 'timestamp' in df.columns:
+        df['timestamp'] = timestamps.parse(df['timestamp'], key=timestamps.TIDY_KEY)
+    if 'wtmp' in df.columns:
+        df['wtmp'] = pd.to_numeric(df['wtmp'], errors='coerce')
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).where(df[col].notna()).astype('category')
+    # Arrow can't store object columns holding mixed types (e.g. data_id
+    # 174.0 next to "174.175" from compiled files), store those as strings
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].astype(str).where(df[col].notna())
+    return df
+
+
+def write_parquet(df, csv_path):
+    """Write the typed Parquet copy for `csv_path`. Returns its path, or None without pyarrow."""
+    if not HAS_PARQUET:
+        return None
+    pq_path = parquet_path(csv_path)
+    typed = typed_tidy(df)
+    if 'timestamp' in typed.columns and not typed['timestamp'].is_monotonic_increasing:
+        # Row group statistics only prune well on time-sorted data
+        typed = typed.sort_values('timestamp', kind='stable')
+    typed.to_parquet(pq_path, engine='pyarrow', index=False, row_group_size=ROW_GROUP_SIZE)
+    return pq_path
+
+
+def read_parquet(csv_path, columns=None, start=None, end=None):
+    """
+    Read the Parquet copy for `csv_path`.
+
+    columns    : only load these columns (projection)
+    start, end : only load rows with start <= timestamp <= end (pushed down
+                 to row groups, then applied exactly)
+    """
+    filters = []
+    if start is not None:
+        filters.append(('timestamp', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('timestamp', '<=', pd.Timestamp(end)))
+    return pd.read_parquet(parquet_path(csv_path), engine='pyarrow', columns=columns,
+                           filters=filters or None)
+
+
+# Bytes read from the end of a CSV per attempt when looking for its last rows
+TAIL_BYTES = 64 * 1024
+
+
+def _parquet_time_range(pq_path):
+    """(first, last) timestamp from the row group statistics in the Parquet footer."""
+    import pyarrow.parquet as pq
+    meta = pq.ParquetFile(pq_path).metadata
+    col = meta.schema.to_arrow_schema().get_field_index('timestamp')
+    if col < 0:
+        return None, None
+    lows, highs = [], []
+    for i in range(meta.num_row_groups):
+        stats = meta.row_group(i).column(col).statistics
+        if stats is None or not stats.has_min_max:
+            # No statistics: read just the timestamp column
+            ts = pd.read_parquet(pq_path, engine='pyarrow', columns=['timestamp'])['timestamp']
+            return (ts.min(), ts.max()) if len(ts) else (None, None)
+        lows.append(pd.Timestamp(stats.min))
+        highs.append(pd.Timestamp(stats.max))
+    if not lows:
+        return None, None
+    return min(lows), max(highs)
+
+
+def _csv_rows(lines, ts_index):
+    """Parsed timestamps of CSV data lines (unparseable or short lines are skipped)."""
+    values = []
+    for row in csv.reader(io.StringIO("\n".join(lines))):
+        if len(row) > ts_index:
+            values.append(row[ts_index])
+    return timestamps.parse(pd.Series(values, dtype=object), key=timestamps.TIDY_KEY).dropna()
+
+
+def _csv_time_range(csv_path):
+    """(first, last) timestamp of a time-sorted CSV from its first and last lines only."""
+    with open(csv_path, 'rb') as f:
+        header = f.readline().decode('utf-8-sig').strip()
+        if not header:
+            return None, None
+        names = next(csv.reader([header]))
+        if 'timestamp' not in names:
+            return None, None
+        ts_index = names.index('timestamp')
+        data_start = f.tell()
+        first_ts = _csv_rows([f.readline().decode('utf-8', 'replace').strip()], ts_index)
+
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        block = TAIL_BYTES
+        while True:
+            start = max(data_start, size - block)
+            f.seek(start)
+            tail = f.read(size - start).decode('utf-8', 'replace').splitlines()
+            if start > data_start and tail:
+                # First line of the block is (probably) cut off
+                tail = tail[1:]
+            last_ts = _csv_rows([line for line in tail if line.strip()][-5:], ts_index)
+            if len(last_ts) or start == data_start:
+                break
+            block *= 4
+    first = first_ts.iloc[0] if len(first_ts) else None
+    last = last_ts.max() if len(last_ts) else None
+    return first, last
+
+
+def time_range(csv_path):
+    """
+    (first, last) timestamp of a tidy/compiled file without loading it:
+    Parquet footer statistics when the copy is fresh, otherwise the first
+    line and the last few lines of the CSV. Tidy and compiled files are
+    written time-sorted; for a CSV sorted differently elsewhere use
+    load_tidy(..., columns=['timestamp']) instead. (None, None) if the file
+    has no rows or no timestamp column.
+    """
+    if is_fresh(csv_path):
+        try:
+            return _parquet_time_range(parquet_path(csv_path))
+        except Exception:
+            # Unreadable copy (e.g. interrupted write) - fall back to the CSV
+            pass
+    if not os.path.exists(csv_path):
+        return None, None
+    return _csv_time_range(csv_path)
+
+
+def filter_range(df, start=None, end=None):
+    """Apply the same timestamp range as read_parquet to an in-memory frame."""
+    if 'timestamp' not in df.columns or (start is None and end is None):
+        return df
+    ts = timestamps.parse(df['timestamp'], key=timestamps.TIDY_KEY)
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= ts >= pd.Timestamp(start)
+    if end is not None:
+        mask &= ts <= pd.Timestamp(end)
+    return df[mask]
+
+
+def load_tidy(csv_path, columns=None, start=None, end=None):
+    """
+    Load a tidy/compiled file by path: the Parquet copy when fresh, otherwise
+    the CSV. Returns None if neither exists.
+    """
+    if is_fresh(csv_path):
+        try:
+            return read_parquet(csv_path, columns=columns, start=start, end=end)
+        except Exception:
+            # Unreadable copy (e.g. interrupted write) - fall back to the CSV
+            pass
+    if not os.path.exists(csv_path):
+        return None
+    df = pd.read_csv(csv_path, usecols=columns)
+    return filter_range(df, start, end)
+
+
+def iter_tidy(csv_path, chunk_rows=ROW_GROUP_SIZE):
+    """
+    Yield a tidy/compiled file in chunks of about `chunk_rows` rows, from the
+    Parquet copy when fresh, otherwise from the CSV.
+    """
+    if is_fresh(csv_path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(parquet_path(csv_path)).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        yield chunk
+
+
+def remove_parquet(csv_path):
+    """Delete a (stale) Parquet copy if present."""
+    pq_path = parquet_path(csv_path)
+    if os.path.exists(pq_path):
+        os.remove(pq_path)
@@ -0,0 +1,133 @@
+"""
+timestamps.py
+-------------
+Shared timestamp parsing for raw, formatted and tidy files.
+
+Timestamps used to be parsed differently on every page: yearfirst inference
+on the Format page, a chain of two explicit formats plus inference on the
+Flag page, bare pd.to_datetime on Review / Report / Annual. Inference parses
+a large column element by element and can read the same text differently
+from file to file.
+
+parse() sniffs the format from a small sample of the column (first match in
+FORMATS, year-first before month-first like the yearfirst=True inference it
+replaces) and then parses the whole column once with that explicit format.
+The format is remembered per key (a logger file pattern, see pattern_key, or
+TIDY_KEY for the app's own files), so the next file of the same pattern goes
+straight to the explicit parse; a remembered format that doesn't fit a new
+file is sniffed again. Columns no single format fits fall back to yearfirst
+inference, value by value.
+
+Known formats live in this server process (like frame_cache), so they are
+shared by all sessions and by every file of a batch run.
+"""
+
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Candidate formats in order of preference; the first one that parses the
+# whole sample wins. Year-first before month-first before day-first.
+FORMATS = [
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S',
+    '%Y/%m/%d %H:%M:%S', '%Y/%m/%d %H:%M',
+    '%y-%m-%d %H:%M:%S', '%y-%m-%d %H:%M', '%y/%m/%d %H:%M:%S', '%y/%m/%d %H:%M',
+    '%m/%d/%y %I:%M:%S %p', '%m/%d/%Y %I:%M:%S %p', '%m/%d/%y %I:%M %p', '%m/%d/%Y %I:%M %p',
+    '%m/%d/%y %H:%M:%S', '%m/%d/%Y %H:%M:%S', '%m/%d/%y %H:%M', '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+    '%Y-%m-%d',
+]
+
+# Values checked per candidate format, spread over the whole column
+SAMPLE_SIZE = 200
+
+# Key for tidy / compiled / formatted files written by the app
+TIDY_KEY = "tidy"
+
+_formats = {}  # key -> explicit format
+_lock = threading.Lock()
+
+
+def pattern_key(file_name, column=None):
+    """
+    Format cache key for a logger file: the file name with long digit runs
+    (serials, dates) masked, plus the timestamp column name, e.g.
+    01FW002_raw_21731701_20250704.csv -> "01FW002_raw_#_#|Date-Time (GMT-07:00)".
+    """
+    base = os.path.splitext(os.path.basename(str(file_name)))[0]
+    key = re.sub(r"\d{5,}", "#", base)
+    return f"{key}|{column}" if column is not None else key
+
+
+def known_format(key):
+    with _lock:
+        return _formats.get(key)
+
+
+def remember(key, fmt):
+    with _lock:
+        _formats[key] = fmt
+
+
+def _sample(series):
+    values = series.dropna()
+    if len(values) > SAMPLE_SIZE:
+        values = values.iloc[np.unique(np.linspace(0, len(values) - 1, SAMPLE_SIZE).astype(int))]
+    return values[values.astype(str).str.strip() != ""]
+
+
+def sniff_format(values):
+    """First of FORMATS that parses every sampled value, or None."""
+    sample = _sample(pd.Series(values))
+    if sample.empty:
+        return None
+    for fmt in FORMATS:
+        try:
+            pd.to_datetime(sample, format=fmt, errors='raise')
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def _parse_with(series, fmt):
+    """series parsed with fmt, or None if any non-empty value doesn't fit."""
+    parsed = pd.to_datetime(series, format=fmt, errors='coerce')
+    failed = parsed.isna() & series.notna()
+    if failed.any() and (series[failed].astype(str).str.strip() != "").any():
+        return None
+    return parsed
+
+
+def parse(values, key=None, errors='coerce'):
+    """
+    Parse a timestamp column (Series or array-like) to datetime64.
+
+    Uses the format remembered for `key`, else sniffs one (and remembers it);
+    values that don't parse with any single format fall back to per-value
+    yearfirst inference with `errors` ('coerce' -> NaT, 'raise'). Columns that are
+    already datetime are returned as they are.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    fmt = known_format(key) if key is not None else None
+    if fmt is not None:
+        parsed = _parse_with(series, fmt)
+        if parsed is not None:
+            return parsed
+
+    fmt = sniff_format(series)
+    if fmt is not None:
+        parsed = _parse_with(series, fmt)
+        if parsed is not None:
+            if key is not None:
+                remember(key, fmt)
+            return parsed
+
+    # No single explicit format: element-wise inference, YY-MM-DD read year first
+    return pd.to_datetime(series, format='mixed', yearfirst=True, dayfirst=False, errors=errors)
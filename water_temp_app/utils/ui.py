@@ -0,0 +1,85 @@
+import time
+
+import streamlit as st
+
+from utils import downsample, report_engine, jobs
+
+# Seconds between status checks of a running background job
+POLL_SECONDS = 2
+
+
+def show_notes(notes):
+    """Surface (level, message) notes from the Streamlit-free engines in the page."""
+    for level, message in notes:
+        getattr(st, level, st.info)(message)
+
+
+def time_window(df, key):
+    """
+    Slider to pick the plotted time window. Returns df limited to it; plots
+    re-sample from the full data, so narrowing the window shows more detail.
+    """
+    if df is None or df.empty or 'timestamp' not in df.columns:
+        return df
+    ts_min = df['timestamp'].min().to_pydatetime()
+    ts_max = df['timestamp'].max().to_pydatetime()
+    if ts_min == ts_max:
+        return df
+    start, end = st.slider("Plot window", min_value=ts_min, max_value=ts_max,
+                           value=(ts_min, ts_max), format="YYYY-MM-DD HH:mm", key=key)
+    window = df[(df['timestamp'] >= start) & (df['timestamp'] <= end)]
+    if len(window) > downsample.DEFAULT_MAX_POINTS:
+        st.caption(f"{len(window)} points in this window: the line is downsampled (flagged points are all shown). "
+                   "Narrow the window for full resolution.")
+    return window
+
+
+def render_mode(key):
+    """Radio to choose WebGL (fast, single marker trace) or SVG plot rendering."""
+    return st.radio("Render mode", report_engine.RENDER_MODES, horizontal=True, key=key,
+                    help="WebGL draws large records much faster; SVG gives one legend-toggleable trace per flag.")
+
+
+def show_job(status):
+    """Status line for a background job (utils/jobs.py)."""
+    if status is None:
+        st.warning("Background job not found (its files may have been removed).")
+        return
+    what = f"{status['kind'].upper()} job for {status['label']}"
+    if status['state'] == "queued":
+        st.info(f"{what} is queued (submitted {status['submitted']}).")
+    elif status['state'] == "running":
+        progress = f" — {status['progress']}" if status.get('progress') else ""
+        st.info(f"{what} is running since {status['started']}{progress}. "
+                "You can leave this page; the job keeps running.")
+    elif status['state'] == "failed":
+        st.error(f"{what} failed: {status['error']}")
+    elif status['state'] == "interrupted":
+        st.warning(f"{what} was interrupted (the app was restarted). Please run it again.")
+
+
+def poll_job(status):
+    """Rerun the page after POLL_SECONDS while the job is queued or running (call last)."""
+    if jobs.is_active(status):
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+
+
+def pick_job(project_dir, kind, key):
+    """
+    Lists the project's recent `kind` jobs so a new or refreshed session can
+    pick up a result. Returns the status of the finished job whose result
+    should be loaded, or None.
+    """
+    recent = jobs.list_jobs(project_dir, kind=kind)
+    running = [s for s in recent if jobs.is_active(s)]
+    done = [s for s in recent if s['state'] == "done"]
+    for s in running:
+        st.caption(f"Running in the background: {s['label']} (submitted {s['submitted']})")
+    if not done:
+        return None
+    labels = {f"{s['label']} — finished {s['finished']}": s for s in done}
+    choice = st.selectbox("Finished background jobs", list(labels), key=f"{key}_choice")
+    if st.button("Load job result", key=f"{key}_load"):
+        return labels[choice]
+    return None
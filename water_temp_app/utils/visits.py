@@ -0,0 +1,140 @@
+"""
+visits.py
+---------
+Field visit windows for the V flag.
+
+The Flag page takes one current and one previous visit. Re-processing a
+whole station history needs every field visit, so this module loads a
+visits table (CSV or Excel export of the metabase Visits table) and flags
+rows that fall in any of its windows.
+
+A table needs Datetime In / Datetime Out columns (see IN_COLUMNS and
+OUT_COLUMNS). If they only hold times (14:46) a Date column supplies the
+day. A Station Code column is optional: with it the table can hold all
+stations and is filtered per record. Column names are matched without case,
+spaces or punctuation.
+
+load_visits(path) -> DataFrame with station_code, visit_in, visit_out
+visit_mask(timestamps, ins, outs) -> rows in any (in, out] window
+
+visit_mask sorts the k windows once and finds the last window starting
+before each timestamp with np.searchsorted, so n rows take O(n log k)
+instead of one full scan per window.
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import timestamps
+
+# Accepted column names (normalized: lowercase, runs of other characters -> "_")
+STATION_COLUMNS = ['station_code', 'station', 'site_code', 'site']
+IN_COLUMNS = ['datetime_in', 'visit_in', 'date_time_in', 'time_in', 'start_time', 'start']
+OUT_COLUMNS = ['datetime_out', 'visit_out', 'date_time_out', 'time_out', 'end_time', 'end']
+DATE_COLUMNS = ['visit_date', 'date']
+
+TIME_ONLY = re.compile(r"^\d{1,2}:\d{2}(:\d{2})?$")
+
+EXCEL_EXTENSIONS = (".xlsx", ".xls")
+
+# timestamps.parse key: visits tables keep their format from one upload to
+# the next, but it needn't be the tidy files' format
+FORMAT_KEY = "visits"
+
+
+def _normalize(name):
+    return re.sub(r"[^a-z0-9]+", "_", str(name).lower()).strip("_")
+
+
+def _find_column(columns, candidates):
+    by_name = {_normalize(c): c for c in columns}
+    for candidate in candidates:
+        if candidate in by_name:
+            return by_name[candidate]
+    return None
+
+
+def read_table(source):
+    """Visits table as strings, from a path or an uploaded file (.csv or .xlsx)."""
+    name = getattr(source, 'name', source)
+    if str(name).lower().endswith(EXCEL_EXTENSIONS):
+        return pd.read_excel(source, dtype=str)
+    return pd.read_csv(source, dtype=str, skipinitialspace=True)
+
+
+def _parse_times(values, dates=None):
+    text = values.astype(str).str.strip()
+    if dates is None:
+        return timestamps.parse(text, key=FORMAT_KEY)
+    # Time-only cells (14:46) take the day from the Date column; they are
+    # parsed apart from the full datetimes, which may use another format
+    time_only = text.str.match(TIME_ONLY).fillna(False).astype(bool)
+    parsed = timestamps.parse(text.where(~time_only), key=FORMAT_KEY)
+    if time_only.any():
+        day = timestamps.parse(dates, key=FORMAT_KEY + "_date").dt.strftime("%Y-%m-%d")
+        parsed[time_only] = timestamps.parse((day + " " + text)[time_only])
+    return parsed
+
+
+def load_visits(source, station=None, utc_hours=0.0):
+    """
+    Field visits from a CSV/Excel table, sorted by visit_in. Rows whose times
+    don't parse are dropped. utc_hours is added to both times (e.g. 7 for
+    visit sheets in local -7 GMT); with `station` only its visits are kept.
+    """
+    table = read_table(source)
+    in_col = _find_column(table.columns, IN_COLUMNS)
+    out_col = _find_column(table.columns, OUT_COLUMNS)
+    if in_col is None or out_col is None:
+        raise ValueError(f"Visits table needs Datetime In and Datetime Out columns, found: {list(table.columns)}")
+    station_col = _find_column(table.columns, STATION_COLUMNS)
+    date_col = _find_column(table.columns, DATE_COLUMNS)
+    dates = table[date_col] if date_col is not None else None
+
+    visits = pd.DataFrame({
+        'station_code': table[station_col].str.strip() if station_col is not None else None,
+        'visit_in': _parse_times(table[in_col], dates) + pd.Timedelta(hours=utc_hours),
+        'visit_out': _parse_times(table[out_col], dates) + pd.Timedelta(hours=utc_hours),
+    })
+    visits = visits.dropna(subset=['visit_in', 'visit_out'])
+    if station is not None:
+        visits = for_station(visits, station)
+    return visits.sort_values('visit_in', kind='stable').reset_index(drop=True)
+
+
+def for_station(visits, station):
+    """Visits of one station (all of them if the table has no station column)."""
+    if visits['station_code'].isna().all():
+        return visits
+    return visits[visits['station_code'] == str(station).strip()]
+
+
+def source_name(source):
+    """File name of a table path or uploaded file, for messages."""
+    return os.path.basename(str(getattr(source, 'name', source)))
+
+
+def visit_mask(timestamps, visit_in, visit_out):
+    """
+    Boolean array: timestamps inside any (in, out] window. Windows may
+    overlap and come in any order; NaT timestamps and windows never match.
+    """
+    ts = np.asarray(timestamps, dtype='datetime64[ns]')
+    starts = np.asarray(visit_in, dtype='datetime64[ns]')
+    ends = np.asarray(visit_out, dtype='datetime64[ns]')
+    keep = ~np.isnat(starts) & ~np.isnat(ends)
+    order = np.argsort(starts[keep], kind='stable')
+    starts = starts[keep][order].view(np.int64)
+    # Furthest end of the windows starting up to each one: a timestamp is in
+    # some window iff it is <= the reach of the last window starting before it
+    reach = np.maximum.accumulate(ends[keep][order].view(np.int64))
+
+    mask = ~np.isnat(ts)
+    values = ts.view(np.int64)
+    last = np.searchsorted(starts, values, side='left') - 1
+    mask &= last >= 0
+    mask[mask] = values[mask] <= reach[last[mask]]
+    return mask